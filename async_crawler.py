@@ -0,0 +1,343 @@
+import os
+import re
+import time
+import timeit
+import asyncio
+import logging
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urljoin, urlsplit
+
+import lxml.html
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+import catalog
+import metrics
+import watermark
+from parallel import RunStats, PROCESSED, SKIPPED, FAILED
+
+
+# 在同一個進程中用 asyncio 爬 PTT (取代 tmux + scrapy 的 dynamic_crawl)
+#
+# 1. 每個板從 watermark (見 watermark.py) 取得本地最新文章的時間
+# 2. 從 /bbs/<板>/index.html 往前翻，收集比它新 (或同一秒發) 的文章，直到翻到舊文章為止
+#    (index.html 底下置底的公告不算)
+# 3. 所有板的文章共用一個 aiohttp 連線池下載，每個 host 有同時連線數和每秒請求數的上限；
+#    暫時性的錯誤 (連線失敗、429、5xx) 會退避重試
+# 4. 存成和爬蟲相同的結構 <data_dir>/<board>/<year>/<YYYYMMDD_HHMM>_<post_id>.html
+#    (先寫暫存檔再改名)，並更新 catalog
+#
+# watermark 只有在比它舊的新文章都已經落地 (或確定已被刪除) 之後才推進，
+# 所以中途中斷或有文章下載失敗時，下次執行會從失敗的那篇之後重新開始，已經存在的檔案會略過。
+#
+# 測試時可以用 benchmarks/ptt_stub_server.py 在本機架一個假的 PTT，再用 --base-url 指向它。
+
+DEFAULT_BASE_URL = "https://www.ptt.cc"
+
+# 每個 host 同時最多幾個請求
+DEFAULT_CONCURRENCY = 8
+
+# 每個 host 每秒最多幾個請求 (0 表示不限制)
+DEFAULT_RATE = 5.0
+
+# 暫時性錯誤最多重試幾次，第 n 次重試前等 RETRY_BACKOFF * 2 ** (n - 1) 秒
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# 每個請求的逾時 (秒)
+DEFAULT_TIMEOUT = 30
+
+USER_AGENT = "ptt_helper"
+
+# e.g. "/bbs/Gossiping/M.1123525242.A.EE4.html"
+POST_HREF_RE = re.compile(r"/bbs/[^/]+/(M\.(\d{10})\.A\.[0-9A-Za-z]{3})\.html$")
+
+
+class CrawlError(Exception):
+    pass
+
+
+def post_path(data_dir, board, post_id, timestamp):
+    """
+    和爬蟲相同的存檔路徑: <data_dir>/<board>/<year>/<YYYYMMDD_HHMM>_<post_id>.html
+    """
+    dt = datetime.fromtimestamp(timestamp)
+    return Path(data_dir) / board / str(dt.year) / f"{dt.strftime('%Y%m%d_%H%M')}_{post_id}.html"
+
+
+def parse_index_page(content, url):
+    """
+    剖析看板的列表頁
+
+    輸出: (list of (timestamp, post_id), 上一頁的網址 或 None)
+    已刪除的文章 (沒有連結) 和置底的公告 (r-list-sep 之後) 不會出現在結果中
+    """
+    root = lxml.html.document_fromstring(content)
+
+    posts = []
+    for el in root.xpath('//div[contains(@class, "r-ent") or contains(@class, "r-list-sep")]'):
+        if "r-list-sep" in el.get("class", ""):
+            break
+        for href in el.xpath('.//div[contains(@class, "title")]/a/@href'):
+            m = POST_HREF_RE.search(href)
+            if m is not None:
+                posts.append((int(m.group(2)), m.group(1)))
+
+    prev_url = None
+    for a in root.xpath('//a[contains(@class, "wide") and @href]'):
+        if "上頁" in a.text_content():
+            prev_url = urljoin(url, a.get("href"))
+            break
+
+    return posts, prev_url
+
+
+class HostLimiter(object):
+    """
+    一個 host 的限制: 同時最多 concurrency 個請求，每兩個請求的開始時間至少間隔 1 / rate 秒
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            # 先預約一個開始時間再睡，單執行緒的 event loop 中這段不會被打斷
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+class _Frontier(object):
+    """
+    一個板的新文章 (依時間排序)。
+    只有在某篇之前的文章都處理完 (成功或確定已被刪除) 時，才把 watermark 推進到那篇。
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.done = [False] * len(paths)
+        self.next = 0
+
+    def finish(self, i, ok):
+        self.done[i] = ok
+        while self.next < len(self.paths) and self.done[self.next]:
+            path = self.paths[self.next]
+            if path.is_file():
+                watermark.observe(path)
+            self.next += 1
+
+
+class Crawler(object):
+    """
+    data_dir: 存檔的資料夾 (和 html2json 等指令的 -d 相同)
+    base_url: PTT 的網址，測試時可以指向本機的假伺服器
+    concurrency / rate: 每個 host 同時最多幾個請求 / 每秒最多幾個請求
+    max_index_pages: 每個板最多往前翻幾頁 (None 表示不限制)
+    """
+
+    def __init__(self, data_dir, base_url=DEFAULT_BASE_URL, concurrency=DEFAULT_CONCURRENCY,
+                 rate=DEFAULT_RATE, retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT, max_index_pages=None):
+        self.data_dir = Path(data_dir)
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.timeout = timeout
+        self.max_index_pages = max_index_pages
+
+        self.limiters = {}
+        self.stats = None
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = HostLimiter(self.concurrency, self.rate)
+        return self.limiters[host]
+
+    async def fetch(self, session, url):
+        """
+        輸出: 網頁內容 (bytes)；404 (文章已被刪除) 回傳 None
+        暫時性的錯誤重試 self.retries 次後仍然失敗的話丟出 CrawlError
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+            try:
+                async with self._limiter(url):
+                    async with session.get(url) as resp:
+                        if resp.status == 200:
+                            content = await resp.read()
+                            metrics.inc("bytes", len(content))
+                            return content
+                        if resp.status == 404:
+                            return None
+                        if resp.status != 429 and resp.status < 500:
+                            raise CrawlError(f"{url}: HTTP {resp.status}")
+                        error = f"HTTP {resp.status}"
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+
+            metrics.inc("retries")
+            logging.warning("-- %s 失敗 (%s)，第 %d 次", url, error, attempt + 1)
+
+        raise CrawlError(f"{url}: {error}")
+
+    async def list_new_posts(self, session, board, since):
+        """
+        從 index.html 往前翻，直到出現比 since 舊的文章
+        since: (timestamp, post_id)，本地最新的文章
+        和它同一秒發的其他文章也算新文章 (已經下載過的話 fetch_post() 會略過)
+        輸出: list of (timestamp, post_id)，依時間排序
+        """
+        since_timestamp, since_post_id = since
+        url = f"{self.base_url}/bbs/{board}/index.html"
+        new_posts = {}
+        n_pages = 0
+
+        while url is not None:
+            content = await self.fetch(session, url)
+            if content is None:
+                raise CrawlError(f"找不到看板: {url}")
+            n_pages += 1
+            metrics.inc("index_pages")
+
+            posts, url = parse_index_page(content, url)
+            for timestamp, post_id in posts:
+                if timestamp > since_timestamp or (timestamp == since_timestamp and post_id != since_post_id):
+                    new_posts[post_id] = timestamp
+
+            if any(timestamp < since_timestamp for timestamp, _ in posts):
+                break
+            if self.max_index_pages is not None and n_pages >= self.max_index_pages:
+                logging.warning("-- %s 版已翻了 %d 頁，停止往前翻", board, n_pages)
+                break
+
+        logging.info("%s 版: 翻了 %d 頁，%d 篇新文章", board, n_pages, len(new_posts))
+        return sorted((timestamp, post_id) for post_id, timestamp in new_posts.items())
+
+    async def fetch_post(self, session, board, post_id, path):
+        """
+        輸出: (狀態, 寫入的 bytes)
+        """
+        if path.is_file():
+            logging.info("-- 已存在: %s", path)
+            return SKIPPED, 0
+
+        url = f"{self.base_url}/bbs/{board}/{post_id}.html"
+        content = await self.fetch(session, url)
+        if content is None:
+            logging.warning("-- 文章已被刪除: %s", url)
+            return SKIPPED, 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        catalog.record(path)
+        return PROCESSED, len(content)
+
+    async def crawl_board(self, session, board, since):
+        try:
+            new_posts = await self.list_new_posts(session, board, since)
+        except CrawlError as e:
+            print(f"{board} 版列表頁出問題: {e}")
+            logging.error("-- %s 版列表頁出問題: %s", board, e)
+            self.stats.add([(board, [FAILED], 0)])
+            return
+
+        self.stats.total = (self.stats.total or 0) + len(new_posts)
+
+        paths = [post_path(self.data_dir, board, post_id, timestamp) for timestamp, post_id in new_posts]
+        frontier = _Frontier(paths)
+
+        async def run_one(i, post_id, path):
+            t1 = timeit.default_timer()
+            try:
+                status, nbytes = await self.fetch_post(session, board, post_id, path)
+            except Exception as e:
+                print(f"出問題文章: {board}/{post_id}")
+                print(f"錯誤訊息: {e}")
+                logging.error("-- 下載 %s/%s 出問題: %s", board, post_id, e)
+                status, nbytes = FAILED, 0
+            t2 = timeit.default_timer()
+
+            metrics.current.observe_file(path, t2 - t1)
+            metrics.inc("files")
+
+            self.stats.add([(path, [status], nbytes)])
+            self.stats.print_progress()
+            frontier.finish(i, status != FAILED)
+
+        await asyncio.gather(*(
+            run_one(i, post_id, path)
+            for i, ((_, post_id), path) in enumerate(zip(new_posts, paths))
+        ))
+
+    async def _crawl(self, since_by_board):
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.concurrency)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": USER_AGENT},
+            # 部分看板要先確認已滿 18 歲
+            cookies={"over18": "1"},
+        ) as session:
+            await asyncio.gather(*(
+                self.crawl_board(session, board, since)
+                for board, since in sorted(since_by_board.items())
+            ))
+
+    def crawl(self, since_by_board):
+        """
+        since_by_board: dict {board: (timestamp, post_id)}，只下載比這篇新 (或同一秒發) 的文章
+        回傳: RunStats
+        """
+        if aiohttp is None:
+            raise RuntimeError("要使用 dynamic_crawl 請先安裝 aiohttp")
+
+        self.stats = RunStats(desc="dynamic_crawl")
+        asyncio.run(self._crawl(since_by_board))
+        self.stats.finish()
+        return self.stats
+
+
+def crawl(data_dir, board_name=None, rescan=False, **options):
+    """
+    從各板的 watermark 開始爬新文章 (board_name: 只爬一個板)
+    options: 傳給 Crawler
+    回傳: RunStats
+    """
+    if board_name is None:
+        latest_posts = watermark.get_all_latest_posts(data_dir, rescan=rescan)
+    else:
+        latest_posts = {board_name: watermark.get_latest_post(data_dir, board_name, rescan=rescan)}
+
+    since_by_board = {}
+    for board, (latest_timestamp, latest_post_id) in latest_posts.items():
+        logging.info(f"{board} 版: {datetime.fromtimestamp(latest_timestamp)}")
+        since_by_board[board] = (latest_timestamp, latest_post_id)
+
+    return Crawler(data_dir, **options).crawl(since_by_board)
@@ -0,0 +1,131 @@
+import sys
+import time
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from ckiptagger_batch import BucketedTagger, DEFAULT_BATCH_SENTENCES, DEFAULT_BATCH_CHARACTERS
+from html2json import html2json
+from prefilter import preprocess_content
+from seg_batch import SegBatcher, post_sentence_fields
+
+from synth import generate_corpus
+
+
+# 比較 html2vrt_new.py 原本逐篇、逐欄位呼叫 ws() / pos() 和 BucketedTagger (依長度分批) 的速度
+#
+# 有 -c (ckiptagger 的模型資料夾) 時用真的 WS / POS；
+# 沒有的話用 StubModel 代替: 每次呼叫有固定的開銷，另外做一次大小為 (句數 × 最長一句的字數 × HIDDEN) 的矩陣運算，
+# 模擬神經網路模型的計算量和 padding 的長度成正比。
+# 兩種方式的輸出必須相同。
+#
+# $ python3 benchmarks/bench_ckiptagger_batch.py (-c <ckiptagger模型資料夾>) (--posts-per-year 50)
+
+HIDDEN = 64
+
+# StubModel 每次呼叫的固定開銷 (秒)
+CALL_OVERHEAD = 0.002
+
+
+class StubModel(object):
+    """
+    同時代替 WS 和 POS: ws(sentences) 每兩個字切成一個詞，pos(words) 詞性都是 Na
+    """
+
+    def __init__(self):
+        self.weights = np.random.RandomState(0).rand(HIDDEN, HIDDEN).astype(np.float32)
+
+    def _compute(self, n_sentences, max_len):
+        time.sleep(CALL_OVERHEAD)
+        padded = np.ones((n_sentences * max(max_len, 1), HIDDEN), dtype=np.float32)
+        padded @ self.weights
+
+    def ws(self, sentences, sentence_segmentation=True):
+        self._compute(len(sentences), max((len(s) for s in sentences), default=0))
+        return [[s[i:i + 2] for i in range(0, len(s), 2)] for s in sentences]
+
+    def pos(self, word_sentence_list):
+        self._compute(len(word_sentence_list), max((len(w) for w in word_sentence_list), default=0))
+        return [["Na"] * len(words) for words in word_sentence_list]
+
+
+def per_field(ws, pos, posts_fields):
+    """
+    原本的做法 (html2vrt_new._seg_and_pos): 每個欄位呼叫一次
+    """
+    results = []
+    for fields in posts_fields:
+        tagged_fields = []
+        for field in fields:
+            word_sentence_list = ws(field, sentence_segmentation=True)
+            pos_sentence_list = pos(word_sentence_list)
+            tagged_fields.append([list(zip(words, tags)) for words, tags in zip(word_sentence_list, pos_sentence_list)])
+        results.append(tagged_fields)
+    return results
+
+
+def bucketed(tagger, posts_fields, posts_per_batch):
+    seg_batcher = SegBatcher(tagger, batch_size=sys.maxsize)
+    results = []
+    for i in range(0, len(posts_fields), posts_per_batch):
+        results.extend(seg_batcher.segment_many(posts_fields[i:i + posts_per_batch]))
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--ckip-path", help="ckiptagger 的模型資料夾 (不指定則用 StubModel)")
+    parser.add_argument("-d", "--data-dir", help="要測試的 .html (不指定則用 synth.py 產生)")
+    parser.add_argument("--posts-per-year", help="沒有 -d 時，每個板每年產生幾篇", type=int, default=30)
+    parser.add_argument("--posts-per-batch", help="每幾篇文章的句子合併起來分批", type=int, default=64)
+    parser.add_argument("--batch-size", help="每個 batch 最多幾句 (以逗號分隔可測試多個值)",
+                        default=f"64,{DEFAULT_BATCH_SENTENCES},1024")
+    parser.add_argument("--batch-chars", help="每個 batch 補齊後最多幾個字", type=int, default=DEFAULT_BATCH_CHARACTERS)
+    args = parser.parse_args()
+
+    if args.ckip_path:
+        from ckiptagger import WS, POS
+        ws = WS(args.ckip_path, disable_cuda=True)
+        pos = POS(args.ckip_path, disable_cuda=True)
+    else:
+        model = StubModel()
+        ws, pos = model.ws, model.pos
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = Path(tmp) / "html"
+            generate_corpus(data_dir, posts_per_year=args.posts_per_year)
+
+        posts = [html2json(path) for path in sorted(Path(data_dir).rglob("*.html"))]
+        posts_fields = [post_sentence_fields(post, preprocess_content) for post in posts if post is not None]
+
+    n_sentences = sum(len(field) for fields in posts_fields for field in fields)
+    n_characters = sum(len(s) for fields in posts_fields for field in fields for s in field)
+    print(f"文章數: {len(posts_fields)}, {n_sentences} 句, {n_characters} 字 "
+          f"({'ckiptagger' if args.ckip_path else 'StubModel'})")
+
+    t1 = timeit.default_timer()
+    expected = per_field(ws, pos, posts_fields)
+    t2 = timeit.default_timer()
+    baseline = t2 - t1
+    n_calls = sum(len(fields) for fields in posts_fields)
+    print(f"- 逐欄位: {baseline:.2f} 秒, {n_sentences / baseline:.1f} 句/秒, 呼叫 ws/pos {n_calls} 次")
+
+    for batch_size in (int(x) for x in args.batch_size.split(",")):
+        tagger = BucketedTagger(ws, pos, batch_sentences=batch_size, batch_characters=args.batch_chars)
+
+        t1 = timeit.default_timer()
+        result = bucketed(tagger, posts_fields, args.posts_per_batch)
+        t2 = timeit.default_timer()
+
+        seconds = t2 - t1
+        same = "" if result == expected else " !! 輸出和逐欄位不同"
+        print(f"- 分批 (--batch-size {batch_size}): {seconds:.2f} 秒, {n_sentences / seconds:.1f} 句/秒, "
+              f"{baseline / seconds:.1f}x; {tagger.report()}{same}")
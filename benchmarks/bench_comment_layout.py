@@ -0,0 +1,100 @@
+import sys
+import json
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import post_model
+from html2json import html2json
+
+from synth import generate_corpus
+
+
+# 比較 .json 兩種推文排列方式 (post_model.JSON_LAYOUTS: records / columns) 的檔案大小和讀取時間
+#
+# 用 -d 指定真的板 (<data_dir>/<board>/<year>/*.json)；沒有的話用 synth.py 產生 .html 再 html2json。
+# 分成全部文章和推文數 >= --busy 的文章各列一次:
+# - 大小: 兩種格式各自的總 bytes
+# - json.loads: 只剖析成 dict / list
+# - post_model.decode: 剖析並建出 Post / Comment (json2vrt / json2tei 讀檔的方式)
+# 兩種格式讀入的 Post 必須相同。
+#
+# $ python3 benchmarks/bench_comment_layout.py (-d <data_directory>) (-b <board_name>) (--busy 100)
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        func()
+        t2 = timeit.default_timer()
+        best = t2 - t1 if best is None else min(best, t2 - t1)
+    return best
+
+
+def load_posts(data_dir, board_name=None):
+    if board_name is not None:
+        data_dir = Path(data_dir) / board_name
+    posts = []
+    for path in sorted(Path(data_dir).rglob("*.json")):
+        with open(path, "rb") as f:
+            posts.append(post_model.load(f))
+    return posts
+
+
+def synth_posts(posts_per_year, mean_pushes, max_pushes):
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_corpus(Path(tmp) / "html", posts_per_year=posts_per_year,
+                                mean_pushes=mean_pushes, max_pushes=max_pushes)
+        posts = [html2json(path, engine="lxml") for path in paths]
+    return [post for post in posts if post is not None]
+
+
+def report(label, posts, repeat):
+    n_comments = sum(len(post.comments) for post in posts)
+    print(f"{label}: {len(posts)} 篇, 推文 {n_comments} 則")
+    if len(posts) == 0:
+        return
+
+    results = {}
+    for layout in post_model.JSON_LAYOUTS:
+        data = [post_model.encode(post, layout=layout) for post in posts]
+        if [post_model.decode(d) for d in data] != posts:
+            print(f"!! {layout} 讀入的結果不同")
+
+        size = sum(map(len, data))
+        loads = best_of(lambda: [json.loads(d) for d in data], repeat)
+        decode = best_of(lambda: [post_model.decode(d) for d in data], repeat)
+        results[layout] = (size, loads, decode)
+
+    base_size, base_loads, base_decode = results["records"]
+    for layout, (size, loads, decode) in results.items():
+        print(f"- {layout:8s} 大小 {size / 1e6:7.2f} MB ({size / base_size:.0%}), "
+              f"json.loads {loads:.3f} 秒 ({base_loads / loads:.1f}x), "
+              f"post_model.decode {decode:.3f} 秒 ({base_decode / decode:.1f}x, {len(posts) / decode:.0f} 篇/秒)")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", help="要測試的 .json 所在資料夾 (不指定則用 synth.py 產生)")
+    parser.add_argument("-b", "--board", help="板名")
+    parser.add_argument("--posts-per-year", help="沒有 -d 時，每個板每年產生幾篇", type=int, default=100)
+    parser.add_argument("--mean-pushes", help="沒有 -d 時，每篇平均幾則推文", type=int, default=60)
+    parser.add_argument("--max-pushes", help="沒有 -d 時，每篇最多幾則推文", type=int, default=3000)
+    parser.add_argument("--busy", help="推文數至少多少的文章另外統計", type=int, default=100)
+    parser.add_argument("-r", "--repeat", help="跑幾輪 (取最快的一輪)", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.data_dir is not None:
+        posts = load_posts(args.data_dir, args.board)
+    else:
+        posts = synth_posts(args.posts_per_year, args.mean_pushes, args.max_pushes)
+
+    backend = "msgspec" if post_model.msgspec is not None else "orjson" if post_model.orjson is not None else "json"
+    print(f"post_model 使用 {backend}")
+    report("全部文章", posts, args.repeat)
+    report(f"推文 >= {args.busy} 則的文章", [post for post in posts if len(post.comments) >= args.busy], args.repeat)
@@ -0,0 +1,59 @@
+import sys
+import argparse
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from html2json import html2json, ENGINES
+
+
+# 比較 html2json 各個剖析器的速度，並確認輸出相同
+#
+# $ python3 benchmarks/bench_html2json.py -d <html檔所在資料夾> (-n <最多幾個檔>)
+
+
+def bench_engine(engine, html_paths, repeat=3):
+    """
+    回傳: (最快一輪的秒數, 每個檔案的 post dict list)
+    """
+    results = None
+    best = None
+
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        results = [html2json(p, engine=engine) for p in html_paths]
+        t2 = timeit.default_timer()
+
+        if best is None or t2 - t1 < best:
+            best = t2 - t1
+
+    return best, results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", help=".html檔所在資料夾", required=True)
+    parser.add_argument("-n", "--max-files", help="最多測試幾個檔案", type=int, default=1000)
+    parser.add_argument("-r", "--repeat", help="每個剖析器跑幾輪 (取最快的一輪)", type=int, default=3)
+    args = parser.parse_args()
+
+    html_paths = sorted(Path(args.data_dir).rglob("*.html"))[:args.max_files]
+    total_bytes = sum(p.stat().st_size for p in html_paths)
+
+    print(f"檔案數: {len(html_paths)} ({total_bytes / 1e6:.1f} MB)")
+
+    baseline = None
+    for engine in ENGINES:
+        seconds, results = bench_engine(engine, html_paths, repeat=args.repeat)
+
+        print(f"- {engine}: {seconds:.3f} 秒, {len(html_paths) / seconds:.1f} 檔/秒, {total_bytes / 1e6 / seconds:.1f} MB/秒")
+
+        if baseline is None:
+            baseline = results
+            continue
+
+        diff = [p for p, a, b in zip(html_paths, baseline, results) if a != b]
+        if diff:
+            print(f"  !! 有 {len(diff)} 個檔案的輸出和 pyquery 不同，例如: {diff[0]}")
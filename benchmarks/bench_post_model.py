@@ -0,0 +1,132 @@
+import sys
+import json
+import random
+import argparse
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 模擬沒有安裝 msgspec 的環境 (Post / Comment 改用 __slots__ 類別)
+if "--no-msgspec" in sys.argv:
+    sys.modules["msgspec"] = None
+
+import post_model
+from post_model import Post, Comment
+
+
+# 比較原本的 post dict + json 和 post_model (Post / Comment) 在推文很多的文章上的
+# 序列化、剖析時間，以及讀入後一篇文章佔用的記憶體
+#
+# post_model 依序使用 msgspec、orjson、json 中有安裝的第一個，這裡每一種都測一次
+# (--no-msgspec: Post / Comment 使用沒有 msgspec 時的 __slots__ 類別)
+#
+# $ python3 benchmarks/bench_post_model.py (--comments 20000) (--posts 5) (--no-msgspec)
+
+AUTHORS = [f"user{i:04d}" for i in range(500)]
+WORDS = "我 今天 去 吃飯 好 喜歡 寫 程式 八卦 問卦 推 噓 樓上 正解 真的 假的 笑死 XD 哈哈".split()
+
+
+def make_post(n_comments, rng):
+    return Post(
+        post_board="Gossiping",
+        post_id="M.1123525242.A.EE4",
+        post_time=1123525242,
+        post_title="[問卦] 測試",
+        post_author="someone",
+        post_body="\n".join(" ".join(rng.choice(WORDS) for _ in range(20)) for _ in range(50)),
+        post_vote={"pos": n_comments, "neg": 0, "neu": 0},
+        comments=[
+            Comment(rng.choice(post_model.COMMENT_TYPES), rng.choice(AUTHORS),
+                    " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))))
+            for _ in range(n_comments)
+        ],
+    )
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        func()
+        t2 = timeit.default_timer()
+        best = t2 - t1 if best is None else min(best, t2 - t1)
+    return best
+
+
+def retained_memory(func):
+    """
+    func() 的回傳值佔用的記憶體 (bytes)
+    """
+    tracemalloc.start()
+    result = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def legacy_dumps(d):
+    return json.dumps(d, ensure_ascii=False).encode("utf-8")
+
+
+def legacy_loads(data):
+    return json.loads(data)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--comments", help="每篇文章幾則推文", type=int, default=20000)
+    parser.add_argument("-n", "--posts", help="測試幾篇文章", type=int, default=5)
+    parser.add_argument("-r", "--repeat", help="跑幾輪 (取最快的一輪)", type=int, default=3)
+    parser.add_argument("--no-msgspec", help="不使用 msgspec", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    posts = [make_post(args.comments, rng) for _ in range(args.posts)]
+    dicts = [post.to_dict() for post in posts]
+
+    legacy_data = [legacy_dumps(d) for d in dicts]
+    new_data = [post_model.encode(post) for post in posts]
+
+    if [post_model.decode(data) for data in legacy_data] != posts:
+        print("!! 讀入原本格式的 .json 結果不同")
+    if [post_model.decode(data) for data in new_data] != posts:
+        print("!! encode / decode 的結果不同")
+
+    n_comments = args.comments * args.posts
+    impl = "msgspec.Struct" if post_model.msgspec is not None else "__slots__"
+    print(f"Post / Comment: {impl}")
+    print(f"文章數: {args.posts}, 推文 {n_comments} 則, "
+          f".json 大小: 原本 {sum(map(len, legacy_data)) / 1e6:.2f} MB, post_model {sum(map(len, new_data)) / 1e6:.2f} MB")
+
+    legacy_dump = best_of(lambda: [legacy_dumps(d) for d in dicts], args.repeat)
+    legacy_load = best_of(lambda: [legacy_loads(data) for data in legacy_data], args.repeat)
+    print(f"- dict + json: 序列化 {legacy_dump:.3f} 秒, 剖析 {legacy_load:.3f} 秒 ({n_comments / legacy_load / 1e3:.0f} K 則推文/秒)")
+
+    # (名稱, _decoder, _encoder, orjson)
+    codecs = [("json", None, None, None)]
+    if post_model.orjson is not None:
+        codecs.insert(0, ("orjson", None, None, post_model.orjson))
+    if post_model.msgspec is not None:
+        codecs.insert(0, ("msgspec", post_model._decoder, post_model._encoder, None))
+
+    saved = (post_model._decoder, post_model._encoder, post_model.orjson)
+    for name, *codec in codecs:
+        post_model._decoder, post_model._encoder, post_model.orjson = codec
+        try:
+            if [post_model.encode(post) for post in posts] != new_data:
+                print(f"!! {name} 的輸出不同")
+            dump = best_of(lambda: [post_model.encode(post) for post in posts], args.repeat)
+            load = best_of(lambda: [post_model.decode(data) for data in new_data], args.repeat)
+        finally:
+            post_model._decoder, post_model._encoder, post_model.orjson = saved
+        print(f"- post_model ({name}): 序列化 {dump:.3f} 秒 ({legacy_dump / dump:.1f}x), "
+              f"剖析 + 檢查 {load:.3f} 秒 ({legacy_load / load:.1f}x, {n_comments / load / 1e3:.0f} K 則推文/秒)")
+
+    legacy_memory = retained_memory(lambda: [legacy_loads(data) for data in legacy_data])
+    new_memory = retained_memory(lambda: [post_model.decode(data) for data in new_data])
+    print(f"- 讀入後的記憶體: dict {legacy_memory / 1e6:.1f} MB, Post {new_memory / 1e6:.1f} MB "
+          f"(每則推文 {legacy_memory / n_comments:.0f} -> {new_memory / n_comments:.0f} bytes)")
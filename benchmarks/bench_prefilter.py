@@ -0,0 +1,128 @@
+import sys
+import argparse
+import random
+import timeit
+import cProfile
+import pstats
+import io
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from prefilter import preprocess_content, CJK_RANGES
+
+
+# 比較原本逐字元呼叫 is_not_chinese_char() 的篩選和 prefilter.preprocess_content() 的速度，
+# 確認輸出相同，並用 cProfile 看每個字元的函數呼叫是否已經從 profile 中消失
+#
+# $ python3 benchmarks/bench_prefilter.py (-n <文章數>)
+
+
+# 原本的實作 (ptt_helper.py / json2tei.py)，只是範圍換成 CJK_RANGES 以便比較輸出
+def legacy_is_not_chinese_char(char):
+    code = ord(char)
+    return not any(start <= code <= end for start, end in CJK_RANGES)
+
+
+def legacy_no_chinese_char_at_all(string):
+    return all(map(legacy_is_not_chinese_char, string))
+
+
+def legacy_preprocessing_content(string):
+    result = []
+
+    for sentence in string.split():
+        if not legacy_no_chinese_char_at_all(sentence.strip()):
+            result.append(sentence.strip())
+    return result
+
+
+# 原本的實作，原本的範圍 (只有 U+4E00 ~ U+9FA5)
+def original_is_not_chinese_char(char):
+    return not (19968 <= ord(char) <= 40869)
+
+
+def original_preprocessing_content(string):
+    result = []
+
+    for sentence in string.split():
+        if not all(map(original_is_not_chinese_char, sentence.strip())):
+            result.append(sentence.strip())
+    return result
+
+
+CHINESE = "我今天去吃飯好喜歡寫程式八卦問卦推噓樓上正解㐀𠀀"
+OTHERS = "abcdefghijklmnopqrstuvwxyz0123456789:/.-_=?!()[]"
+
+
+def make_post(rng, n_lines=60):
+    lines = []
+    for _ in range(n_lines):
+        kind = rng.random()
+        if kind < 0.2:
+            # 網址、簽名檔之類沒有中文的行
+            lines.append("https://" + "".join(rng.choice(OTHERS) for _ in range(rng.randint(10, 60))))
+        else:
+            words = []
+            for _ in range(rng.randint(1, 6)):
+                pool = CHINESE if rng.random() < 0.7 else OTHERS
+                words.append("".join(rng.choice(pool) for _ in range(rng.randint(2, 20))))
+            lines.append(" ".join(words))
+    return "\n".join(lines)
+
+
+def best_of(func, posts, repeat):
+    best = None
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        for post in posts:
+            func(post)
+        t2 = timeit.default_timer()
+        if best is None or t2 - t1 < best:
+            best = t2 - t1
+    return best
+
+
+def profile_calls(func, posts):
+    """
+    輸出: (總函數呼叫次數, profile 前幾名的文字)
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for post in posts:
+        func(post)
+    profiler.disable()
+
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("tottime").print_stats(5)
+    return stats.total_calls, out.getvalue()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--posts", help="測試幾篇文章", type=int, default=2000)
+    parser.add_argument("-r", "--repeat", help="跑幾輪 (取最快的一輪)", type=int, default=3)
+    parser.add_argument("--show-profile", help="印出 profile 的前幾名", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    posts = [make_post(rng) for _ in range(args.posts)]
+    n_chars = sum(len(p) for p in posts)
+    print(f"文章數: {len(posts)} ({n_chars / 1e6:.1f} M 字元)")
+
+    diff = [p for p in posts if legacy_preprocessing_content(p) != preprocess_content(p)]
+    if diff:
+        print(f"!! 有 {len(diff)} 篇的輸出和原本的實作不同")
+
+    for name, func in (
+        ("原本 (U+4E00 ~ U+9FA5)", original_preprocessing_content),
+        ("原本 (擴充區)", legacy_preprocessing_content),
+        ("prefilter", preprocess_content),
+    ):
+        seconds = best_of(func, posts, args.repeat)
+        calls, profile_text = profile_calls(func, posts)
+        print(f"- {name}: {seconds:.3f} 秒, {n_chars / 1e6 / seconds:.1f} M 字元/秒, 函數呼叫 {calls} 次 ({calls / n_chars:.2f} 次/字元)")
+        if args.show_profile:
+            print(profile_text)
@@ -0,0 +1,356 @@
+import sys
+import random
+import argparse
+import timeit
+import tempfile
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from post_model import Post, Comment
+from renderers import write_vrt_post, write_tei_post, render_to_string, atomic_open
+
+
+# 比較 renderers.py 和原本用字串串接的 renderer (下面的 legacy_*，
+# 是原本 ptt_helper.py / json2tei.py 中的實作) 在大文章上的速度，並確認輸出相同
+#
+# $ python3 benchmarks/bench_render.py (--comments 20000) (--body-sentences 2000)
+
+
+##########################################
+# 原本的實作 (字串串接)，僅供比較用        #
+##########################################
+
+def legacy_render_vrt_tagged(list_of_list_of_tup, post_body=False):
+    """
+    post_body: 如果是本文進來斷詞的話，因為本文是可以支援多行的，所以要在output時，要為每個句子的前後加上<s></s>
+    
+    Input: list of list of tuple
+    [
+        [
+            ("我", "Nd"),
+            ("跑", "VA"),
+            ...
+        ],
+        ...
+    ]
+     
+    Output: <str>
+    
+    我\tNd
+    跑\tVA
+    
+    """
+    
+    if len(list_of_list_of_tup) == 0:
+        return ""
+    elif len(list_of_list_of_tup) == 1:
+        # 如果是網址就不要出現
+        if list_of_list_of_tup[0][0][0].startswith("http"):
+            return ""
+        return '\n'.join((f"{word}\t{pos}" for word, pos in list_of_list_of_tup[0]))
+    else:
+        result = "\n"
+        for sentence in list_of_list_of_tup:
+            result += "<s>\n"
+            for word, pos in sentence:
+                
+                
+                if word.startswith("http"):
+                    continue
+                
+                if post_body:
+                    result += f"{word}\t{pos}\n"
+#                 s = '\n'.join((f"{word}\t{pos}" for word, pos in sentence))
+#                 result += '\n<s>\n' + s + '\n</s>'
+                else:
+                    result += f"{word}\t{pos}\n"
+#                     s = '\n'.join((f"{word}\t{pos}" for word, pos in sentence))
+#                     result += s + '\n'
+            result += "</s>\n"
+                
+        return result
+
+
+def legacy_structured_post2vrt(structured_post, tagged_fields):
+    """
+    tagged_fields: SegBatcher.segment_fields() 的輸出
+    [標題的斷詞結果, 本文的斷詞結果, 推文1的斷詞結果, ...]
+    """
+    
+    title_tagged, body_tagged, *comments_tagged = tagged_fields
+    
+    post_id = structured_post["post_id"]
+    post_author = structured_post["post_author"]
+    
+    if not isinstance(structured_post["post_time"], int):
+        structured_post["post_time"] = int(structured_post["post_time"])
+    dt = datetime.fromtimestamp(structured_post["post_time"])
+    
+    year = str(dt.year)
+    month = str(dt.month)
+    day = str(dt.day)
+    neg = str(structured_post["post_vote"]["neg"])
+    pos = str(structured_post["post_vote"]["pos"])
+    neu = str(structured_post["post_vote"]["neg"])
+    
+    title_text = legacy_render_vrt_tagged(title_tagged)
+    
+    body_text = legacy_render_vrt_tagged(body_tagged, post_body=True)
+    
+    comments_text = "\n"
+    if len(structured_post['comments']) != 0:
+        for i, (c, c_tagged) in enumerate(zip(structured_post['comments'], comments_tagged)):
+            comment_author = c["author"]
+            comment_type = c["type"]
+            # html2json 輸出的推文沒有 "order"，就用推文的順序
+            comment_order = c.get("order", i + 1)
+            comment_text = legacy_render_vrt_tagged(c_tagged)
+            comments_text += f"""
+<text id="{post_id.replace('.', '_')}_comment_{comment_order}" type="comment" author="{comment_author}" c_type="{comment_type}">
+<s>
+{comment_text}
+</s>
+</text>
+"""
+    
+    return f"""
+<post id="{post_id}" year="{year}" month="{month}" day="{day}" neg="{neg}" pos="{pos}" neu="{neu}">
+<text id="{post_id.replace('.', '_')}_title" type="title" author="{post_author}" c_type="NA">
+<s>
+{title_text}
+</s>
+</text>
+<text id="{post_id.replace('.', '_')}_body" type="body" author="{post_author}" c_type="NA">
+{body_text}
+</text>
+{comments_text}
+</post>
+"""
+
+
+def legacy_render_tei_tagged(list_of_list_of_tup, post_body=False):
+    """
+    post_body: 如果是本文進來斷詞的話，因為本文是可以支援多行的，所以要在output時，要為每個句子的前後加上<s></s>
+    
+    Input: list of list of tuple
+    [
+        [
+            ("我", "Nd"),
+            ("跑", "VA"),
+            ...
+        ],
+        ...
+    ]
+     
+    Output: <str>
+    
+    我\tNd
+    跑\tVA
+    
+    """
+    
+    if len(list_of_list_of_tup) == 0:
+        return ""
+    elif len(list_of_list_of_tup) == 1:
+        # 如果是網址就不要出現
+        if list_of_list_of_tup[0][0][0].startswith("http"):
+            return ""
+        
+        result = ""
+        for word, pos in list_of_list_of_tup[0]:
+            if word == "<":
+                word = "&lt;"
+            elif word == ">":
+                word = "&gt;"
+            elif word =="&":
+                word = "&amp;"
+        
+            result += f'<w type="{pos}">{word}</w>\n'
+        return result
+#         return '\n'.join((f'<w type="{pos}">{word}</w>' for word, pos in list_of_list_of_tup[0]))
+    else:
+        result = "\n"
+        for sentence in list_of_list_of_tup:
+            result += "<s>\n"
+            for word, pos in sentence:
+                
+                
+                
+                if word.startswith("http"):
+                    continue
+                    
+                if word == "<":
+                    word = "&lt;"
+                elif word == ">":
+                    word = "&gt;"
+                elif word =="&":
+                    word = "&amp;"
+                
+                if post_body:
+                    result += f'                <w type="{pos}">{word}</w>\n'
+
+                else:
+                    result += f'                <w type="{pos}">{word}</w>\n'
+
+            result += "</s>\n"
+                
+        return result
+
+
+def legacy_structured_post2tei(structured_post, tagged_fields):
+    """
+    tagged_fields: SegBatcher.segment_fields() 的輸出
+    [標題的斷詞結果, 本文的斷詞結果, 推文1的斷詞結果, ...]
+    """
+    
+    title_tagged, body_tagged, *comments_tagged = tagged_fields
+    
+    post_id = structured_post["post_id"]
+    post_author = structured_post["post_author"]
+    post_board = structured_post["post_board"]
+    
+    
+    if not isinstance(structured_post["post_time"], int):
+        structured_post["post_time"] = int(structured_post["post_time"])
+    dt = datetime.fromtimestamp(structured_post["post_time"])
+    
+    year = str(dt.year)
+    
+    title_text = legacy_render_tei_tagged(title_tagged)
+    
+    body_text = legacy_render_tei_tagged(body_tagged, post_body=True)
+    
+    comments_text = "\n"
+    if len(structured_post['comments']) != 0:
+        for c, c_tagged in zip(structured_post['comments'], comments_tagged):
+            comment_author = c["author"]
+            comment_type = c["type"]
+#             comment_order = c["order"]
+            comment_text = legacy_render_tei_tagged(c_tagged)
+            comments_text += f"""
+<comment author="{comment_author}" c_type="{comment_type}">
+<s>
+{comment_text}
+</s>
+</comment>
+"""
+    
+    return f"""<TEI.2>
+    <teiHeader>
+        <metadata name="author">{post_author}</metadata>
+        <metadata name="post_id">{post_id}</metadata>
+        <metadata name="year">{year}</metadata>
+        <metadata name="board">{post_board}</metadata>
+    </teiHeader>
+    <text>
+        <title author="{post_author}">
+            <s>
+                {title_text}
+            </s>
+        </title>
+        <body author="{post_author}">
+                {body_text}
+        </body>
+        {comments_text}
+    </text>
+</TEI.2>"""
+
+
+##########
+# 測試資料 #
+##########
+
+WORDS = [("我", "Nh"), ("今天", "Nd"), ("去", "D"), ("吃飯", "VA"), ("<", "PARENTHESISCATEGORY"),
+         ("&", "FW"), ("推", "VC"), ("XD", "FW"), ("http://i.imgur.com/x.jpg", "FW")]
+
+
+def make_sentence(n_words):
+    return [random.choice(WORDS) for _ in range(n_words)]
+
+
+def make_post(n_comments, n_body_sentences, seed=0):
+    """
+    回傳 (structured_post, tagged_fields)
+    """
+    random.seed(seed)
+    structured_post = Post(
+        post_board="Gossiping",
+        post_id="M.1123525242.A.EE4",
+        post_time=1123525242,
+        post_title="[問卦] 測試",
+        post_author="someone",
+        post_body="",
+        post_vote={"pos": n_comments, "neg": 0, "neu": 0},
+        comments=[
+            Comment("pos", f"user{i}", "", order=i + 1)
+            for i in range(n_comments)
+        ],
+    )
+    tagged_fields = [
+        [make_sentence(4)],
+        [make_sentence(random.randint(1, 30)) for _ in range(n_body_sentences)],
+    ] + [
+        [make_sentence(random.randint(1, 15))]
+        for _ in range(n_comments)
+    ]
+    return structured_post, tagged_fields
+
+
+def peak_memory(func):
+    """
+    回傳 func() 執行期間 Python 配置的記憶體峰值 (MB)
+    """
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def write_to_file(write_func, path, structured_post, tagged_fields):
+    with atomic_open(path) as f:
+        write_func(f, structured_post, tagged_fields)
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        result = func()
+        t2 = timeit.default_timer()
+        if best is None or t2 - t1 < best:
+            best = t2 - t1
+    return best, result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", help="推文數", type=int, default=20000)
+    parser.add_argument("--body-sentences", help="本文句數", type=int, default=2000)
+    parser.add_argument("-r", "--repeat", help="跑幾輪 (取最快的一輪)", type=int, default=3)
+    args = parser.parse_args()
+
+    structured_post, tagged_fields = make_post(args.comments, args.body_sentences)
+    print(f"推文數: {args.comments}, 本文句數: {args.body_sentences}")
+
+    for name, legacy, write_func in [
+        ("vrt", legacy_structured_post2vrt, write_vrt_post),
+        ("tei", legacy_structured_post2tei, write_tei_post),
+    ]:
+        t_legacy, legacy_result = best_of(lambda: legacy(structured_post.to_dict(), tagged_fields), args.repeat)
+        t_new, new_result = best_of(lambda: render_to_string(write_func, structured_post, tagged_fields), args.repeat)
+
+        print(f"- {name}: 原本 {t_legacy:.3f} 秒, renderers {t_new:.3f} 秒 ({t_legacy / t_new:.1f}x), 輸出 {len(new_result) / 1e6:.1f} MB")
+        if legacy_result != new_result:
+            print(f"  !! {name} 輸出不同")
+
+        # 寫檔時的記憶體峰值: 原本要先組出整份字串，renderers 直接寫進檔案
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / f"post.{name}"
+            m_legacy = peak_memory(lambda: path.write_text(legacy(structured_post.to_dict(), tagged_fields)))
+            m_new = peak_memory(lambda: write_to_file(write_func, path, structured_post, tagged_fields))
+        print(f"  寫檔記憶體峰值: 原本 {m_legacy:.1f} MB, renderers {m_new:.1f} MB")
@@ -0,0 +1,125 @@
+import sys
+import argparse
+import subprocess
+import tempfile
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synth import generate_corpus
+
+
+# ptt_helper.py 查詢指令的啟動時間
+#
+# 用 python -X importtime 執行 list_json 等不需要斷詞的指令，記錄整個指令的時間和 import 的時間，
+# 列出最花時間的模組，並檢查沒有載入 HEAVY_MODULES (這些只有轉檔、爬蟲等指令才需要)。
+# 任何一個指令超過 --budget 秒或載入了 HEAVY_MODULES 時，結束碼為 1，可以放進 CI。
+#
+# $ python3 benchmarks/bench_startup.py (--budget 0.5) (--top 10)
+
+# 查詢指令不應該載入的模組
+HEAVY_MODULES = (
+    "pyquery", "lxml", "numpy", "libtmux", "pymongo", "aiohttp", "ckiptagger",
+    "html2json", "json2tei", "pipeline", "token_corpus", "lexicon", "sketch", "async_crawler", "watcher",
+)
+
+DEFAULT_BUDGET = 0.5
+
+
+def metadata_commands(data_dir):
+    board = sorted(p.name for p in Path(data_dir).iterdir() if p.is_dir())[0]
+    return [
+        ["list_json", "-d", str(data_dir)],
+        ["list_vrt", "-d", str(data_dir), "-b", board],
+        ["get_latest_post_timestamp", "-d", str(data_dir), "-b", board],
+        ["build_catalog", "-d", str(data_dir)],
+        ["list_html", "-d", str(data_dir)],
+    ]
+
+
+def parse_importtime(stderr):
+    """
+    輸出: list of (模組, 自己的時間 us, 累計時間 us, 層數)
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def run_command(argv, log_path):
+    cmd = [sys.executable, "-X", "importtime", str(ROOT / "ptt_helper.py")] + argv + ["-l", str(log_path)]
+
+    t1 = timeit.default_timer()
+    proc = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    t2 = timeit.default_timer()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} 失敗:\n{proc.stderr[-2000:]}")
+    return t2 - t1, parse_importtime(proc.stderr)
+
+
+def interpreter_seconds(repeat=3):
+    """
+    空的 python 啟動時間 (比較用)
+    """
+    best = None
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        t2 = timeit.default_timer()
+        best = t2 - t1 if best is None else min(best, t2 - t1)
+    return best
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", help="要測試的資料夾 (不指定則用 synth.py 產生)")
+    parser.add_argument("--budget", help="每個指令最多幾秒", type=float, default=DEFAULT_BUDGET)
+    parser.add_argument("--top", help="列出最花時間的幾個模組", type=int, default=8)
+    parser.add_argument("-r", "--repeat", help="每個指令跑幾次 (取最快的一次)", type=int, default=3)
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = Path(tmp) / "html"
+            generate_corpus(data_dir, posts_per_year=20)
+        log_path = Path(tmp) / "bench_startup.log"
+
+        print(f"python 本身: {interpreter_seconds():.3f} 秒 (上限 {args.budget} 秒)")
+
+        for argv in metadata_commands(data_dir):
+            best, modules = None, None
+            for _ in range(args.repeat):
+                seconds, imported = run_command(argv, log_path)
+                if best is None or seconds < best:
+                    best, modules = seconds, imported
+
+            import_us = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+            heavy = sorted({
+                name for name, _, _, _ in modules
+                if name.split(".")[0] in HEAVY_MODULES
+            })
+
+            status = "ok"
+            if best > args.budget:
+                status = "!! 超過上限"
+                ok = False
+            if heavy:
+                status = "!! 載入了 " + ", ".join(heavy)
+                ok = False
+
+            print(f"- {argv[0]}: {best:.3f} 秒, import {import_us / 1e6:.3f} 秒, {len(modules)} 個模組  {status}")
+            for name, _, cumulative, _ in sorted((m for m in modules if m[3] == 0), key=lambda m: -m[2])[:args.top]:
+                print(f"    {cumulative / 1e3:8.1f} ms  {name}")
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,221 @@
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import parse_post_filename
+
+from synth import generate_corpus
+
+
+# 在本機假裝成 PTT，給 async_crawler.py (dynamic_crawl --base-url) 測試用
+#
+# 讀入 <data_dir>/<board>/<year>/*.html (爬蟲的結構，或 synth.py 產生的)，提供:
+# - /bbs/<board>/index.html, /bbs/<board>/index<N>.html: 看板列表，每頁 POSTS_PER_PAGE 篇，
+#   index1.html 最舊、index.html 最新；index.html 底下有一篇置底的舊文章 (r-list-sep 之後)
+# - /bbs/<board>/<post_id>.html: 文章原始的 .html
+#
+# --latency 模擬延遲，--fail-rate 隨機回 503，--deleted-rate 讓部分文章在列表中沒有連結、網址回 404。
+# 結束時 (Ctrl-C) 印出請求數和同時處理的最大請求數，用來確認爬蟲的連線數限制。
+#
+# $ python3 benchmarks/ptt_stub_server.py -d <html資料夾> (--port 8080)
+# $ python3 ptt_helper.py dynamic_crawl -d <本地資料夾> --base-url http://127.0.0.1:8080
+
+POSTS_PER_PAGE = 20
+
+INDEX_PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>看板 {board} 文章列表 - 批踢踢實業坊</title></head>
+<body>
+<div id="action-bar-container"><div class="action-bar"><div class="btn-group btn-group-paging">
+<a class="btn wide" href="/bbs/{board}/index1.html">最舊</a>
+{prev_link}
+<a class="btn wide" href="/bbs/{board}/index.html">最新</a>
+</div></div></div>
+<div id="main-container"><div class="r-list-container action-bar-margin bbs-screen">
+{entries}
+</div></div>
+</body></html>
+'''
+
+ENTRY = '''<div class="r-ent"><div class="nrec"></div><div class="title">
+<a href="/bbs/{board}/{post_id}.html">文章 {post_id}</a>
+</div><div class="meta"><div class="author">author</div><div class="date">{date}</div></div></div>'''
+
+DELETED_ENTRY = '''<div class="r-ent"><div class="nrec"></div><div class="title">
+(本文已被刪除) [author]
+</div><div class="meta"><div class="author">-</div><div class="date">{date}</div></div></div>'''
+
+
+class StubPtt(object):
+
+    def __init__(self, data_dir, deleted_rate=0.0, seed=0):
+        rng = random.Random(seed)
+
+        # board -> 依時間排序的 list of (timestamp, post_id)
+        self.boards = defaultdict(list)
+        # (board, post_id) -> .html 路徑
+        self.paths = {}
+        self.deleted = set()
+
+        for path in Path(data_dir).glob("*/*/*.html"):
+            parsed = parse_post_filename(path.name)
+            if parsed is None:
+                continue
+            post_id, timestamp, _ = parsed
+            board = path.parent.parent.name
+
+            self.boards[board].append((timestamp, post_id))
+            self.paths[(board, post_id)] = path
+            if rng.random() < deleted_rate:
+                self.deleted.add((board, post_id))
+
+        for posts in self.boards.values():
+            posts.sort()
+
+    def n_pages(self, board):
+        return max(1, -(-len(self.boards[board]) // POSTS_PER_PAGE))
+
+    def index_page(self, board, page=None):
+        n_pages = self.n_pages(board)
+        latest = page is None
+        page = n_pages if latest else page
+        if not 1 <= page <= n_pages:
+            return None
+
+        posts = self.boards[board][(page - 1) * POSTS_PER_PAGE:page * POSTS_PER_PAGE]
+        entries = [self._entry(board, timestamp, post_id) for timestamp, post_id in posts]
+        if latest and self.boards[board]:
+            # 置底文章: 用最舊的一篇代替
+            entries.append('<div class="r-list-sep"></div>')
+            entries.append(self._entry(board, *self.boards[board][0]))
+
+        if page > 1:
+            prev_link = f'<a class="btn wide" href="/bbs/{board}/index{page - 1}.html">&lsaquo; 上頁</a>'
+        else:
+            prev_link = '<a class="btn wide disabled">&lsaquo; 上頁</a>'
+
+        return INDEX_PAGE.format(board=board, prev_link=prev_link, entries="\n".join(entries))
+
+    def _entry(self, board, timestamp, post_id):
+        date = time.strftime("%m/%d", time.localtime(timestamp))
+        if (board, post_id) in self.deleted:
+            return DELETED_ENTRY.format(date=date)
+        return ENTRY.format(board=board, post_id=post_id, date=date)
+
+    def article(self, board, post_id):
+        if (board, post_id) in self.deleted:
+            return None
+        path = self.paths.get((board, post_id))
+        return None if path is None else path.read_bytes()
+
+    def route(self, url_path):
+        """
+        輸出: 網頁內容 (bytes) 或 None (404)
+        """
+        parts = url_path.split("?")[0].strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "bbs" or parts[1] not in self.boards:
+            return None
+
+        board, name = parts[1], parts[2]
+        if name == "index.html":
+            page = self.index_page(board)
+        elif name.startswith("index") and name.endswith(".html") and name[5:-5].isdigit():
+            page = self.index_page(board, int(name[5:-5]))
+        elif name.startswith("M.") and name.endswith(".html"):
+            return self.article(board, name[:-5])
+        else:
+            return None
+
+        return None if page is None else page.encode("utf-8")
+
+
+def make_handler(ptt, latency=0.0, fail_rate=0.0):
+    lock = threading.Lock()
+    counters = {"requests": 0, "active": 0, "max_active": 0, "failed": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            with lock:
+                counters["requests"] += 1
+                counters["active"] += 1
+                counters["max_active"] = max(counters["max_active"], counters["active"])
+            try:
+                if latency:
+                    time.sleep(latency)
+
+                if random.random() < fail_rate:
+                    with lock:
+                        counters["failed"] += 1
+                    self.send_error(503)
+                    return
+
+                content = ptt.route(self.path)
+                if content is None:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            finally:
+                with lock:
+                    counters["active"] -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler, counters
+
+
+def serve(ptt, host="127.0.0.1", port=8080, latency=0.0, fail_rate=0.0):
+    """
+    回傳: (server, counters)，server 在背景執行緒中執行，用 server.shutdown() 停止
+    """
+    handler, counters = make_handler(ptt, latency=latency, fail_rate=fail_rate)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counters
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", help="要提供的 .html (不指定則用 synth.py 產生)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", help="每個請求延遲幾秒", type=float, default=0.0)
+    parser.add_argument("--fail-rate", help="隨機回 503 的比例", type=float, default=0.0)
+    parser.add_argument("--deleted-rate", help="已刪除文章的比例", type=float, default=0.0)
+    parser.add_argument("--posts-per-year", help="沒有 -d 時，每個板每年產生幾篇", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = Path(tmp) / "html"
+            generate_corpus(data_dir, posts_per_year=args.posts_per_year)
+
+        ptt = StubPtt(data_dir, deleted_rate=args.deleted_rate)
+        server, counters = serve(ptt, args.host, args.port, latency=args.latency, fail_rate=args.fail_rate)
+
+        n_posts = sum(len(posts) for posts in ptt.boards.values())
+        print(f"http://{args.host}:{args.port}/bbs/<board>/index.html: {len(ptt.boards)} 個板, {n_posts} 篇", file=sys.stderr)
+
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            print(f"\n請求 {counters['requests']} 個 (503: {counters['failed']})，同時最多 {counters['max_active']} 個", file=sys.stderr)
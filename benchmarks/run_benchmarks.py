@@ -0,0 +1,277 @@
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import timeit
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import catalog
+import seg_worker
+import vrt_merge
+from html2json import html2json, ENGINES
+from json2tei import _seg_and_pos
+from prefilter import preprocess_content
+from renderers import WRITE_BUFFER_SIZE, atomic_open, write_vrt_post, write_tei_post
+from seg_batch import SegBatcher, post_sentence_fields
+
+from synth import generate_corpus, StubSegmenter
+
+
+# 各個處理階段的 benchmark
+#
+# 用 synth.py 產生假的語料 (或用 -d 指定現有的 .html)，依序測試:
+# html2json (各剖析器)、斷詞 (_seg_and_pos，沒有 CKIP 時用 StubSegmenter)、
+# VRT / TEI 輸出、reduce_to_one_vrt、build_catalog、list 指令 (catalog / 掃描資料夾)。
+# 每項記錄最快一輪的秒數、每秒處理幾項、MB/秒，另外跑一輪用 tracemalloc 量記憶體峰值。
+#
+# --save-baseline 把結果存成 baseline；--compare 和 baseline 比較，
+# 每項的時間或記憶體超過 baseline 的 (1 + tolerance) 倍就列為退步。
+#
+# $ python3 benchmarks/run_benchmarks.py (--posts-per-year 200) (--save-baseline | --compare)
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines.json"
+
+
+def measure(func, repeat):
+    """
+    func() 回傳 (處理的項目數, 讀入的 bytes)
+    輸出: dict
+    """
+    best = None
+    for _ in range(repeat):
+        t1 = timeit.default_timer()
+        n_items, n_bytes = func()
+        t2 = timeit.default_timer()
+        if best is None or t2 - t1 < best:
+            best = t2 - t1
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": best,
+        "items": n_items,
+        "items_per_sec": n_items / best if best > 0 else 0.0,
+        "mb_per_sec": n_bytes / 1e6 / best if best > 0 else 0.0,
+        "peak_mb": peak / 1e6,
+    }
+
+
+class Suite(object):
+
+    def __init__(self, data_dir, work_dir):
+        self.data_dir = Path(data_dir)
+        self.work_dir = Path(work_dir)
+
+        self.html_paths = sorted(self.data_dir.rglob("*.html"))
+        self.html_bytes = sum(p.stat().st_size for p in self.html_paths)
+
+        self.posts = []
+        self.tagged = []
+
+    def bench_html2json(self, engine):
+        def run():
+            self.posts = [
+                (p, post)
+                for p in self.html_paths
+                for post in [html2json(p, engine=engine)]
+                if post is not None
+            ]
+            return len(self.html_paths), self.html_bytes
+        return run
+
+    def bench_segment(self):
+        batcher = SegBatcher(_seg_and_pos)
+
+        def run():
+            self.tagged = [
+                batcher.segment_fields(post_sentence_fields(post, preprocess_content))
+                for _, post in self.posts
+            ]
+            return len(self.posts), 0
+        return run
+
+    def bench_render(self, write_func):
+        def run():
+            with open(os.devnull, "w", buffering=WRITE_BUFFER_SIZE) as out:
+                for (_, post), tagged_fields in zip(self.posts, self.tagged):
+                    write_func(out, post, tagged_fields)
+            return len(self.posts), 0
+        return run
+
+    def write_vrt_tree(self):
+        """
+        reduce_to_one_vrt / list 指令的輸入: 在 work_dir 中產生和 data_dir 相同結構的 .vrt
+        """
+        vrt_dir = self.work_dir / "vrt"
+        for (html_path, post), tagged_fields in zip(self.posts, self.tagged):
+            vrt_path = vrt_dir / html_path.relative_to(self.data_dir).with_suffix(".vrt")
+            vrt_path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_open(vrt_path) as f:
+                write_vrt_post(f, post, tagged_fields)
+        return vrt_dir
+
+    def bench_reduce(self, vrt_dir):
+        out_dir = self.work_dir / "merged"
+        vrt_paths = list(vrt_dir.rglob("*.vrt"))
+        vrt_bytes = sum(p.stat().st_size for p in vrt_paths)
+
+        def run():
+            vrt_merge.merge_corpus(vrt_dir, out_dir)
+            return len(vrt_paths), vrt_bytes
+        return run
+
+    def bench_build_catalog(self, vrt_dir):
+        def run():
+            return catalog.build_catalog(vrt_dir), 0
+        return run
+
+    def bench_list_catalog(self, vrt_dir):
+        # 只測 list_* 的查詢，catalog 先建好 (建立的時間見 bench_build_catalog)
+        n = catalog.build_catalog(vrt_dir)
+
+        def run():
+            catalog.count_by_board_by_year(vrt_dir, ext="vrt")
+            return n, 0
+        return run
+
+    def bench_list_scan(self, vrt_dir):
+        # ptt_helper 的 list_* 在沒有 catalog 時掃描資料夾
+        import ptt_helper
+
+        scan_dir = self.work_dir / "scan"
+        if not scan_dir.exists():
+            shutil.copytree(vrt_dir, scan_dir, ignore=shutil.ignore_patterns(catalog.CATALOG_FILENAME + "*"))
+
+        def run():
+            with redirect_stdout(io.StringIO()):
+                ptt_helper.list_by_board_by_year(data_dir=scan_dir, ext="vrt")
+            return len(self.posts), 0
+        return run
+
+
+def run_suite(data_dir, work_dir, repeat=3):
+    suite = Suite(data_dir, work_dir)
+    results = {}
+
+    def record(name, func):
+        results[name] = measure(func, repeat)
+        r = results[name]
+        print(f"- {name}: {r['seconds']:.3f} 秒, {r['items_per_sec']:.1f} 項/秒, "
+              f"{r['mb_per_sec']:.2f} MB/秒, 記憶體峰值 {r['peak_mb']:.1f} MB", file=sys.stderr)
+
+    for engine in ENGINES:
+        record(f"html2json_{engine}", suite.bench_html2json(engine))
+
+    record("segment", suite.bench_segment())
+    record("render_vrt", suite.bench_render(write_vrt_post))
+    record("render_tei", suite.bench_render(write_tei_post))
+
+    vrt_dir = suite.write_vrt_tree()
+    record("reduce_to_one_vrt", suite.bench_reduce(vrt_dir))
+    record("build_catalog", suite.bench_build_catalog(vrt_dir))
+    record("list_catalog", suite.bench_list_catalog(vrt_dir))
+    try:
+        record("list_scan", suite.bench_list_scan(vrt_dir))
+    except ImportError as e:
+        print(f"- list_scan: 略過 ({e})", file=sys.stderr)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    輸出: list of 退步的項目說明
+    """
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+
+        for key in ("seconds", "peak_mb"):
+            ratio = r[key] / b[key] if b[key] > 0 else 1.0
+            line = f"{name} {key}: {b[key]:.3f} -> {r[key]:.3f} ({ratio:.2f}x)"
+            print(f"  {line}", file=sys.stderr)
+            if ratio > 1 + tolerance:
+                regressions.append(line)
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", help="使用現有的 .html (不指定則用 synth.py 產生)")
+    parser.add_argument("--boards", help="產生幾個板", type=int, default=2)
+    parser.add_argument("--years", help="產生的年份，以逗號分隔", default="2015,2016")
+    parser.add_argument("--posts-per-year", help="每個板每年產生幾篇", type=int, default=100)
+    parser.add_argument("--mean-pushes", help="平均推文數", type=float, default=15)
+    parser.add_argument("-c", "--ckip-path", help="使用真的 CKIP 斷詞 (不指定則用 StubSegmenter)")
+    parser.add_argument("-r", "--repeat", help="每項跑幾輪 (取最快的一輪)", type=int, default=3)
+    parser.add_argument("--baseline", help="baseline 檔路徑", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", help="把這次的結果存成 baseline", action="store_true")
+    parser.add_argument("--compare", help="和 baseline 比較，有退步時 exit code 為 1", action="store_true")
+    parser.add_argument("--tolerance", help="超過 baseline 多少比例算退步", type=float, default=0.2)
+    parser.add_argument("-o", "--output", help="結果另存成 json")
+    args = parser.parse_args()
+
+    if args.ckip_path:
+        seg_worker.init_worker(args.ckip_path)
+    else:
+        seg_worker.ckipws = StubSegmenter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.data_dir:
+            data_dir = Path(args.data_dir)
+        else:
+            data_dir = Path(tmp) / "html"
+            generate_corpus(
+                data_dir,
+                boards=args.boards,
+                years=[int(y) for y in args.years.split(",")],
+                posts_per_year=args.posts_per_year,
+                mean_pushes=args.mean_pushes,
+            )
+
+        work_dir = Path(tmp) / "work"
+        work_dir.mkdir()
+
+        results = run_suite(data_dir, work_dir, repeat=args.repeat)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "segmenter": "ckip" if args.ckip_path else "stub",
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"baseline: {args.baseline}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("退步:", file=sys.stderr)
+            for line in regressions:
+                print(f"- {line}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,185 @@
+import sys
+import math
+import random
+import argparse
+from pathlib import Path
+from datetime import datetime
+from html import escape
+
+
+# 產生假的 PTT 語料 (.html)，給 benchmarks/run_benchmarks.py 使用
+#
+# 輸出的結構和爬蟲相同: <out_dir>/<board>/<year>/<YYYYMMDD_HHMM>_<post_id>.html
+# 本文行數為對數常態分佈、推文數為指數分佈 (少數文章有大量推文)，可以用參數調整。
+#
+# $ python3 benchmarks/synth.py -o <輸出資料夾> (--boards 3 --years 2015,2016 --posts-per-year 200)
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title} - 看板 {board} - 批踢踢實業坊</title></head>
+<body>
+<div id="topbar-container"><div id="topbar" class="bbs-content"><a class="board" href="/bbs/{board}/index.html"><span class="board-label">看板 </span>{board}</a></div></div>
+<div id="main-container">
+<div id="main-content" class="bbs-screen bbs-content"><div class="article-metaline"><span class="article-meta-tag">作者</span><span class="article-meta-value">{author} ({nickname})</span></div><div class="article-metaline-right"><span class="article-meta-tag">看板</span><span class="article-meta-value">{board}</span></div><div class="article-metaline"><span class="article-meta-tag">標題</span><span class="article-meta-value">{title}</span></div><div class="article-metaline"><span class="article-meta-tag">時間</span><span class="article-meta-value">{time}</span></div>
+{body}
+--
+※ 發信站: 批踢踢實業坊(ptt.cc), 來自: {ip}
+<span class="f2">※ 文章網址: <a href="https://www.ptt.cc/bbs/{board}/{post_id}.html" target="_blank" rel="noopener noreferrer nofollow">https://www.ptt.cc/bbs/{board}/{post_id}.html</a>
+</span>{pushes}</div>
+</div></body></html>
+'''
+
+PUSH = (
+    '<div class="push"><span class="{cls} push-tag">{tag} </span>'
+    '<span class="f3 hl push-userid">{user}</span>'
+    '<span class="f3 push-content">: {content}</span>'
+    '<span class="push-ipdatetime"> {time}\n</span></div>'
+)
+
+PUSH_TAGS = [("推", "hl"), ("噓", "f1 hl"), ("→", "f1 hl")]
+PUSH_WEIGHTS = [0.5, 0.1, 0.4]
+
+WORDS = [
+    "今天", "天氣", "很好", "我們", "大家", "覺得", "這個", "真的", "不是", "可以",
+    "去", "吃飯", "八卦", "有", "嗎", "推", "樓上", "正解", "政府", "台灣",
+    "工作", "薪水", "房價", "老闆", "朋友", "女生", "男生", "電影", "遊戲", "手機",
+    "因為", "所以", "但是", "如果", "還是", "已經", "就是", "一個", "什麼", "怎麼",
+    "，", "。", "？", "！", "XD", "QQ", "lol", "2020", "100", "iPhone",
+]
+
+TITLE_PREFIXES = ["[問卦]", "[新聞]", "[爆卦]", "[心得]", "[討論]", "Re: [問卦]"]
+
+URLS = ["https://i.imgur.com/abcdefg.jpg", "https://www.youtube.com/watch?v=xxxxxxxx", "http://example.com/news/123"]
+
+
+def make_sentence(rng, n_words):
+    return "".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def make_body(rng, mean_body_lines):
+    """
+    本文: 一般的句子、空行、網址、引文
+    """
+    # 對數常態分佈，平均約為 mean_body_lines
+    sigma = 0.8
+    n_lines = max(1, int(rng.lognormvariate(math.log(mean_body_lines) - sigma ** 2 / 2, sigma)))
+
+    lines = []
+    for _ in range(n_lines):
+        kind = rng.random()
+        if kind < 0.1:
+            lines.append("")
+        elif kind < 0.15:
+            url = rng.choice(URLS)
+            lines.append(f'<a href="{url}" target="_blank" rel="noopener noreferrer nofollow">{url}</a>')
+        elif kind < 0.2:
+            lines.append(": " + escape(make_sentence(rng, rng.randint(2, 10))))
+        else:
+            lines.append(escape(make_sentence(rng, rng.randint(2, 20))))
+
+    if rng.random() < 0.3:
+        lines.insert(0, f"※ 引述《user{rng.randint(1, 999)} (暱稱)》之銘言：")
+
+    return "\n".join(lines)
+
+
+def make_pushes(rng, dt, mean_pushes, max_pushes):
+    n_pushes = min(int(rng.expovariate(1 / mean_pushes)) if mean_pushes > 0 else 0, max_pushes)
+
+    pushes = []
+    for _ in range(n_pushes):
+        tag, cls = rng.choices(PUSH_TAGS, weights=PUSH_WEIGHTS)[0]
+        pushes.append(PUSH.format(
+            cls=cls,
+            tag=tag,
+            user=f"user{rng.randint(1, 5000)}",
+            content=escape(make_sentence(rng, rng.randint(0, 8))),
+            time=dt.strftime("%m/%d %H:%M"),
+        ))
+    return "".join(pushes)
+
+
+def make_page(rng, board, dt, post_id, mean_body_lines=20, mean_pushes=15, max_pushes=3000):
+    return PAGE.format(
+        board=board,
+        title=escape(f"{rng.choice(TITLE_PREFIXES)} {make_sentence(rng, rng.randint(2, 6))}"),
+        author=f"author{rng.randint(1, 5000)}",
+        nickname=make_sentence(rng, 1),
+        time=dt.strftime("%a %b %e %H:%M:%S %Y"),
+        body=make_body(rng, mean_body_lines),
+        ip=f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+        post_id=post_id,
+        pushes=make_pushes(rng, dt, mean_pushes, max_pushes),
+    )
+
+
+def generate_corpus(out_dir, boards=2, years=(2015, 2016), posts_per_year=100,
+                    mean_body_lines=20, mean_pushes=15, max_pushes=3000, seed=0):
+    """
+    boards: 板的數量 (板名為 Board0, Board1, ...) 或板名的 list
+    回傳: 產生的 .html 路徑 list
+    """
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    board_names = [f"Board{i}" for i in range(boards)] if isinstance(boards, int) else list(boards)
+
+    paths = []
+    for board in board_names:
+        for year in years:
+            year_dir = out_dir / board / str(year)
+            year_dir.mkdir(parents=True, exist_ok=True)
+
+            start = int(datetime(year, 1, 1).timestamp())
+            end = int(datetime(year + 1, 1, 1).timestamp()) - 1
+
+            for _ in range(posts_per_year):
+                timestamp = rng.randint(start, end)
+                post_id = f"M.{timestamp}.A.{rng.randint(0, 4095):03X}"
+                dt = datetime.fromtimestamp(timestamp)
+
+                path = year_dir / f"{dt.strftime('%Y%m%d_%H%M')}_{post_id}.html"
+                path.write_text(make_page(rng, board, dt, post_id, mean_body_lines, mean_pushes, max_pushes))
+                paths.append(path)
+
+    return paths
+
+
+class StubSegmenter(object):
+    """
+    沒有 CKIP 時代替 PyWordSeg: 每兩個字切成一個詞，詞性都是 Na。
+    和 CKIP 一樣，輸入中的空字串不會出現在輸出中。
+    """
+
+    def ApplyList(self, list_of_sentences):
+        return [
+            "　".join(f"{s[i:i + 2]}(Na)" for i in range(0, len(s), 2))
+            for s in (sentence.strip() for sentence in list_of_sentences)
+            if s
+        ]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output-dir", help="輸出資料夾", required=True)
+    parser.add_argument("--boards", help="板的數量", type=int, default=2)
+    parser.add_argument("--years", help="年份，以逗號分隔", default="2015,2016")
+    parser.add_argument("--posts-per-year", help="每個板每年幾篇", type=int, default=100)
+    parser.add_argument("--mean-body-lines", help="本文平均行數", type=float, default=20)
+    parser.add_argument("--mean-pushes", help="平均推文數", type=float, default=15)
+    parser.add_argument("--max-pushes", help="推文數上限", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(
+        args.output_dir,
+        boards=args.boards,
+        years=[int(y) for y in args.years.split(",")],
+        posts_per_year=args.posts_per_year,
+        mean_body_lines=args.mean_body_lines,
+        mean_pushes=args.mean_pushes,
+        max_pushes=args.max_pushes,
+        seed=args.seed,
+    )
+
+    total_bytes = sum(p.stat().st_size for p in paths)
+    print(f"產生 {len(paths)} 篇 ({total_bytes / 1e6:.1f} MB) -> {args.output_dir}", file=sys.stderr)
@@ -0,0 +1,216 @@
+import os
+import re
+import sqlite3
+import logging
+from pathlib import Path
+
+
+# 語料目錄索引 (catalog)
+#
+# 存在 <data_dir>/.ptt_catalog.sqlite，記錄每一篇文章的
+# 板名 / 年份 / post_id / timestamp，以及已經有哪些格式 (.html/.json/.vrt/.xml)。
+# list_json / list_vrt 直接查這個索引，不必再把每個年份資料夾全部列出來。
+#
+# 第一次使用時用 `build_catalog` 指令完整掃描一次，之後由各個轉檔器
+# (html2json / json2vrt / json2tei) 每寫出一個檔案就順便更新。
+
+CATALOG_FILENAME = ".ptt_catalog.sqlite"
+
+FORMATS = ("html", "json", "vrt", "xml")
+
+# e.g. "20050809_0220_M.1123525242.A.EE4.json"
+POST_FILE_RE = re.compile(r"^\d{8}_\d{4}_(M\.(\d{10})\.A\.[0-9A-Za-z]{3})\.(html|json|vrt|xml)$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    board TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    post_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    has_html INTEGER NOT NULL DEFAULT 0,
+    has_json INTEGER NOT NULL DEFAULT 0,
+    has_vrt INTEGER NOT NULL DEFAULT 0,
+    has_xml INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (board, post_id)
+);
+CREATE INDEX IF NOT EXISTS posts_board_year ON posts (board, year);
+"""
+
+# 每個進程各自持有連線 (sqlite 連線不能跨 fork 共用)
+# key: str(data_dir), value: (pid, connection 或 None)
+_connections = {}
+
+
+def catalog_path(data_dir):
+    return Path(data_dir) / CATALOG_FILENAME
+
+
+def has_catalog(data_dir):
+    return catalog_path(data_dir).is_file()
+
+
+def _connect(path):
+    conn = sqlite3.connect(str(path), timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _get_connection(data_dir, create=False):
+    """
+    取得 data_dir 的 catalog 連線。
+    如果 catalog 不存在且 create=False，回傳 None (轉檔器不會自行建立 catalog)。
+    """
+    key = str(data_dir)
+    pid = os.getpid()
+
+    cached = _connections.get(key)
+    if cached is not None and cached[0] == pid and (cached[1] is not None or not create):
+        return cached[1]
+
+    path = catalog_path(data_dir)
+    if not create and not path.is_file():
+        conn = None
+    else:
+        conn = _connect(path)
+
+    _connections[key] = (pid, conn)
+    return conn
+
+
+def parse_post_filename(name):
+    """
+    輸入: 檔名 e.g. "20050809_0220_M.1123525242.A.EE4.json"
+    輸出: (post_id, timestamp, 副檔名)；不是文章檔名的話回傳 None
+    """
+    m = POST_FILE_RE.match(name)
+    if m is None:
+        return None
+    return m.group(1), int(m.group(2)), m.group(3)
+
+
+def record(path):
+    """
+    轉檔器寫出一個檔案後呼叫，把該格式標記為已存在。
+    path 必須是實際寫出的檔案 (和 build_catalog() 掃描到的結果一致)，結構須為 <data_dir>/<board>/<year>/<檔名>；
+    不是這種結構 (例如 -o 指定的 TEI 資料夾)、或 <data_dir> 底下沒有 catalog 時，什麼都不做。
+    """
+    path = Path(path)
+    parsed = parse_post_filename(path.name)
+    if parsed is None:
+        return
+
+    post_id, timestamp, ext = parsed
+    year_dir = path.parent
+    board_dir = year_dir.parent
+
+    # 先確認是年份資料夾，不要打開不相干的 catalog
+    try:
+        year = int(year_dir.name)
+    except ValueError:
+        return
+
+    conn = _get_connection(board_dir.parent)
+    if conn is None:
+        return
+
+    column = f"has_{ext}"
+    with conn:
+        conn.execute(
+            f"""
+            INSERT INTO posts (board, year, post_id, timestamp, {column})
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (board, post_id) DO UPDATE SET {column} = 1
+            """,
+            (board_dir.name, year, post_id, timestamp)
+        )
+
+
+def _scan_board(board_dir):
+    """
+    用 os.scandir 掃一個板的所有年份資料夾，
+    回傳 list of (board, year, post_id, timestamp, has_html, has_json, has_vrt, has_xml)
+    """
+    posts = {}
+
+    with os.scandir(board_dir) as year_entries:
+        for year_entry in year_entries:
+            if not year_entry.is_dir() or not year_entry.name.isdigit():
+                continue
+            year = int(year_entry.name)
+
+            with os.scandir(year_entry.path) as file_entries:
+                for file_entry in file_entries:
+                    parsed = parse_post_filename(file_entry.name)
+                    if parsed is None:
+                        continue
+                    post_id, timestamp, ext = parsed
+
+                    flags = posts.get(post_id)
+                    if flags is None:
+                        flags = posts[post_id] = [year, timestamp, 0, 0, 0, 0]
+                    flags[2 + FORMATS.index(ext)] = 1
+
+    board = os.path.basename(board_dir)
+    return [(board, post_id, *flags) for post_id, flags in posts.items()]
+
+
+def build_catalog(data_dir, board_name=None):
+    """
+    完整掃描 data_dir (或只掃 data_dir/board_name)，重建 catalog。
+    回傳: 總共記錄的文章數
+    """
+    data_dir = Path(data_dir)
+    conn = _get_connection(data_dir, create=True)
+
+    if board_name is None:
+        board_dirs = [entry.path for entry in os.scandir(data_dir) if entry.is_dir()]
+    else:
+        board_dirs = [str(data_dir / board_name)]
+
+    total = 0
+    for board_dir in board_dirs:
+        rows = _scan_board(board_dir)
+        board = os.path.basename(board_dir)
+
+        with conn:
+            conn.execute("DELETE FROM posts WHERE board = ?", (board,))
+            conn.executemany(
+                """
+                INSERT INTO posts (board, post_id, year, timestamp, has_html, has_json, has_vrt, has_xml)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+
+        logging.info("catalog: %s 版 %d 篇", board, len(rows))
+        total += len(rows)
+
+    return total
+
+
+def count_by_board_by_year(data_dir, board_name=None, ext="json"):
+    """
+    從 catalog 讀出各版各年份有幾篇 ext 格式的文章。
+
+    輸出: dict {board: [(year, n), ...]} (年份由小到大)
+    """
+    if ext not in FORMATS:
+        raise ValueError(f"不支援的格式: {ext}")
+
+    conn = _get_connection(Path(data_dir))
+    if conn is None:
+        raise FileNotFoundError(f"找不到 catalog: {catalog_path(data_dir)}")
+
+    sql = f"SELECT board, year, SUM(has_{ext}) FROM posts"
+    params = ()
+    if board_name is not None:
+        sql += " WHERE board = ?"
+        params = (board_name,)
+    sql += " GROUP BY board, year ORDER BY board, year"
+
+    results = {}
+    for board, year, n in conn.execute(sql, params):
+        results.setdefault(board, []).append((year, n))
+    return results
@@ -0,0 +1,86 @@
+import timeit
+
+
+# ckiptagger (WS / POS) 的長度分桶批次處理
+#
+# html2vrt_new.py 原本對每篇文章的標題、本文、每一則推文各呼叫一次 ws() / pos()，
+# 神經網路模型每次只看到幾句、長度差很多的句子，一個 batch 中大部分的計算都花在 padding 上。
+# BucketedTagger 收集很多篇文章的句子 (透過 seg_batch.SegBatcher)，依長度排序後切成 batch，
+# 同一個 batch 裡的句子長度相近；每個 batch 不超過 batch_sentences 句、
+# 補齊到最長一句之後不超過 batch_characters 字。做完再依原本的順序放回去。
+
+# CPU 上每個 batch 最多幾句
+DEFAULT_BATCH_SENTENCES = 256
+
+# 每個 batch 補齊 (padding) 之後最多幾個字，和 ckiptagger 內部的預設值相同，避免它再切開
+DEFAULT_BATCH_CHARACTERS = 16384
+
+
+class BucketedTagger(object):
+    """
+    ws / pos: ckiptagger 的 WS / POS 物件 (或相同介面的函數)
+
+    和 seg_batch.SegBatcher 的 seg_func 相同介面:
+    輸入 list of str，輸出 list of list of (word, pos)；空字串的結果為 []
+    """
+
+    def __init__(self, ws, pos, batch_sentences=DEFAULT_BATCH_SENTENCES,
+                 batch_characters=DEFAULT_BATCH_CHARACTERS, sentence_segmentation=True):
+        self.ws = ws
+        self.pos = pos
+        self.batch_sentences = batch_sentences
+        self.batch_characters = batch_characters
+        self.sentence_segmentation = sentence_segmentation
+
+        # 統計
+        self.n_calls = 0
+        self.n_sentences = 0
+        self.n_characters = 0
+        self.n_padded_characters = 0
+        self.seconds = 0.0
+
+    def batches(self, sentences):
+        """
+        輸出: 每個 batch 的句子 index (list of list of int)
+        """
+        order = sorted((i for i, s in enumerate(sentences) if s), key=lambda i: len(sentences[i]))
+
+        batch = []
+        for i in order:
+            # 依長度排序，所以加進來的這句就是 batch 中最長的
+            n_padded = (len(batch) + 1) * len(sentences[i])
+            if batch and (len(batch) >= self.batch_sentences or n_padded > self.batch_characters):
+                yield batch
+                batch = []
+            batch.append(i)
+
+        if batch:
+            yield batch
+
+    def __call__(self, sentences):
+        result = [[] for _ in sentences]
+
+        for index in self.batches(sentences):
+            batch = [sentences[i] for i in index]
+
+            t1 = timeit.default_timer()
+            word_sentence_list = self.ws(batch, sentence_segmentation=self.sentence_segmentation)
+            pos_sentence_list = self.pos(word_sentence_list)
+            t2 = timeit.default_timer()
+
+            self.n_calls += 1
+            self.n_sentences += len(batch)
+            self.n_characters += sum(len(s) for s in batch)
+            self.n_padded_characters += len(batch) * len(batch[-1])
+            self.seconds += t2 - t1
+
+            for i, words, tags in zip(index, word_sentence_list, pos_sentence_list):
+                result[i] = list(zip(words, tags))
+
+        return result
+
+    def report(self):
+        rate = self.n_sentences / self.seconds if self.seconds > 0 else 0.0
+        fill = self.n_characters / self.n_padded_characters if self.n_padded_characters else 0.0
+        return (f"{self.n_sentences} 句, {self.n_calls} 個 batch, {self.seconds:.2f} 秒, {rate:.1f} 句/秒, "
+                f"padding 後有效字數 {fill:.0%}")
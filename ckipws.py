@@ -39,6 +39,13 @@ class PyWordSeg(object):
         self.lib.WordSeg_Destroy(self.obj)
 
 def CKIP(ckipws_path):
+    # ws.ini 裡的資料路徑是相對於 CKIPWS 資料夾的，
+    # 所以初始化時暫時切換到該資料夾，初始化完就切回原本的工作目錄
+    ckipws_path = os.path.abspath(ckipws_path)
+    cwd = os.getcwd()
     os.chdir(ckipws_path)
-    return PyWordSeg('lib/libWordSeg.so', 'ws.ini')
+    try:
+        return PyWordSeg(os.path.join(ckipws_path, 'lib', 'libWordSeg.so'), 'ws.ini')
+    finally:
+        os.chdir(cwd)
 
@@ -1,25 +1,48 @@
 import os
 import re
-import json
 import logging
-from pathlib import Path
-from datetime import datetime
+from functools import partial
+import lxml.html
 from pyquery import PyQuery
 from html.parser import HTMLParser
 
+import catalog
+import metrics
+import watermark
+import post_model
+from post_model import Post, Comment
+from post_store import PostStore, PostStoreWriter
 
 
 
-def html2json(html_path):
+
+# PyQuery.text() 壓縮空白時所用的字元
+WHITESPACE_RE = re.compile('[\x20\x09\x0C\u200B\x0A\x0D]+')
+
+
+def html2json(html_path, engine="pyquery"):
     """
-    輸入： Path物件 (為.html檔的路徑)    
+    輸入： Path物件 (為.html檔的路徑)
+    engine: 使用的剖析器，見 ENGINES
     
     輸出：
     - 如果 輸入中找不到 #main-content，或者沒有主文，回傳 None
-    - 如果找得到，則正常回傳 parse 後的 post dict
+    - 如果找得到，則正常回傳 parse 後的 Post (見 post_model.py)
+    """
+    with metrics.stage("parse"):
+        post = ENGINES[engine](html_path)
+
+    if post is not None:
+        metrics.count_post(post, "parsed")
+    return post
+
+
+def html2json_pyquery(html_path):
+    """
+    用 PyQuery 剖析 (原本的做法)
     """
     
-    with open(html_path, "r") as f:
+    with metrics.stage("read"), open(html_path, "r") as f:
         html = f.read()
     
     pq = PyQuery(html).make_links_absolute('https://www.ptt.cc/bbs/')
@@ -29,6 +52,64 @@ def html2json(html_path):
     if len(html_pq_main_content) == 0:
         return None
 
+    # 抓出meta: 作者/標題/時間
+    meta = dict(
+        (_.text(), _.next().text())
+        for _
+        in pq('.article-meta-tag').items()
+    )
+
+    body = mod_content(
+        html_pq_main_content
+        .clone()
+        .children()
+        .remove('span[class^="article-meta-"]')
+        .remove('div.push')
+        .end()
+        .html()
+    )
+
+    comments = parse_comments(pq)
+
+    return _make_post(html_path, meta, body, comments)
+
+
+def html2json_lxml(html_path):
+    """
+    直接走訪一次 lxml 的樹，同時抽出 meta、主文文字和推文，
+    不需要 clone #main-content、序列化回 html 再給 MLStripper 剖析一次。
+    輸出和 html2json_pyquery() 相同。
+    """
+    
+    with metrics.stage("read"), open(html_path, "r") as f:
+        html = f.read()
+    
+    root = lxml.html.document_fromstring(html)
+    
+    walker = _LxmlWalker()
+    walker.walk(root, in_body=False)
+    
+    if not walker.found_main_content:
+        return None
+    
+    meta = dict(
+        (_squash_text(tag), _squash_text(tag.getnext()))
+        for tag
+        in walker.meta_tags
+    )
+    
+    body = clean_content(''.join(walker.body_parts))
+    
+    comments = parse_comments_lxml(walker.pushes)
+    
+    return _make_post(html_path, meta, body, comments)
+
+
+def _make_post(html_path, meta, body, comments):
+    """
+    各個剖析器共用：從檔名取得 post_id 等資訊，整理 meta 和主文，組成 Post
+    """
+
     ###################
     # PARSE META DATA #
     ###################
@@ -42,19 +123,6 @@ def html2json(html_path):
     # 在哪個版
     post_board = html_path.parent.parent.stem
 
-    # 抓出meta: 作者/標題/時間
-    meta = dict(
-        (_.text(), _.next().text())
-        for _
-        in pq('.article-meta-tag').items()
-    )
-
-    ref = {
-        '作者': 'author',
-        '標題': 'title',
-        '看板': 'board',
-    }
-
     if '作者' in meta:
         post_author = meta['作者'].strip().split(' ')[0]
     else:
@@ -65,22 +133,10 @@ def html2json(html_path):
     else:
         post_title = ""
 
-
-
     ######################
     # PARSE MAIN CONTENT #
     ######################
 
-    body = mod_content(
-        html_pq_main_content
-        .clone()
-        .children()
-        .remove('span[class^="article-meta-"]')
-        .remove('div.push')
-        .end()
-        .html()
-    )
-
     if body == '' or body is None:
         return None
 
@@ -93,25 +149,93 @@ def html2json(html_path):
     except Exception as e:
         print(e)
 
-    ###################
-    # PARSE COMMENTS  #
-    ###################
-    comments = parse_comments(pq)
-
-    post = {
-        "post_board": post_board,
-        "post_id": post_id,
-        "post_time": post_timestamp,
-        "post_title": post_title,
-        "post_author": post_author,
-        "post_body": body,
-        "post_vote": comments["post_vote"],
-        "comments": comments["comments"]
-    }
+    post = Post(
+        post_board=post_board,
+        post_id=post_id,
+        post_time=int(post_timestamp),
+        post_title=post_title,
+        post_author=post_author,
+        post_body=body,
+        post_vote=comments["post_vote"],
+        comments=comments["comments"]
+    )
 
 
     return post
 
+
+class _LxmlWalker(object):
+    """
+    走訪 lxml 樹一次，收集:
+    - meta_tags: 所有 .article-meta-tag 元素
+    - pushes: 所有 .push 元素
+    - body_parts: #main-content 內的文字，略過 span.article-meta-* 和 div.push
+      (相當於 PyQuery 的 .remove(...).html() 再用 MLStripper 去掉 tag)
+    """
+
+    def __init__(self):
+        self.found_main_content = False
+        self.meta_tags = []
+        self.pushes = []
+        self.body_parts = []
+
+    def walk(self, el, in_body):
+        for child in el:
+            # 註解等非元素節點，只留下後面的文字
+            if not isinstance(child.tag, str):
+                if in_body and child.tail:
+                    self.body_parts.append(child.tail)
+                continue
+
+            class_attr = child.get('class', '')
+            classes = class_attr.split()
+
+            if 'article-meta-tag' in classes:
+                self.meta_tags.append(child)
+            if 'push' in classes:
+                self.pushes.append(child)
+
+            child_in_body = in_body
+            if in_body:
+                if (child.tag == 'span' and class_attr.startswith('article-meta-')) \
+                        or (child.tag == 'div' and 'push' in classes):
+                    # 被移除的元素：略過內容，但保留後面的文字
+                    child_in_body = False
+                elif child.text:
+                    self.body_parts.append(child.text)
+
+            elif not self.found_main_content and child.get('id') == 'main-content':
+                self.found_main_content = True
+                child_in_body = True
+                if child.text:
+                    self.body_parts.append(child.text)
+
+            self.walk(child, child_in_body)
+
+            if in_body and child.tail:
+                self.body_parts.append(child.tail)
+
+
+def _squash_text(el):
+    """
+    等同 PyQuery 的 .text()：取出元素內所有文字並壓縮空白
+    """
+    if el is None:
+        return ''
+    return WHITESPACE_RE.sub(' ', ''.join(el.itertext())).strip()
+
+
+def _text_by_class(el, class_name):
+    """
+    等同 PyQuery 的 el('.class_name').text()
+    """
+    return ' '.join(
+        _squash_text(sub)
+        for sub in el.iter()
+        if isinstance(sub.tag, str) and class_name in sub.get('class', '').split()
+    )
+
+
 class MLStripper(HTMLParser):
     """HTML tag stripper.
 
@@ -139,7 +263,13 @@ class MLStripper(HTMLParser):
 
 def mod_content(content):
     """Remove unnecessary info from a PTT post."""
-    content = MLStripper.strip_tags(content)
+    with metrics.stage("clean"):
+        content = MLStripper.strip_tags(content)
+    return clean_content(content)
+
+@metrics.timed("clean")
+def clean_content(content):
+    """Remove PTT footer lines from tag-stripped post text."""
     content = re.sub(
         r"※ 發信站.*|※ 文章網址.*|※ 編輯.*", '', content
     ).strip('\r\n-')
@@ -163,14 +293,8 @@ def parse_comments(html_pq):
         }
         
         如果有，則回傳 dict {
-            "comments": [
-                {
-                    "author": <str>,
-                    "type": <str: "neg", "pos", "neu">,
-                    "content": <str>,
-                    "order": <int>
-                },
-            ]
+            "comments": list of Comment (見 post_model.py),
+            "post_vote": {"pos": <int>, "neg": <int>, "neu": <int>}
         }
     """
     comments = []
@@ -199,12 +323,12 @@ def parse_comments(html_pq):
         else:
             continue
 
-        comment = {
-            'type': type_table[comment_type],
-            'author': _('.push-userid').text().split(' ')[0],
-            'content': _('.push-content').text().lstrip(' :'),
-#             'order': i+1
-        }
+        comment = Comment(
+            type=type_table[comment_type],
+            author=_('.push-userid').text().split(' ')[0],
+            content=_('.push-content').text().lstrip(' :'),
+#             order=i+1
+        )
 
         comments.append(comment)
 
@@ -214,7 +338,336 @@ def parse_comments(html_pq):
         "post_vote": post_vote
     }
 
-def html2json_wrapper(html_path):
+def parse_comments_lxml(pushes):
+    """
+    和 parse_comments() 相同，但輸入為 lxml 的 .push 元素 list
+    """
+    comments = []
+    post_vote = {
+        "pos": 0,
+        "neg": 0,
+        "neu": 0
+    }
+    
+    type_table = {
+        "推": "pos",
+        "噓": "neg",
+        "→": "neu"
+    }
+    
+    for push in pushes:
+        comment_type = _text_by_class(push, 'push-tag')
+        
+        if comment_type not in type_table:
+            continue
+        post_vote[type_table[comment_type]] += 1
+
+        comments.append(Comment(
+            type=type_table[comment_type],
+            author=_text_by_class(push, 'push-userid').split(' ')[0],
+            content=_text_by_class(push, 'push-content').lstrip(' :'),
+        ))
+
+    return {
+        "comments": comments,
+        "post_vote": post_vote
+    }
+
+
+# 沒有結束標籤的元素
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+# 每次餵給 StreamingPostParser 的字元數
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingPostParser(HTMLParser):
+    """
+    事件式 (SAX style) 的 PTT 文章剖析器，可以一段一段 feed() 進來。
+    每剖析完一則推文就呼叫 on_comment(comment)，本身不保留推文，
+    所以推文再多，記憶體用量也只和主文長度有關。
+
+    剖析完 (close() 之後) 可取得:
+    - found_main_content: 是否有 #main-content
+    - meta: {meta標籤: 值}
+    - body_parts: 主文的文字片段
+    - post_vote: 推/噓/→ 的數量
+    """
+
+    type_table = {
+        "推": "pos",
+        "噓": "neg",
+        "→": "neu"
+    }
+
+    push_fields = ('push-tag', 'push-userid', 'push-content')
+
+    def __init__(self, on_comment):
+        super().__init__(convert_charrefs=True)
+        self.on_comment = on_comment
+
+        self.found_main_content = False
+        self.meta = {}
+        self.body_parts = []
+        self.post_vote = {
+            "pos": 0,
+            "neg": 0,
+            "neu": 0
+        }
+
+        # 每層元素: [tag, 結束時要做的事 (or None), 要收集文字的 buffer (or None)]
+        self._stack = []
+        # 目前正在收集文字的 buffer
+        self._captures = []
+        # #main-content 所在的深度 / 被移除的元素 (span.article-meta-*, div.push) 所在的深度
+        self._main_depth = None
+        self._skip_depth = None
+        # 目前的 .push 各欄位的文字
+        self._push = None
+        # 剛讀完 .article-meta-tag，等待它的下一個元素: (meta標籤, 深度)
+        self._pending_meta = None
+
+    def _in_body(self):
+        return self._main_depth is not None and self._skip_depth is None
+
+    def handle_starttag(self, tag, attrs):
+        depth = len(self._stack)
+
+        if self._pending_meta is not None and self._pending_meta[1] == depth:
+            key, _ = self._pending_meta
+            self._pending_meta = None
+            value_buf = []
+        else:
+            value_buf = None
+
+        attrs = dict(attrs)
+        class_attr = attrs.get('class') or ''
+        classes = class_attr.split()
+
+        if tag in VOID_ELEMENTS:
+            if value_buf is not None:
+                self.meta[key] = ''
+            return
+
+        on_close = []
+        buf = None
+
+        if value_buf is not None:
+            buf = value_buf
+            on_close.append(partial(self._close_meta_value, key))
+
+        if 'article-meta-tag' in classes:
+            buf = buf if buf is not None else []
+            on_close.append(self._close_meta_tag)
+
+        if 'push' in classes and self._push is None:
+            self._push = {field: [] for field in self.push_fields}
+            on_close.append(self._close_push)
+
+        if self._push is not None:
+            for field in self.push_fields:
+                if field in classes:
+                    buf = buf if buf is not None else []
+                    on_close.append(partial(self._close_push_field, field))
+
+        if self._in_body():
+            if (tag == 'span' and class_attr.startswith('article-meta-')) \
+                    or (tag == 'div' and 'push' in classes):
+                self._skip_depth = depth
+        elif self._main_depth is None and not self.found_main_content and attrs.get('id') == 'main-content':
+            self.found_main_content = True
+            self._main_depth = depth
+
+        if buf is not None:
+            self._captures.append(buf)
+        self._stack.append((tag, on_close, buf))
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> 之類自己結束的元素，不需要推進堆疊
+        if tag not in VOID_ELEMENTS:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+        else:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        # 找不到對應的開始標籤就忽略；中間沒關閉的元素一併關閉
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                break
+        else:
+            return
+
+        while len(self._stack) > i:
+            self._pop()
+
+    def _pop(self):
+        _, on_close, buf = self._stack.pop()
+        depth = len(self._stack)
+
+        if buf is not None:
+            self._captures.remove(buf)
+            text = WHITESPACE_RE.sub(' ', ''.join(buf)).strip()
+        else:
+            text = None
+
+        for f in on_close:
+            f(text)
+
+        if self._skip_depth == depth:
+            self._skip_depth = None
+        if self._main_depth == depth:
+            self._main_depth = None
+        if self._pending_meta is not None and self._pending_meta[1] > depth:
+            # 母元素已經結束，.article-meta-tag 後面沒有元素了
+            self.meta[self._pending_meta[0]] = ''
+            self._pending_meta = None
+
+    def _close_meta_tag(self, text):
+        self._pending_meta = (text, len(self._stack))
+
+    def _close_meta_value(self, key, text):
+        self.meta[key] = text
+
+    def _close_push_field(self, field, text):
+        self._push[field].append(text)
+
+    def _close_push(self, _):
+        push = {field: ' '.join(texts) for field, texts in self._push.items()}
+        self._push = None
+
+        comment_type = push['push-tag']
+        if comment_type not in self.type_table:
+            return
+        self.post_vote[self.type_table[comment_type]] += 1
+
+        self.on_comment(Comment(
+            type=self.type_table[comment_type],
+            author=push['push-userid'].split(' ')[0],
+            content=push['push-content'].lstrip(' :'),
+        ))
+
+    def handle_data(self, d):
+        for buf in self._captures:
+            buf.append(d)
+        if self._in_body():
+            self.body_parts.append(d)
+
+    def close(self):
+        super().close()
+        while self._stack:
+            self._pop()
+
+
+def parse_post_stream(html_path, on_comment):
+    """
+    一段一段讀入 html_path 並剖析，推文透過 on_comment(comment) 一則一則交出去。
+
+    輸出：
+    - 如果 輸入中找不到 #main-content，或者沒有主文，回傳 None
+    - 如果找得到，則回傳不含推文 (comments 為空 list) 的 Post
+    """
+    parser = StreamingPostParser(on_comment)
+
+    with open(html_path, "r") as f:
+        while True:
+            with metrics.stage("read"):
+                chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+
+    if not parser.found_main_content:
+        return None
+
+    body = clean_content(''.join(parser.body_parts))
+
+    return _make_post(html_path, parser.meta, body, {
+        "post_vote": parser.post_vote,
+        "comments": []
+    })
+
+
+def html2json_stream(html_path):
+    """
+    用 StreamingPostParser 剖析，回傳和 html2json_pyquery() 相同的 Post。
+    (推文會全部收集起來；要限制記憶體用量請用 html2json_stream_to_file())
+    """
+    comments = []
+    post = parse_post_stream(html_path, comments.append)
+    if post is not None:
+        post.comments = comments
+    return post
+
+
+def html2json_stream_to_file(html_path, json_path, layout="records"):
+    """
+    邊剖析邊把推文寫進 json_path，不在記憶體中保留推文。
+    推文會先寫到暫存檔，"comments" 之外的欄位在最後才寫入 (json 的 key 順序因此不同)。
+    layout="columns" 時每個欄位要寫成一個 array，推文的三個欄位會先收集起來 (仍不建立 Comment)，最後才寫入。
+    回傳: 和 html2json() 一樣，沒有主文時回傳 None (此時不會產生 json_path)
+    """
+    tmp_path = json_path.with_name(f"{json_path.name}.{os.getpid()}.tmp")
+
+    try:
+        with tmp_path.open("wb") as f:
+            n_comments = [0]
+
+            if layout == "columns":
+                columns = {"type": [], "author": [], "content": []}
+
+                def write_comment(comment):
+                    columns["type"].append(post_model.COMMENT_TYPES.index(comment.type))
+                    columns["author"].append(comment.author)
+                    columns["content"].append(comment.content)
+                    n_comments[0] += 1
+            else:
+                f.write(b'{"comments":[')
+
+                def write_comment(comment):
+                    if n_comments[0] > 0:
+                        f.write(b',')
+                    f.write(post_model.encode(comment))
+                    n_comments[0] += 1
+
+            post = parse_post_stream(html_path, write_comment)
+            if post is None:
+                return None
+
+            metrics.inc("posts_parsed")
+            metrics.inc("comments_parsed", n_comments[0])
+
+            if layout == "columns":
+                f.write(b'{"comments":' + post_model.encode(columns))
+            else:
+                f.write(b']')
+            for key, value in post.to_dict().items():
+                if key == "comments":
+                    continue
+                f.write(b',' + post_model.encode(key) + b':' + post_model.encode(value))
+            f.write(b'}')
+
+        os.replace(tmp_path, json_path)
+        return post
+
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+# 可用的剖析器 (html2json 的 engine 參數 / CLI 的 --engine)
+ENGINES = {
+    "pyquery": html2json_pyquery,
+    "lxml": html2json_lxml,
+    "stream": html2json_stream,
+}
+
+
+def html2json_wrapper(html_path, engine="pyquery", layout="records"):
     logging.info("開始處理: %s", html_path)
 
     # 即將要產生的.json檔路徑
@@ -223,21 +676,78 @@ def html2json_wrapper(html_path):
     # 如果該資料夾已經有 .json 檔了就跳過
     if json_path.is_file():
         logging.info("-- 已存在json檔: %s", json_path)
-        return
+        return "skipped"
 
     try:
-        json_result = html2json(html_path)
+        if engine == "stream":
+            # 串流模式直接把推文寫進 .json，不在記憶體中組出整個 post dict
+            with metrics.stage("parse"):
+                json_result = html2json_stream_to_file(html_path, json_path, layout=layout)
+        else:
+            json_result = html2json(html_path, engine=engine)
 
     except Exception as e:
         print(f"出問題檔案: {html_path}")
         print(f"錯誤訊息: {e}")
         logging.error("-- 執行 html2json() 出問題")
         logging.error("-- 錯誤訊息: %s", e)
+        return "failed"
    
     else:
         if json_result is None:
             logging.warning("-- 空白文!")
-            return
+            return "skipped"
 
-        with json_path.open("w") as f:
-            json.dump(json_result, f, ensure_ascii=False)
+        if engine != "stream":
+            with metrics.stage("write"), json_path.open("wb") as f:
+                post_model.dump(json_result, f, layout=layout)
+
+        catalog.record(json_path)
+        watermark.observe(html_path)
+        return "processed"
+
+
+def html2json_store_wrapper(store_dir, html_paths, engine="pyquery", codec=None):
+    """
+    一次處理多篇文章，結果寫進 post store (見 post_store.py)，不產生個別的 .json。
+    store 中已經有的文章會略過。
+    回傳: list of 狀態
+    """
+    store = PostStore(store_dir)
+    statuses = []
+    added = []
+
+    with PostStoreWriter(store_dir, codec=codec) as writer:
+        for html_path in html_paths:
+            logging.info("開始處理: %s", html_path)
+
+            post_id = html_path.stem.split('_')[-1]
+            if store.contains(post_id, html_path.parent.parent.name, html_path.parent.name):
+                logging.info("-- store 中已有: %s", post_id)
+                statuses.append("skipped")
+                continue
+
+            try:
+                json_result = html2json(html_path, engine=engine)
+            except Exception as e:
+                print(f"出問題檔案: {html_path}")
+                print(f"錯誤訊息: {e}")
+                logging.error("-- 執行 html2json() 出問題")
+                logging.error("-- 錯誤訊息: %s", e)
+                statuses.append("failed")
+                continue
+
+            if json_result is None:
+                logging.warning("-- 空白文!")
+                statuses.append("skipped")
+                continue
+
+            writer.add_file(html_path, json_result)
+            added.append(html_path)
+            statuses.append("processed")
+
+    # 確定寫進 store 之後才推進 watermark
+    for html_path in added:
+        watermark.observe(html_path)
+
+    return statuses
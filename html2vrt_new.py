@@ -6,6 +6,7 @@
 
 from pyquery import PyQuery
 import os
+import sys
 import re
 from datetime import datetime
 from ckiptagger import data_utils, construct_dictionary, WS, POS, NER
@@ -304,18 +305,10 @@ def parse_comments(html_pq):
 # In[66]:
 
 
-def is_not_chinese_char(char):
-    """
-    Python port of Moses' code to check for CJK character.
-
-    :param character: The character that needs to be checked.
-    :type character: char
-    :return: bool
-    """
-    return not (19968 <= ord(char) <= 40869)
-
-def no_chinese_char_at_all(string):
-    return all(map(is_not_chinese_char, string))
+from prefilter import preprocess_content
+from seg_batch import SegBatcher, post_sentence_fields, chunked
+from post_model import Post
+from ckiptagger_batch import BucketedTagger, DEFAULT_BATCH_SENTENCES, DEFAULT_BATCH_CHARACTERS
 
 
 # In[67]:
@@ -324,14 +317,9 @@ def no_chinese_char_at_all(string):
 def _preprocessing_content(string):
     """
     將ptt內文作為字串，篩掉那些非中文字，並回傳真正要丟入斷詞的list of strings
-    Input: content string
-    Output: list of valid string
+    (這裡以換行分隔句子)
     """
-    result = []
-    for sentence in string.split("\n"):
-        if not no_chinese_char_at_all(sentence.strip()):
-            result.append(sentence.strip())
-    return result
+    return preprocess_content(string, sep="\n")
 
 
 # In[68]:
@@ -413,10 +401,20 @@ def _render_tagged_tuple_to_string(list_of_list_of_tup):
 # In[77]:
 
 
-def structured_post_2_xml(structured_post):
+def structured_post_2_xml(structured_post, tagged_fields=None):
+    """
+    tagged_fields: 這篇文章已經斷好詞的欄位 (SegBatcher.segment_fields() 的輸出:
+    [標題, 本文, 推文1, 推文2, ...])；None 表示每個欄位各自呼叫 _seg_and_pos
+    """
     if structured_post is None:
         return ""
     
+    if tagged_fields is None:
+        tagged_fields = [
+            _seg_and_pos(field)
+            for field in post_sentence_fields(Post.from_dict(structured_post), _preprocessing_content)
+        ]
+    
     post_id = structured_post["post_id"]
     post_author = structured_post["post_author"]
     year = str(structured_post["post_time"].year)
@@ -426,21 +424,21 @@ def structured_post_2_xml(structured_post):
     pos = str(structured_post["post_vote"]["pos"])
     neu = str(structured_post["post_vote"]["neg"])
     
-    title_text = _render_tagged_tuple_to_string(_seg_and_pos([structured_post["post_title"]]))
+    title_text = _render_tagged_tuple_to_string(tagged_fields[0])
     
     #print(title_text)
     
-    body_text = _render_tagged_tuple_to_string(_seg_and_pos(_preprocessing_content(structured_post["post_body"])))
+    body_text = _render_tagged_tuple_to_string(tagged_fields[1])
     
     #print(body_text)
     
     comments_text = "\n"
     if len(structured_post['comments']) != 0:
-        for c in structured_post['comments']:
+        for c, tagged_comment in zip(structured_post['comments'], tagged_fields[2:]):
             comment_author = c["author"]
             comment_type = c["type"]
             comment_order = c["order"]
-            comment_text = _render_tagged_tuple_to_string(_seg_and_pos([c["content"]]))
+            comment_text = _render_tagged_tuple_to_string(tagged_comment)
             comments_text += f"""
 <text id="{post_id.replace('.', '_')}_comment_{comment_order}" type="comment" author="{comment_author}" c_type="{comment_type}">
 {comment_text}
@@ -467,6 +465,22 @@ def html_2_vrt(html_path):
     return structured_post_2_xml(parse_content(html_path))
 
 
+def html_2_vrt_chunk(html_paths):
+    """
+    一次處理多篇文章: 所有文章的句子交給 seg_batcher (BucketedTagger) 依長度分批斷詞，
+    輸出和逐篇呼叫 html_2_vrt() 再接起來相同
+    """
+    posts = [post for post in map(parse_content, html_paths) if post is not None]
+    tagged_posts = seg_batcher.segment_many([
+        post_sentence_fields(Post.from_dict(post), _preprocessing_content)
+        for post in posts
+    ])
+    return "".join(
+        structured_post_2_xml(post, tagged_fields)
+        for post, tagged_fields in zip(posts, tagged_posts)
+    )
+
+
 # # multiprocessing
 
 # In[1]:
@@ -479,10 +493,14 @@ def x(q):
 # In[41]:
 
 
-def mp_handler(output_path=None, glob_iter=None):
+def mp_handler(output_path=None, glob_iter=None, posts_per_batch=1):
     p = mp.Pool()
     with open(output_path, "w") as f:
-        for result in p.imap(html_2_vrt, glob_iter, chunksize=10):
+        if posts_per_batch > 1:
+            results = p.imap(html_2_vrt_chunk, chunked(glob_iter, posts_per_batch))
+        else:
+            results = p.imap(html_2_vrt, glob_iter, chunksize=10)
+        for result in results:
             print(result)
             f.write(result)
 
@@ -495,6 +513,7 @@ def mp_handler(output_path=None, glob_iter=None):
 if __name__ == "__main__":
     ws = None
     pos = None
+    seg_batcher = None
     
     parser = argparse.ArgumentParser(description="將一路徑底下的.html檔全部輸出到一個.vrt檔")
     parser.add_argument("-c", "--ckip-path", help="輸入ckiptagger的模型資料夾路徑", required=True)
@@ -503,6 +522,9 @@ if __name__ == "__main__":
     
     parser.add_argument("--use-gpu", help="如要使用GPU，請輸入這個參數", action="store_true")
     parser.add_argument("--use-mp", help="如要使用多進程，請輸入這個參數", action="store_true")
+    parser.add_argument("--posts-per-batch", help="每幾篇文章的句子合併起來依長度分批斷詞 (1 表示逐篇、逐欄位呼叫 ws/pos)", type=int, default=64)
+    parser.add_argument("--batch-size", help="ws/pos 每個 batch 最多幾句", type=int, default=DEFAULT_BATCH_SENTENCES)
+    parser.add_argument("--batch-chars", help="ws/pos 每個 batch 補齊後最多幾個字", type=int, default=DEFAULT_BATCH_CHARACTERS)
     args = parser.parse_args()
     
     # 是否使用 gpu 決定如何初始化 WS 和 POS
@@ -513,22 +535,35 @@ if __name__ == "__main__":
         ws = WS(args.ckip_path, disable_cuda=True)
         pos = POS(args.ckip_path, disable_cuda=True)
     
+    # 句子全部交給 BucketedTagger 自己分批，SegBatcher 不再切
+    tagger = BucketedTagger(ws, pos, batch_sentences=args.batch_size, batch_characters=args.batch_chars)
+    seg_batcher = SegBatcher(tagger, batch_size=sys.maxsize)
+    
     t1 = datetime.now()
     
     # 是否使用多進程
     if args.use_mp:
         # 加 filter() 確保是 .html 檔
         glob_iter = filter(lambda x: x.endswith(".html"), glob.iglob(f"{args.html_path}/**", recursive=True))
-        mp_handler(output_path=args.output, glob_iter=glob_iter)
+        mp_handler(output_path=args.output, glob_iter=glob_iter, posts_per_batch=args.posts_per_batch)
     else:
+        paths = (
+            os.path.join(root, file)
+            for root, _, files in os.walk(args.html_path)
+            for file in files
+            if file.endswith("html")
+        )
         with open(args.output, "w") as f:
-            for root, _, files in os.walk(args.html_path):
-                for file in files:
-                    if file.endswith("html"):
-                        path = os.path.join(root, file)
-                        f.write(html_2_vrt(path))
+            if args.posts_per_batch > 1:
+                for chunk in chunked(paths, args.posts_per_batch):
+                    f.write(html_2_vrt_chunk(chunk))
+            else:
+                for path in paths:
+                    f.write(html_2_vrt(path))
     
     t2 = datetime.now()
     print(t2 - t1)
+    if not args.use_mp:
+        print(f"斷詞統計: {tagger.report()}")
         
 
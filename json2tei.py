@@ -1,42 +1,20 @@
-import json
 import logging
 import sys
 import traceback
 from pathlib import Path
-from datetime import datetime
-from ckipws import CKIP
-
-ckip = CKIP("/home/don/CKIPWS_Linux")
-
-def is_not_chinese_char(char):
+import catalog
+import metrics
+import post_model
+import seg_worker
+from renderers import atomic_open, render_to_string, write_tei_post
+from seg_batch import SegBatcher, post_sentence_fields
+from post_store import read_current_block
+from prefilter import preprocess_content
+
+def _seg_and_pos(list_of_sentences, ckipws=None):
     """
-    Python port of Moses' code to check for CJK character.
-
-    :param character: The character that needs to be checked.
-    :type character: char
-    :return: bool
-    """
-    return not (19968 <= ord(char) <= 40869)
-
-def no_chinese_char_at_all(string):
-    return all(map(is_not_chinese_char, string))
-
-def _preprocessing_content(string):
-    """
-    將ptt內文作為字串，篩掉那些非中文字，並回傳真正要丟入斷詞的list of strings
-    Input: content string
-    Output: list of valid string
-    """
-    result = []
+    ckipws: PyWordSeg 物件，None 表示使用本進程的 (seg_worker.get_ckipws())
     
-    for sentence in string.split():
-        if not no_chinese_char_at_all(sentence.strip()):
-            result.append(sentence.strip())
-    return result
-
-
-def _seg_and_pos(list_of_sentences, ckipws):
-    """
     input: <List of String>
     ["我每天都在睡覺", "好喜歡寫程式"]
     
@@ -54,6 +32,9 @@ def _seg_and_pos(list_of_sentences, ckipws):
         ]
     ]
     """
+    if ckipws is None:
+        ckipws = seg_worker.get_ckipws()
+
     list_of_segmented_sentences = None
     result = []
     
@@ -97,151 +78,54 @@ def _seg_and_pos(list_of_sentences, ckipws):
     return result
 
 
-def _render_tagged_tuple_to_string(list_of_list_of_tup, post_body=False):
-    """
-    post_body: 如果是本文進來斷詞的話，因為本文是可以支援多行的，所以要在output時，要為每個句子的前後加上<s></s>
-    
-    Input: list of list of tuple
-    [
-        [
-            ("我", "Nd"),
-            ("跑", "VA"),
-            ...
-        ],
-        ...
-    ]
-     
-    Output: <str>
-    
-    我\tNd
-    跑\tVA
-    
-    """
-    
-    if len(list_of_list_of_tup) == 0:
-        return ""
-    elif len(list_of_list_of_tup) == 1:
-        # 如果是網址就不要出現
-        if list_of_list_of_tup[0][0][0].startswith("http"):
-            return ""
-        
-        result = ""
-        for word, pos in list_of_list_of_tup[0]:
-            if word == "<":
-                word = "&lt;"
-            elif word == ">":
-                word = "&gt;"
-            elif word =="&":
-                word = "&amp;"
-        
-            result += f'<w type="{pos}">{word}</w>\n'
-        return result
-#         return '\n'.join((f'<w type="{pos}">{word}</w>' for word, pos in list_of_list_of_tup[0]))
-    else:
-        result = "\n"
-        for sentence in list_of_list_of_tup:
-            result += "<s>\n"
-            for word, pos in sentence:
-                
-                
-                
-                if word.startswith("http"):
-                    continue
-                    
-                if word == "<":
-                    word = "&lt;"
-                    print(word)
-                elif word == ">":
-                    word = "&gt;"
-                elif word =="&":
-                    word = "&amp;"
-                
-                if post_body:
-                    result += f'                <w type="{pos}">{word}</w>\n'
-
-                else:
-                    result += f'                <w type="{pos}">{word}</w>\n'
-
-            result += "</s>\n"
-                
-        return result
+seg_batcher = seg_worker.register_batcher(SegBatcher(_seg_and_pos))
 
 
 def json2tei(json_path):
-    global ckip
-    with open(json_path, 'r') as f:
-        structured_post = json.load(f)
-    
-    post_id = structured_post["post_id"]
-    post_author = structured_post["post_author"]
-    post_board = structured_post["post_board"]
-    
-    
-    if not isinstance(structured_post["post_time"], int):
-        structured_post["post_time"] = int(structured_post["post_time"])
-    dt = datetime.fromtimestamp(structured_post["post_time"])
-    
-    year = str(dt.year)
-    month = str(dt.month)
-    day = str(dt.day)
-    neg = str(structured_post["post_vote"]["neg"])
-    pos = str(structured_post["post_vote"]["pos"])
-    neu = str(structured_post["post_vote"]["neg"])
-    
-    title_text = _render_tagged_tuple_to_string(_seg_and_pos([structured_post["post_title"]], ckip))
-    
-    body_text = _render_tagged_tuple_to_string(_seg_and_pos(_preprocessing_content(structured_post["post_body"]), ckip), post_body=True)
+    return structured_post2tei(*load_and_segment(json_path))
+
+
+def load_and_segment(json_path):
+    """
+    讀入 .json 並斷詞
+    輸出: (structured_post, tagged_fields)
+    """
+    with metrics.stage("read"), open(json_path, 'rb') as f:
+        structured_post = post_model.load(f)
     
-    comments_text = "\n"
-    if len(structured_post['comments']) != 0:
-        for c in structured_post['comments']:
-            comment_author = c["author"]
-            comment_type = c["type"]
-#             comment_order = c["order"]
-            comment_text = _render_tagged_tuple_to_string(_seg_and_pos([c["content"]], ckip))
-            comments_text += f"""
-<comment author="{comment_author}" c_type="{comment_type}">
-<s>
-{comment_text}
-</s>
-</comment>
-"""
+    # 標題、本文、所有推文合併成一次(或少數幾次)斷詞
+    tagged_fields = seg_batcher.segment_fields(post_sentence_fields(structured_post, preprocess_content))
     
-    return f"""<TEI.2>
-    <teiHeader>
-        <metadata name="author">{post_author}</metadata>
-        <metadata name="post_id">{post_id}</metadata>
-        <metadata name="year">{year}</metadata>
-        <metadata name="board">{post_board}</metadata>
-    </teiHeader>
-    <text>
-        <title author="{post_author}">
-            <s>
-                {title_text}
-            </s>
-        </title>
-        <body author="{post_author}">
-                {body_text}
-        </body>
-        {comments_text}
-    </text>
-</TEI.2>"""
+    return structured_post, tagged_fields
+
+
+def structured_post2tei(structured_post, tagged_fields):
+    """
+    tagged_fields: SegBatcher.segment_fields() 的輸出
+    [標題的斷詞結果, 本文的斷詞結果, 推文1的斷詞結果, ...]
+    """
+    return render_to_string(write_tei_post, structured_post, tagged_fields)
 
 
 def json2tei_wrapper(output_path, json_path):
 
     logging.info("開始處理: %s", json_path)
 
-    # 即將要產生的.xml檔路徑
+    # 即將要產生的.xml檔路徑 (寫在 output_path 底下)
     tei_path = json_path.with_suffix(".xml")
+    output_tei_path = Path(output_path) / tei_path.name
 
-    # 如果該資料夾已經有 .json 檔了就跳過
-    if tei_path.is_file():
-        logging.info("-- 已存在tei(xml)檔: %s", tei_path)
-        return
+    # 如果輸出的資料夾已經有 .xml 檔了就跳過
+    if output_tei_path.is_file():
+        logging.info("-- 已存在tei(xml)檔: %s", output_tei_path)
+        return "skipped"
 
     try:
-        tei_result = json2tei(json_path)
+        structured_post, tagged_fields = load_and_segment(json_path)
+
+        # 直接寫進檔案 (先寫暫存檔，完成後才改名)
+        with atomic_open(output_tei_path) as f:
+            write_tei_post(f, structured_post, tagged_fields)
 
     except Exception as e:
         print(f"出問題檔案: {json_path}")
@@ -257,12 +141,112 @@ def json2tei_wrapper(output_path, json_path):
         funcName = lastCallStack[2] #取得發生的函數名稱
         errMsg = "File \"{}\", line {}, in {}: [{}] {}".format(fileName, lineNum, funcName, error_class, detail)
         print(errMsg)
+        return "failed"
    
     else:
 #         if json_result is None:
 #             logging.warning("-- 空白文!")
 #             return
-        output_path = Path(output_path) / tei_path.name
-        
-        with output_path.open("w") as f:
-            f.write(tei_result)
\ No newline at end of file
+
+        # 記錄實際寫出的檔案 (輸出的資料夾不在 data_dir 底下時不會有 catalog，什麼都不做)
+        catalog.record(output_tei_path)
+        return "processed"
+
+
+def json2tei_chunk_wrapper(output_path, json_paths):
+    """
+    一次處理多篇文章：所有文章的句子合併起來斷詞 (每 seg_batcher.batch_size 句呼叫一次)，
+    再分別寫出各自的 .xml。
+    """
+
+    statuses = []
+    posts = []
+    for json_path in json_paths:
+
+        logging.info("開始處理: %s", json_path)
+        tei_path = Path(output_path) / json_path.with_suffix(".xml").name
+
+        if tei_path.is_file():
+            logging.info("-- 已存在tei(xml)檔: %s", tei_path)
+            statuses.append("skipped")
+            continue
+
+        try:
+            with metrics.stage("read"), open(json_path, 'rb') as f:
+                posts.append((json_path, post_model.load(f)))
+        except Exception as e:
+            print(f"出問題檔案: {json_path}")
+            print(f"錯誤訊息: {e}")
+            logging.error("-- 讀取 json 出問題: %s", e)
+            statuses.append("failed")
+
+    return statuses + json2tei_posts(output_path, posts)
+
+
+def json2tei_store_wrapper(output_path, block_ref):
+    """
+    處理 post store 中的一個 block (見 post_store.py)，.xml 寫到 output_path
+    """
+
+    statuses = []
+    posts = []
+    for name, structured_post in read_current_block(block_ref):
+
+        tei_path = Path(output_path) / f"{name}.xml"
+
+        if tei_path.is_file():
+            logging.info("-- 已存在tei(xml)檔: %s", tei_path)
+            statuses.append("skipped")
+            continue
+
+        posts.append((tei_path.with_suffix(".json"), structured_post))
+
+    return statuses + json2tei_posts(output_path, posts)
+
+
+def json2tei_posts(output_path, posts):
+    """
+    posts: list of (json_path, structured_post)，.xml 寫到 output_path
+    所有文章的句子合併起來斷詞，再分別寫出各自的 .xml。
+    如果合併斷詞失敗，改成一篇一篇斷詞。
+    回傳: list of 狀態
+    """
+
+    if len(posts) == 0:
+        return []
+
+    try:
+        tagged_posts = seg_batcher.segment_many([
+            post_sentence_fields(structured_post, preprocess_content)
+            for _, structured_post in posts
+        ])
+
+    except Exception as e:
+        logging.error("-- 合併斷詞出問題，改為逐篇處理: %s", e)
+        tagged_posts = None
+
+    statuses = []
+    for i, (json_path, structured_post) in enumerate(posts):
+        tei_path = json_path.with_suffix(".xml")
+
+        try:
+            if tagged_posts is not None:
+                tagged_fields = tagged_posts[i]
+            else:
+                tagged_fields = seg_batcher.segment_fields(post_sentence_fields(structured_post, preprocess_content))
+
+            output_tei_path = Path(output_path) / tei_path.name
+            with atomic_open(output_tei_path) as f:
+                write_tei_post(f, structured_post, tagged_fields)
+        except Exception as e:
+            print(f"出問題檔案: {json_path}")
+            print(f"錯誤訊息: {e}")
+            logging.error("-- 執行 write_tei_post() 出問題: %s", e)
+            statuses.append("failed")
+            continue
+
+        catalog.record(output_tei_path)
+        statuses.append("processed")
+
+    logging.info("-- 斷詞統計: %s", seg_batcher.report())
+    return statuses
@@ -0,0 +1,252 @@
+import os
+import json
+import heapq
+import timeit
+import bisect
+import functools
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# 各處理階段的統計
+#
+# 每個進程有一個 current (Metrics)，程式各處用 stage() / inc() 記錄:
+# - 各階段 (read, parse, clean, segment, render, write ...) 花的時間。
+#   階段可以巢狀，每個階段只算自己的時間 (不含裡面的階段)，所以各階段加起來就是總時間
+# - 計數器 (files, posts_parsed, comments_parsed, sentences, tokens, bytes ...)
+# - 每個檔案處理時間的 histogram 和最慢的前 N 個檔案 (由 parallel.run_tasks 記錄)
+#
+# 多進程時 worker 每做完一個 chunk 就用 take() 把統計交回主進程合併 (見 parallel.py)。
+# 最後可以輸出成 json，或 Prometheus node_exporter 的 textfile (.prom)。
+
+# 每個檔案處理時間 (秒) 的 histogram 分界
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 保留最慢的幾個檔案
+SLOWEST_N = 20
+
+PROMETHEUS_PREFIX = "ptt_helper"
+
+
+class Metrics(object):
+
+    def __init__(self, slowest_n=SLOWEST_N):
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.counters = {}
+
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+        self.slowest_n = slowest_n
+        # min-heap of (秒數, 檔案)
+        self.slowest = []
+
+        # 進行中的階段: list of [名稱, 開始時間, 內層階段花的時間]
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        frame = [name, timeit.default_timer(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            elapsed = timeit.default_timer() - frame[1]
+            self._stack.pop()
+
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed - frame[2]
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe_file(self, item, seconds):
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        self.latency_count += 1
+
+        entry = (seconds, str(item))
+        if len(self.slowest) < self.slowest_n:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def merge(self, other):
+        for name, seconds in other.stage_seconds.items():
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+        for name, calls in other.stage_calls.items():
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + calls
+        for name, n in other.counters.items():
+            self.inc(name, n)
+
+        self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+        self.latency_sum += other.latency_sum
+        self.latency_count += other.latency_count
+
+        for entry in other.slowest:
+            if len(self.slowest) < self.slowest_n:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+        return self
+
+    def __getstate__(self):
+        # 傳回主進程時不需要進行中的階段
+        state = self.__dict__.copy()
+        state["_stack"] = []
+        return state
+
+    def to_dict(self):
+        return {
+            "stages": {
+                name: {"seconds": self.stage_seconds[name], "calls": self.stage_calls[name]}
+                for name in sorted(self.stage_seconds)
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "file_latency": {
+                "buckets": {
+                    str(le): n
+                    for le, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.latency_buckets)
+                },
+                "sum": self.latency_sum,
+                "count": self.latency_count,
+            },
+            "slowest": [
+                {"file": item, "seconds": seconds}
+                for seconds, item in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def prometheus_text(self, labels=None, prefix=PROMETHEUS_PREFIX):
+        labels = labels or {}
+
+        def fmt_labels(**extra):
+            items = {**labels, **extra}
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items.items()) + "}"
+
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Time spent in each stage (excluding nested stages).",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        for name in sorted(self.stage_seconds):
+            lines.append(f"{prefix}_stage_seconds_total{fmt_labels(stage=name)} {self.stage_seconds[name]:.6f}")
+
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Number of times each stage ran.",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        for name in sorted(self.stage_calls):
+            lines.append(f"{prefix}_stage_calls_total{fmt_labels(stage=name)} {self.stage_calls[name]}")
+
+        lines += [
+            f"# HELP {prefix}_items_total Items processed (files, posts, sentences, tokens, bytes ...).",
+            f"# TYPE {prefix}_items_total counter",
+        ]
+        for name in sorted(self.counters):
+            lines.append(f"{prefix}_items_total{fmt_labels(item=name)} {self.counters[name]}")
+
+        lines += [
+            f"# HELP {prefix}_file_latency_seconds Time to process one file.",
+            f"# TYPE {prefix}_file_latency_seconds histogram",
+        ]
+        cumulative = 0
+        for le, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.latency_buckets):
+            cumulative += n
+            lines.append(f"{prefix}_file_latency_seconds_bucket{fmt_labels(le=le)} {cumulative}")
+        lines.append(f"{prefix}_file_latency_seconds_sum{fmt_labels()} {self.latency_sum:.6f}")
+        lines.append(f"{prefix}_file_latency_seconds_count{fmt_labels()} {self.latency_count}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        lines = []
+        if self.stage_seconds:
+            lines.append("各階段時間:")
+        for name, seconds in sorted(self.stage_seconds.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"- {name}: {seconds:.2f} 秒 ({self.stage_calls[name]} 次)")
+        if self.counters:
+            lines.append("計數: " + ", ".join(f"{name} {n}" for name, n in sorted(self.counters.items())))
+        if self.slowest:
+            lines.append("最慢的檔案:")
+            lines.extend(f"- {seconds:.3f} 秒 {item}" for seconds, item in sorted(self.slowest, reverse=True)[:5])
+        return "\n".join(lines)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _atomic_write_text(path, text):
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# 本進程的統計
+current = Metrics()
+
+
+def stage(name):
+    return current.stage(name)
+
+
+def inc(name, n=1):
+    current.inc(name, n)
+
+
+def timed(name):
+    """
+    decorator: 整個函數算作 name 階段
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with current.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_post(structured_post, suffix):
+    """
+    計數一篇文章和它的推文 (suffix: "parsed" / "segmented" ...)
+    """
+    current.inc(f"posts_{suffix}")
+    current.inc(f"comments_{suffix}", len(structured_post.comments))
+
+
+def reset():
+    global current
+    current = Metrics()
+
+
+def take():
+    """
+    取出本進程到目前為止的統計並重新開始 (worker 交回主進程用)
+    """
+    global current
+    taken, current = current, Metrics()
+    return taken
+
+
+def export(json_path=None, prom_path=None, labels=None, metrics=None):
+    """
+    把 metrics (預設為本進程的統計) 輸出成 json 和 / 或 Prometheus textfile
+    """
+    metrics = metrics or current
+
+    if json_path is not None:
+        data = {"labels": labels or {}, **metrics.to_dict()}
+        _atomic_write_text(json_path, json.dumps(data, indent=2, ensure_ascii=False))
+
+    if prom_path is not None:
+        # node_exporter 的 textfile collector 只讀完整的檔案，所以先寫暫存檔再改名
+        _atomic_write_text(prom_path, metrics.prometheus_text(labels=labels))
@@ -0,0 +1,296 @@
+import os
+import sys
+import signal
+import logging
+import threading
+import timeit
+import multiprocessing as mp
+from functools import partial
+
+import metrics
+from seg_batch import chunked
+
+
+# 共用的平行處理
+#
+# html2json / json2vrt / json2tei 都用 run_tasks() 派工作：
+# - 工作是從 iterator 一點一點取出來的 (不會一開始就把整個 rglob 塞進 pool)，
+#   同時在 pool 裡的 chunk 數不超過 max_in_flight
+# - 每個工作的結果都會收回來，統計成功/略過/失敗的數量
+# - 邊跑邊印出 檔/秒、MB/秒 和預估剩餘時間
+#
+# 工作函數 (func) 回傳:
+# - "processed" / "skipped" / "failed" 其中之一
+# - 或以上狀態的 list (一次處理多個檔案的函數，例如 json2vrt_chunk_wrapper)
+# func 丟出例外的話視為 "failed"。
+#
+# 每個檔案的處理時間記進 metrics.current (histogram、最慢的檔案)；
+# 多進程時每個 chunk 做完就把 worker 的 metrics 交回主進程合併。
+
+PROCESSED = "processed"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# 最多保留幾個失敗的工作，在最後列出來
+MAX_FAILED_ITEMS = 20
+
+# 進度最多每幾秒印一次
+PROGRESS_INTERVAL = 1.0
+
+
+def _item_bytes(item):
+    # 有 nbytes 的工作 (例如 post_store.BlockRef) 自己知道大小
+    nbytes = getattr(item, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(item, (list, tuple)):
+        return sum(_item_bytes(i) for i in item)
+    try:
+        return os.path.getsize(item)
+    except (OSError, TypeError):
+        return 0
+
+
+def _item_files(item):
+    # 一次處理多個檔案的工作 (例如 --posts-per-batch 的 chunk) 是 list of 檔案
+    if isinstance(item, (list, tuple)):
+        return list(item)
+    return [item]
+
+
+def _run_one(func, item):
+    """
+    執行一個工作，回傳 (item, list of 狀態, 輸入的 bytes)
+    """
+    t1 = timeit.default_timer()
+    try:
+        status = func(item)
+    except Exception as e:
+        logging.error("-- 工作失敗 %s: %s", item, e)
+        status = FAILED
+    t2 = timeit.default_timer()
+
+    if status is None:
+        status = PROCESSED
+    if isinstance(status, str):
+        statuses = [status]
+    else:
+        statuses = list(status)
+
+    nbytes = _item_bytes(item)
+
+    # 一個工作是多個檔案時，時間平均分給每個檔案，histogram 和最慢的檔案才是以檔案為單位
+    files = _item_files(item)
+    for path in files:
+        metrics.current.observe_file(path, (t2 - t1) / len(files))
+    metrics.inc("files", len(statuses))
+    metrics.inc("bytes", nbytes)
+
+    return item, statuses, nbytes
+
+
+def _run_chunk(func, chunk):
+    """
+    在 worker 中執行: 回傳 (結果, 這個 chunk 的 metrics)
+    """
+    results = [_run_one(func, item) for item in chunk]
+    return results, metrics.take()
+
+
+def _init_worker(initializer, initargs):
+    # Ctrl-C 由主進程處理 (結束 pool)，worker 不要在工作做到一半時被打斷
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # fork 出來的 worker 會帶著主進程的 metrics，先清掉以免重複計算
+    metrics.reset()
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class RunStats(object):
+
+    def __init__(self, total=None, desc=""):
+        self.total = total
+        self.desc = desc
+
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.failed_items = []
+
+        self._lock = threading.Lock()
+        self._t_start = timeit.default_timer()
+        self._t_end = None
+        self._last_print = 0.0
+
+    @property
+    def done(self):
+        return self.processed + self.skipped + self.failed
+
+    @property
+    def elapsed(self):
+        end = self._t_end if self._t_end is not None else timeit.default_timer()
+        return end - self._t_start
+
+    def add(self, results):
+        with self._lock:
+            for item, statuses, nbytes in results:
+                for status in statuses:
+                    if status == PROCESSED:
+                        self.processed += 1
+                    elif status == SKIPPED:
+                        self.skipped += 1
+                    else:
+                        self.failed += 1
+                if FAILED in statuses and len(self.failed_items) < MAX_FAILED_ITEMS:
+                    self.failed_items.append(item)
+                self.bytes += nbytes
+
+    def progress_line(self):
+        elapsed = self.elapsed
+        files_per_sec = self.done / elapsed if elapsed > 0 else 0.0
+        mb_per_sec = self.bytes / 1e6 / elapsed if elapsed > 0 else 0.0
+
+        line = f"{self.desc} 已處理 {self.done}"
+        if self.total:
+            line += f"/{self.total}"
+        line += f" (成功 {self.processed}, 略過 {self.skipped}, 失敗 {self.failed})"
+        line += f" {files_per_sec:.1f} 檔/秒, {mb_per_sec:.2f} MB/秒"
+
+        if self.total and files_per_sec > 0:
+            eta = max(self.total - self.done, 0) / files_per_sec
+            line += f", 預估剩餘 {eta:.0f} 秒"
+        return line
+
+    def print_progress(self, force=False):
+        now = timeit.default_timer()
+        if not force and now - self._last_print < PROGRESS_INTERVAL:
+            return
+        self._last_print = now
+        print(f"\r{self.progress_line()}", end="", file=sys.stderr, flush=True)
+
+    def finish(self):
+        self._t_end = timeit.default_timer()
+        self.print_progress(force=True)
+        print(file=sys.stderr)
+
+    def summary(self):
+        lines = [
+            "=================",
+            f"成功: {self.processed}",
+            f"略過: {self.skipped}",
+            f"失敗: {self.failed}",
+            f"讀入: {self.bytes / 1e6:.1f} MB",
+            f"總處理時間: {self.elapsed} 秒",
+        ]
+        if self.failed_items:
+            lines.append("失敗的工作 (部分):")
+            lines.extend(f"- {item}" for item in self.failed_items)
+        return "\n".join(lines)
+
+
+class TaskPool(object):
+    """
+    持續派工作給 worker 的 pool (run_tasks 和 watcher.py 共用)
+
+    func: 工作函數 (多進程時必須可以 pickle，即 module 層級的函數或 functools.partial)
+    stats: RunStats，每個工作的結果都加進去
+    use_mp: 是否使用多進程；否則 submit() 直接在主進程中執行
+    processes: 進程數，預設為 CPU 數
+    initializer / initargs: 每個 worker 啟動時執行 (單進程模式下在主進程執行一次)
+    max_in_flight: 同時在 pool 中的 chunk 數上限 (submit() 會等)，預設為進程數的 4 倍
+    """
+
+    def __init__(self, func, stats, use_mp=False, processes=None, initializer=None, initargs=(),
+                 max_in_flight=None):
+        self.func = func
+        self.stats = stats
+        self.pool = None
+
+        if not use_mp:
+            self.processes = 1
+            if initializer is not None:
+                initializer(*initargs)
+            return
+
+        self.processes = processes or mp.cpu_count()
+        self.in_flight = threading.BoundedSemaphore(max_in_flight or self.processes * 4)
+        self.pool = mp.Pool(self.processes, initializer=_init_worker, initargs=(initializer, initargs))
+
+    def submit(self, chunk):
+        """
+        chunk: list of 工作
+        """
+        if self.pool is None:
+            for item in chunk:
+                self.stats.add([_run_one(self.func, item)])
+                self.stats.print_progress()
+            return
+
+        self.in_flight.acquire()
+        self.pool.apply_async(_run_chunk, (self.func, chunk), callback=self._on_done,
+                              error_callback=partial(self._on_error, chunk))
+
+    def _on_done(self, chunk_result):
+        results, chunk_metrics = chunk_result
+        metrics.current.merge(chunk_metrics)
+        self.stats.add(results)
+        self.stats.print_progress()
+        self.in_flight.release()
+
+    def _on_error(self, chunk, e):
+        # _run_chunk 已經接住 func 的例外，會到這裡的是 pickle 之類的問題
+        # chunk 中的每個檔案都算失敗 (stats.total 是檔案數)
+        logging.error("-- chunk 執行失敗: %s", e)
+        self.stats.add([(item, [FAILED] * len(_item_files(item)), 0) for item in chunk])
+        self.stats.print_progress()
+        self.in_flight.release()
+
+    def close(self):
+        """
+        等所有送出的工作做完
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def terminate(self):
+        if self.pool is not None:
+            self.pool.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        self.terminate()
+
+
+def run_tasks(func, items, use_mp=False, processes=None, initializer=None, initargs=(),
+              chunksize=16, max_in_flight=None, total=None, desc=""):
+    """
+    func: 工作函數 (多進程時必須可以 pickle，即 module 層級的函數或 functools.partial)
+    items: 工作的 iterator (例如 data_dir.rglob("*.html"))
+    use_mp: 是否使用多進程
+    processes: 進程數，預設為 CPU 數
+    initializer / initargs: 每個 worker 啟動時執行 (單進程模式下在主進程執行一次)
+    chunksize: 每次派給 worker 幾個工作
+    max_in_flight: 同時在 pool 中的 chunk 數上限，預設為進程數的 4 倍
+    total: 工作總數 (知道的話才能估計剩餘時間)
+
+    回傳: RunStats
+    """
+    stats = RunStats(total=total, desc=desc)
+
+    with TaskPool(func, stats, use_mp=use_mp, processes=processes, initializer=initializer,
+                  initargs=initargs, max_in_flight=max_in_flight) as pool:
+        if use_mp:
+            for chunk in chunked(items, chunksize):
+                pool.submit(chunk)
+        else:
+            for item in items:
+                pool.submit([item])
+
+    stats.finish()
+    return stats
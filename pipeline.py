@@ -0,0 +1,198 @@
+import logging
+from pathlib import Path
+
+import catalog
+import post_model
+import watermark
+import seg_worker
+from html2json import html2json
+from json2tei import _seg_and_pos
+from prefilter import preprocess_content
+from seg_batch import SegBatcher, post_sentence_fields
+from renderers import atomic_open, write_vrt_post, write_tei_post
+
+
+# html -> (json) -> vrt / tei 一次完成
+#
+# 原本 html2json 先在每個 .html 旁寫出 .json，json2vrt / json2tei 再各自掃一次資料夾、
+# 重新讀入並 json.load 每個檔案 (而且兩者各斷詞一次)。
+# 這裡每篇文章只讀一次 .html：剖析 -> 斷詞一次 -> 直接寫出要的格式，
+# .json 只有在 keep_json=True 時才寫出。
+
+FORMATS = ("vrt", "tei")
+
+# 各格式的副檔名
+SUFFIXES = {
+    "json": ".json",
+    "vrt": ".vrt",
+    "tei": ".xml",
+}
+
+_WRITERS = {
+    "vrt": write_vrt_post,
+    "tei": write_tei_post,
+}
+
+seg_batcher = seg_worker.register_batcher(SegBatcher(_seg_and_pos))
+
+
+def output_paths(html_path, formats=("vrt",), keep_json=False, tei_dir=None):
+    """
+    輸出: dict {格式: 輸出路徑}
+    .json / .vrt 寫在 .html 旁邊；.xml 寫在 tei_dir (沒指定的話也是 .html 旁邊)
+    """
+    html_path = Path(html_path)
+
+    paths = {}
+    if keep_json:
+        paths["json"] = html_path.with_suffix(SUFFIXES["json"])
+    for fmt in formats:
+        if fmt not in _WRITERS:
+            raise ValueError(f"不支援的格式: {fmt} (可用: {', '.join(FORMATS)})")
+        path = html_path.with_suffix(SUFFIXES[fmt])
+        if fmt == "tei" and tei_dir is not None:
+            path = Path(tei_dir) / path.name
+        paths[fmt] = path
+    return paths
+
+
+def _pending_paths(html_path, formats, keep_json, tei_dir, overwrite=False):
+    """
+    只留下還沒有的輸出；全部都有的話回傳空 dict
+    overwrite: 已有的輸出也重新產生 (.html 有更新時)
+    """
+    paths = output_paths(html_path, formats=formats, keep_json=keep_json, tei_dir=tei_dir)
+    if overwrite:
+        return paths
+    for fmt, path in list(paths.items()):
+        if path.is_file():
+            logging.info("-- 已存在%s檔: %s", fmt, path)
+            del paths[fmt]
+    return paths
+
+
+def _write_outputs(structured_post, tagged_fields, paths, json_layout="records"):
+    """
+    依 paths 寫出各格式 (先寫暫存檔，完成後才改名)，並更新 catalog
+    (和 json2tei 相同，記錄的是實際寫出的路徑；tei_dir 不在 data_dir 底下時不會記錄，見 catalog.record())
+    json_layout: .json 推文的排列方式 (見 post_model.JSON_LAYOUTS)
+    """
+    for fmt, path in paths.items():
+        if fmt == "json":
+            with atomic_open(path, "wb") as f:
+                post_model.dump(structured_post, f, layout=json_layout)
+        else:
+            with atomic_open(path) as f:
+                _WRITERS[fmt](f, structured_post, tagged_fields)
+        catalog.record(path)
+
+
+def html2corpus_wrapper(html_path, formats=("vrt",), keep_json=False, tei_dir=None, engine="lxml", overwrite=False,
+                        json_layout="records"):
+    """
+    一篇文章: 剖析 .html、斷詞一次，寫出 formats 指定的格式
+    formats: "vrt" / "tei" 的組合
+    keep_json: 是否也寫出 .json
+    json_layout: .json 推文的排列方式 (見 post_model.JSON_LAYOUTS)
+    tei_dir: .xml 的輸出資料夾，None 表示寫在 .html 旁邊
+    engine: html2json 的剖析器
+    overwrite: 已有的輸出也重新產生
+    """
+    logging.info("開始處理: %s", html_path)
+
+    paths = _pending_paths(html_path, formats, keep_json, tei_dir, overwrite)
+    if len(paths) == 0:
+        return "skipped"
+
+    try:
+        structured_post = html2json(html_path, engine=engine)
+        if structured_post is None:
+            logging.warning("-- 空白文!")
+            return "skipped"
+
+        # 只要 .json 的話不必斷詞
+        tagged_fields = None
+        if any(fmt in _WRITERS for fmt in paths):
+            tagged_fields = seg_batcher.segment_fields(
+                post_sentence_fields(structured_post, preprocess_content)
+            )
+
+        _write_outputs(structured_post, tagged_fields, paths, json_layout)
+
+    except Exception as e:
+        print(f"出問題檔案: {html_path}")
+        print(f"錯誤訊息: {e}")
+        logging.error("-- 執行 html2corpus 出問題")
+        logging.error("-- 錯誤訊息: %s", e)
+        return "failed"
+
+    watermark.observe(html_path)
+    return "processed"
+
+
+def html2corpus_chunk_wrapper(html_paths, formats=("vrt",), keep_json=False, tei_dir=None, engine="lxml",
+                              overwrite=False, json_layout="records"):
+    """
+    一次處理多篇文章：所有文章的句子合併起來斷詞，再分別寫出。
+    如果合併斷詞失敗，改成一篇一篇用 html2corpus_wrapper() 處理。
+    """
+    options = dict(formats=formats, keep_json=keep_json, tei_dir=tei_dir, engine=engine, overwrite=overwrite,
+                   json_layout=json_layout)
+
+    statuses = []
+    posts = []
+    for html_path in html_paths:
+
+        logging.info("開始處理: %s", html_path)
+
+        paths = _pending_paths(html_path, formats, keep_json, tei_dir, overwrite)
+        if len(paths) == 0:
+            statuses.append("skipped")
+            continue
+
+        try:
+            structured_post = html2json(html_path, engine=engine)
+        except Exception as e:
+            print(f"出問題檔案: {html_path}")
+            print(f"錯誤訊息: {e}")
+            logging.error("-- 剖析 html 出問題: %s", e)
+            statuses.append("failed")
+            continue
+
+        if structured_post is None:
+            logging.warning("-- 空白文!")
+            statuses.append("skipped")
+            continue
+
+        posts.append((html_path, structured_post, paths))
+
+    if len(posts) == 0:
+        return statuses
+
+    try:
+        tagged_posts = seg_batcher.segment_many([
+            post_sentence_fields(structured_post, preprocess_content)
+            for _, structured_post, _ in posts
+        ])
+
+    except Exception as e:
+        logging.error("-- 合併斷詞出問題，改為逐篇處理: %s", e)
+        for html_path, _, _ in posts:
+            statuses.append(html2corpus_wrapper(html_path, **options))
+        return statuses
+
+    for (html_path, structured_post, paths), tagged_fields in zip(posts, tagged_posts):
+        try:
+            _write_outputs(structured_post, tagged_fields, paths, json_layout)
+        except Exception as e:
+            print(f"出問題檔案: {html_path}")
+            print(f"錯誤訊息: {e}")
+            logging.error("-- 寫出 %s 出問題: %s", html_path, e)
+            statuses.append("failed")
+            continue
+
+        watermark.observe(html_path)
+        statuses.append("processed")
+
+    logging.info("-- 斷詞統計: %s", seg_batcher.report())
+    return statuses
@@ -0,0 +1,387 @@
+import json
+from datetime import datetime
+from typing import Dict, List, Literal, Optional, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# 文章 (Post) 和推文 (Comment) 的資料結構，以及 .json 的讀寫
+#
+# 原本文章從 html2json 到 json2vrt / json2tei 一路都是 dict，post_time 有時是字串、有時是 int (html2vrt_new.py 中是 datetime)，
+# 每一則推文都是一個有 "type" / "author" / "content" 三個 key 的 dict，熱門文章一篇就有上千個。
+# 這裡改成固定欄位的物件，沒有 __dict__，一則推文佔用的記憶體不到 dict 的一半:
+# - 有安裝 msgspec 的話 Post / Comment 是 msgspec.Struct，decode() 直接從 json 建出物件並檢查欄位
+#   (不經過中間的 dict)，encode() 也由 msgspec 處理，兩者都比 json 模組快
+# - 沒有的話是一般的 __slots__ 類別，用 orjson (有安裝的話) 或 json 讀寫，再用 from_dict() 檢查欄位
+# 兩種實作的屬性、方法和 .json 的輸出都相同 (不加空白、不跳脫中文)。
+#
+# post_time 統一成 int (timestamp)；post_vote、comments 可以省略 (兩種實作的預設值相同)，
+# 其他欄位缺少或型別不對時丟出 PostFormatError。
+# .json 的格式和原本相同 (欄位名稱、順序都一樣)，只有 post_time 寫成 int；讀取時字串或 int 都可以。
+#
+# .json 的推文有兩種排列方式 (JSON_LAYOUTS)，讀取時兩種都接受:
+# - "records" (預設): 原本的格式，"comments" 是一則推文一個 object
+#     "comments": [{"type": "pos", "author": "a", "content": "..."}, ...]
+# - "columns": 推文很多時 key 佔了大半的檔案大小，改成每個欄位一個 array，
+#   type 用 COMMENT_TYPES 中的位置 (0 / 1 / 2) 表示；有 order 的話另外有 "order" 這個 array
+#     "comments": {"type": [0, ...], "author": ["a", ...], "content": ["...", ...]}
+
+COMMENT_TYPES = ("pos", "neg", "neu")
+
+JSON_LAYOUTS = ("records", "columns")
+
+POST_FIELDS = ("post_board", "post_id", "post_time", "post_title", "post_author", "post_body", "post_vote", "comments")
+
+# 其餘的欄位 (post_vote、comments) 可以省略，預設為 0 推 / 0 噓 / 0 →、沒有推文
+REQUIRED_FIELDS = POST_FIELDS[:-2]
+
+
+class PostFormatError(ValueError):
+    pass
+
+
+def _timestamp(post_time):
+    """
+    int / 數字字串 / datetime -> int
+    """
+    if type(post_time) is int:
+        return post_time
+    if isinstance(post_time, datetime):
+        return int(post_time.timestamp())
+    if isinstance(post_time, str) and post_time.isdigit():
+        return int(post_time)
+    raise PostFormatError(f"post_time 格式不正確: {post_time!r:.100}")
+
+
+def _check_columns(codes, authors, contents, orders):
+    """
+    "columns" 格式的推文，每個欄位的長度要相同
+    """
+    if len(authors) != len(codes) or len(contents) != len(codes) or (orders is not None and len(orders) != len(codes)):
+        raise PostFormatError("comments 各欄位的長度不同")
+
+
+def _check_vote(post_vote):
+    if not isinstance(post_vote, dict) or any(type(post_vote.get(key)) is not int for key in COMMENT_TYPES):
+        raise PostFormatError(f"post_vote 格式不正確: {post_vote!r:.100}")
+
+
+class _CommentMethods(object):
+    __slots__ = ()
+
+    def to_dict(self):
+        d = {"type": self.type, "author": self.author, "content": self.content}
+        if self.order is not None:
+            d["order"] = self.order
+        return d
+
+
+class _PostMethods(object):
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        d: .json 讀入的 dict (或 html2vrt_new.parse_content() 的輸出)
+        """
+        if not isinstance(d, dict):
+            raise PostFormatError(f"文章不是 json object: {type(d).__name__}")
+
+        missing = [field for field in REQUIRED_FIELDS if field not in d]
+        if missing:
+            raise PostFormatError(f"文章缺少欄位: {', '.join(missing)}")
+
+        if type(d["post_time"]) is not int:
+            d = dict(d, post_time=_timestamp(d["post_time"]))
+        return cls._from_dict(d)
+
+    def to_dict(self):
+        return {
+            "post_board": self.post_board,
+            "post_id": self.post_id,
+            "post_time": self.post_time,
+            "post_title": self.post_title,
+            "post_author": self.post_author,
+            "post_body": self.post_body,
+            "post_vote": self.post_vote,
+            "comments": [c.to_dict() for c in self.comments],
+        }
+
+
+if msgspec is not None:
+
+    class Comment(_CommentMethods, msgspec.Struct, omit_defaults=True, gc=False):
+        """
+        type: "pos" / "neg" / "neu"
+        order: 推文的順序 (html2json 輸出的推文沒有，None 表示依 list 中的順序)
+        """
+        type: Literal["pos", "neg", "neu"]
+        author: str
+        content: str
+        order: Optional[int] = None
+
+    class _CommentColumns(msgspec.Struct, gc=False):
+        """
+        "columns" 格式的推文 (只在讀檔時出現，Post.__post_init__ 會換成 list of Comment)
+        """
+        type: List[Literal[0, 1, 2]]
+        author: List[str]
+        content: List[str]
+        order: Optional[List[Optional[int]]] = None
+
+    class Post(_PostMethods, msgspec.Struct):
+        """
+        post_time: int (timestamp)
+        post_vote: {"pos": int, "neg": int, "neu": int}
+        comments: list of Comment (讀檔時也可以是 "columns" 格式，見上方說明)
+        """
+        post_board: str
+        post_id: str
+        post_time: int
+        post_title: str
+        post_author: str
+        post_body: str
+        post_vote: Dict[str, int] = msgspec.field(default_factory=lambda: {"pos": 0, "neg": 0, "neu": 0})
+        comments: Union[List[Comment], _CommentColumns] = msgspec.field(default_factory=list)
+
+        def __post_init__(self):
+            self.post_time = _timestamp(self.post_time)
+            _check_vote(self.post_vote)
+            if type(self.comments) is _CommentColumns:
+                self.comments = _comments_from_columns(self.comments)
+
+        @classmethod
+        def _from_dict(cls, d):
+            try:
+                return msgspec.convert(d, cls)
+            except msgspec.ValidationError as e:
+                raise PostFormatError(str(e)) from None
+
+    def _comments_from_columns(columns):
+        # type 的值已經由 msgspec 檢查過
+        _check_columns(columns.type, columns.author, columns.content, columns.order)
+        types = map(COMMENT_TYPES.__getitem__, columns.type)
+        if columns.order is None:
+            return list(map(Comment, types, columns.author, columns.content))
+        return list(map(Comment, types, columns.author, columns.content, columns.order))
+
+    # 讀檔時 post_time 可以是數字字串
+    _decoder = msgspec.json.Decoder(Post, strict=False)
+    _encoder = msgspec.json.Encoder()
+
+else:
+
+    class Comment(_CommentMethods):
+        """
+        type: "pos" / "neg" / "neu"
+        order: 推文的順序 (html2json 輸出的推文沒有，None 表示依 list 中的順序)
+        """
+
+        __slots__ = ("type", "author", "content", "order")
+
+        def __init__(self, type, author, content, order=None):
+            self.type = type
+            self.author = author
+            self.content = content
+            self.order = order
+
+        def __eq__(self, other):
+            if not isinstance(other, Comment):
+                return NotImplemented
+            return (self.type, self.author, self.content, self.order) == \
+                (other.type, other.author, other.content, other.order)
+
+        def __repr__(self):
+            return f"Comment(type={self.type!r}, author={self.author!r}, content={self.content!r})"
+
+    class Post(_PostMethods):
+        """
+        post_time: int (timestamp)
+        post_vote: {"pos": int, "neg": int, "neu": int}
+        comments: list of Comment
+        """
+
+        __slots__ = POST_FIELDS
+
+        def __init__(self, post_board, post_id, post_time, post_title, post_author, post_body,
+                     post_vote=None, comments=None):
+            self.post_board = post_board
+            self.post_id = post_id
+            self.post_time = _timestamp(post_time)
+            self.post_title = post_title
+            self.post_author = post_author
+            self.post_body = post_body
+            self.post_vote = post_vote if post_vote is not None else {"pos": 0, "neg": 0, "neu": 0}
+            self.comments = comments if comments is not None else []
+            _check_vote(self.post_vote)
+
+        @classmethod
+        def _from_dict(cls, d):
+            for field in ("post_board", "post_id", "post_title", "post_author", "post_body"):
+                if type(d[field]) is not str:
+                    raise PostFormatError(f"{field} 不是字串: {d[field]!r:.100}")
+
+            comments = d.get("comments", [])
+            if isinstance(comments, dict):
+                comments = _comments_from_columns(comments)
+            elif isinstance(comments, list):
+                comments = _comments_from_dicts(comments)
+            else:
+                raise PostFormatError(f"comments 不是 list 或 object: {type(comments).__name__}")
+
+            return cls(
+                d["post_board"],
+                d["post_id"],
+                d["post_time"],
+                d["post_title"],
+                d["post_author"],
+                d["post_body"],
+                d.get("post_vote"),
+                comments,
+            )
+
+        def __eq__(self, other):
+            if not isinstance(other, Post):
+                return NotImplemented
+            return all(getattr(self, field) == getattr(other, field) for field in POST_FIELDS)
+
+        def __repr__(self):
+            return f"Post(post_board={self.post_board!r}, post_id={self.post_id!r}, {len(self.comments)} 則推文)"
+
+    def _comments_from_dicts(dicts):
+        """
+        推文數量很多，不呼叫 Comment() 而是直接填入各個欄位
+        """
+        new = object.__new__
+        comments = []
+        append = comments.append
+        for d in dicts:
+            try:
+                comment = new(Comment)
+                comment.type = d["type"]
+                comment.author = d["author"]
+                comment.content = d["content"]
+                comment.order = d.get("order")
+            except (KeyError, TypeError, AttributeError):
+                raise PostFormatError(f"推文格式不正確: {d!r:.200}") from None
+
+            if comment.type not in COMMENT_TYPES or type(comment.author) is not str \
+                    or type(comment.content) is not str \
+                    or (comment.order is not None and type(comment.order) is not int):
+                raise PostFormatError(f"推文格式不正確: {d!r:.200}")
+            append(comment)
+        return comments
+
+    _TYPE_CODES = set(range(len(COMMENT_TYPES)))
+
+    def _comments_from_columns(columns):
+        try:
+            codes, authors, contents = columns["type"], columns["author"], columns["content"]
+        except KeyError as e:
+            raise PostFormatError(f"comments 缺少欄位: {e}") from None
+        orders = columns.get("order")
+
+        if not all(isinstance(column, list) for column in (codes, authors, contents, orders or [])):
+            raise PostFormatError("comments 的欄位不是 list")
+        _check_columns(codes, authors, contents, orders)
+
+        # 每個欄位的型別用 set 一次檢查，比逐一比較快
+        if not set(map(type, codes)) <= {int} or not set(codes) <= _TYPE_CODES \
+                or not set(map(type, authors)) <= {str} or not set(map(type, contents)) <= {str} \
+                or not set(map(type, orders or ())) <= {int, type(None)}:
+            raise PostFormatError("comments 的欄位型別不正確")
+
+        types = map(COMMENT_TYPES.__getitem__, codes)
+        if orders is None:
+            return list(map(Comment, types, authors, contents))
+        return list(map(Comment, types, authors, contents, orders))
+
+    _decoder = None
+    _encoder = None
+
+
+def _comment_columns(comments):
+    """
+    list of Comment -> "columns" 格式的 dict
+    """
+    columns = {
+        "type": [COMMENT_TYPES.index(c.type) for c in comments],
+        "author": [c.author for c in comments],
+        "content": [c.content for c in comments],
+    }
+    if any(c.order is not None for c in comments):
+        columns["order"] = [c.order for c in comments]
+    return columns
+
+
+def _columns_dict(post):
+    """
+    Post -> dict (推文為 "columns" 格式)
+    """
+    d = {field: getattr(post, field) for field in POST_FIELDS[:-1]}
+    d["comments"] = _comment_columns(post.comments)
+    return d
+
+
+def _default(obj):
+    if isinstance(obj, (Post, Comment)):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} 不能轉成 json")
+
+
+def encode(obj, layout="records"):
+    """
+    Post / Comment (或一般的 json 值) -> utf-8 的 json bytes
+    layout: Post 的推文寫成 "records" 或 "columns" 格式 (見 JSON_LAYOUTS)
+    """
+    if layout == "columns" and isinstance(obj, Post):
+        obj = _columns_dict(obj)
+    elif layout not in JSON_LAYOUTS:
+        raise ValueError(f"不支援的 layout: {layout}")
+
+    if _encoder is not None:
+        return _encoder.encode(obj)
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(data):
+    """
+    json (bytes 或 str) -> Post ("records" / "columns" 格式都可以)
+    """
+    if _decoder is not None:
+        try:
+            return _decoder.decode(data)
+        except msgspec.ValidationError as e:
+            raise PostFormatError(str(e)) from None
+        except msgspec.DecodeError as e:
+            raise PostFormatError(f"json 格式不正確: {e}") from None
+
+    try:
+        d = orjson.loads(data) if orjson is not None else json.loads(data)
+    except ValueError as e:
+        raise PostFormatError(f"json 格式不正確: {e}") from None
+    return Post.from_dict(d)
+
+
+def dump(post, f, layout="records"):
+    """
+    f: 以二進位模式 ("wb") 開啟的檔案
+    """
+    f.write(encode(post, layout=layout))
+
+
+def load(f):
+    """
+    f: 開啟的 .json 檔 (二進位或文字模式)
+    """
+    return decode(f.read())
@@ -0,0 +1,432 @@
+import os
+import zlib
+import fcntl
+import struct
+import logging
+from collections import namedtuple
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import metrics
+import post_model
+from catalog import parse_post_filename
+
+
+# 打包的文章儲存格式 (post store)
+#
+# 一篇文章一個 .json 會產生上百萬個小檔，rglob、inode 和備份都很慢。
+# post store 把每個板每一年的文章放在同一個 shard:
+#
+#   <store_dir>/<board>/<year>.posts   一連串獨立壓縮的 block
+#   <store_dir>/<board>/<year>.idx     索引，每行: post_id \t 檔名 \t block 位置 \t block 內第幾篇
+#
+# 每個 block 是 BLOCK_HEADER + 壓縮過的內容；內容是一行一篇文章: 檔名 \t 文章的 json。
+# 每個 block 可以單獨解壓縮，所以用索引就能直接讀出某一篇，也可以一個 block 一個 block 平行處理。
+# 有安裝 zstandard 的話用 zstd 壓縮，否則用 zlib；讀取時依 block header 中記錄的方式解壓縮。
+#
+# 寫入時先寫 block 再寫索引 (都在 shard 的 lock 裡)，中途中斷最多只會多出沒有索引的 block，
+# 可以用 rebuild_index() 重建。同一篇文章寫入兩次的話，以最後一次為準。
+
+SHARD_SUFFIX = ".posts"
+INDEX_SUFFIX = ".idx"
+
+# block 壓縮前大約多大 (bytes)
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# magic, 格式版本, 壓縮方式, (保留), 壓縮後長度, 文章數
+BLOCK_HEADER = struct.Struct("<4sBBxxII")
+BLOCK_MAGIC = b"PTTB"
+FORMAT_VERSION = 1
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {
+    "zlib": CODEC_ZLIB,
+    "zstd": CODEC_ZSTD,
+}
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def default_codec():
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def _compress(codec_id, data):
+    if codec_id == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(codec_id, data):
+    if codec_id == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("這個 block 是用 zstd 壓縮的，請先安裝 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec_id == CODEC_ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f"不支援的壓縮方式: {codec_id}")
+
+
+def shard_path(store_dir, board, year):
+    return Path(store_dir) / board / f"{year}{SHARD_SUFFIX}"
+
+
+def index_path(shard):
+    return Path(shard).with_suffix(INDEX_SUFFIX)
+
+
+class BlockRef(namedtuple("BlockRef", ["path", "offset", "length", "count"])):
+    """
+    shard 中的一個 block: shard 路徑、header 的位置、壓縮後長度、文章數
+    """
+    __slots__ = ()
+
+    @property
+    def board(self):
+        return Path(self.path).parent.name
+
+    @property
+    def year(self):
+        return int(Path(self.path).stem)
+
+    @property
+    def nbytes(self):
+        # 給 parallel.run_tasks 計算 MB/秒
+        return BLOCK_HEADER.size + self.length
+
+
+def _read_header(f, path, offset):
+    header = f.read(BLOCK_HEADER.size)
+    if len(header) < BLOCK_HEADER.size:
+        return None
+
+    magic, version, codec_id, length, count = BLOCK_HEADER.unpack(header)
+    if magic != BLOCK_MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path} 在位置 {offset} 不是一個 block")
+    return codec_id, length, count
+
+
+def iter_blocks(shard):
+    """
+    依序列出 shard 中的 block (不需要索引)。最後一個 block 不完整的話會被略過。
+    """
+    size = os.path.getsize(shard)
+
+    with open(shard, "rb") as f:
+        offset = 0
+        while offset < size:
+            parsed = _read_header(f, shard, offset)
+            if parsed is None or offset + BLOCK_HEADER.size + parsed[1] > size:
+                logging.warning("-- %s 最後一個 block 不完整 (位置 %d)，略過", shard, offset)
+                return
+            _, length, count = parsed
+            yield BlockRef(str(shard), offset, length, count)
+            offset += BLOCK_HEADER.size + length
+            f.seek(offset)
+
+
+@metrics.timed("read")
+def read_block(ref):
+    """
+    輸出: list of (檔名, structured_post)
+    """
+    with open(ref.path, "rb") as f:
+        f.seek(ref.offset)
+        codec_id, length, _ = _read_header(f, ref.path, ref.offset)
+        data = _decompress(codec_id, f.read(length))
+
+    # 只以 b"\n" 切行: json 中的換行一定是跳脫過的，但 splitlines() 還會在 \r、U+2028 等字元切開
+    records = []
+    for line in data.split(b"\n")[:-1]:
+        name, post_json = line.split(b"\t", 1)
+        records.append((name.decode("utf-8"), post_model.decode(post_json)))
+    return records
+
+
+def _read_index(shard):
+    """
+    輸出: dict {post_id: (檔名, block 位置, block 內第幾篇)}
+    """
+    index = {}
+    try:
+        with open(index_path(shard), "r") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 4:
+                    # 寫到一半的最後一行
+                    continue
+                post_id, name, offset, i = fields
+                index[post_id] = (name, int(offset), int(i))
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def _cached_index(shard, cache):
+    """
+    shard 的索引，cache: dict {shard 路徑: (讀入時索引檔的大小, 索引)} (索引檔有變動時才重新讀入)
+    """
+    try:
+        size = os.path.getsize(index_path(shard))
+    except FileNotFoundError:
+        size = -1
+
+    cached = cache.get(shard)
+    if cached is None or cached[0] != size:
+        cached = cache[shard] = (size, _read_index(shard))
+    return cached[1]
+
+
+def _current_records(ref, index):
+    """
+    read_block(ref) 中索引指向這個 block 的文章 (同一篇文章寫入過多次的話，以索引中的那一次為準)
+    """
+    for i, (name, post) in enumerate(read_block(ref)):
+        entry = index.get(post.post_id)
+        if entry is not None and (entry[1], entry[2]) != (ref.offset, i):
+            continue
+        yield name, post
+
+
+# read_current_block() 用的索引 (每個進程各自一份)
+_index_cache = {}
+
+
+def read_current_block(ref):
+    """
+    同 read_block()，但略過在之後的 block 中有較新版本的文章
+    """
+    return list(_current_records(ref, _cached_index(Path(ref.path), _index_cache)))
+
+
+def rebuild_index(shard):
+    """
+    掃描 shard 的所有 block，重寫索引。回傳文章數 (不重複)。
+    """
+    entries = {}
+    for ref in iter_blocks(shard):
+        for i, (name, post) in enumerate(read_block(ref)):
+            entries[post.post_id] = (name, ref.offset, i)
+
+    path = index_path(shard)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        for post_id, (name, offset, i) in entries.items():
+            f.write(f"{post_id}\t{name}\t{offset}\t{i}\n")
+    os.replace(tmp_path, path)
+
+    return len(entries)
+
+
+class PostStore(object):
+    """
+    讀取 post store
+
+    store = PostStore(store_dir)
+    store.get("M.1107860339.A.695")
+    for board, year, name, post in store.iter_posts(board_name="Gossiping"): ...
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        # shard 路徑 -> (讀入時索引檔的大小, 索引)
+        self._indexes = {}
+
+    def shards(self, board_name=None):
+        """
+        輸出: list of (board, year, shard 路徑)，依板名、年份排序
+        """
+        if not self.store_dir.is_dir():
+            return []
+
+        if board_name is None:
+            board_dirs = [Path(entry.path) for entry in os.scandir(self.store_dir) if entry.is_dir()]
+        else:
+            board_dirs = [self.store_dir / board_name]
+
+        results = []
+        for board_dir in board_dirs:
+            if not board_dir.is_dir():
+                continue
+            with os.scandir(board_dir) as entries:
+                for entry in entries:
+                    stem, suffix = os.path.splitext(entry.name)
+                    if suffix == SHARD_SUFFIX and stem.isdigit():
+                        results.append((board_dir.name, int(stem), Path(entry.path)))
+
+        results.sort()
+        return results
+
+    def index(self, shard):
+        """
+        shard 的索引 (索引檔有變動時才重新讀入)
+        """
+        return _cached_index(shard, self._indexes)
+
+    def contains(self, post_id, board, year):
+        return post_id in self.index(shard_path(self.store_dir, board, year))
+
+    def locate(self, post_id, board_name=None):
+        """
+        輸出: (board, year, 檔名, BlockRef, block 內第幾篇)；找不到的話丟出 KeyError
+        """
+        for board, year, shard in self.shards(board_name):
+            entry = self.index(shard).get(post_id)
+            if entry is None:
+                continue
+
+            name, offset, i = entry
+            with open(shard, "rb") as f:
+                f.seek(offset)
+                _, length, count = _read_header(f, shard, offset)
+            return board, year, name, BlockRef(str(shard), offset, length, count), i
+
+        raise KeyError(post_id)
+
+    def get(self, post_id, board_name=None):
+        """
+        用 post_id 讀出一篇文章 (只解壓縮它所在的 block)
+        """
+        _, _, _, ref, i = self.locate(post_id, board_name=board_name)
+        return read_block(ref)[i][1]
+
+    def blocks(self, board_name=None):
+        for _, _, shard in self.shards(board_name):
+            yield from iter_blocks(shard)
+
+    def iter_posts(self, board_name=None):
+        """
+        依序讀出所有文章: (board, year, 檔名, structured_post)
+        同一篇文章寫入過多次的話只輸出索引中的那一次。
+        """
+        for ref in self.blocks(board_name):
+            for name, post in _current_records(ref, self.index(Path(ref.path))):
+                yield ref.board, ref.year, name, post
+
+    def count_by_board_by_year(self, board_name=None):
+        """
+        輸出: dict {board: list of (year, n)}，格式同 catalog.count_by_board_by_year()
+        """
+        counts = {}
+        for board, year, shard in self.shards(board_name):
+            counts.setdefault(board, []).append((year, len(self.index(shard))))
+        return counts
+
+
+class PostStoreWriter(object):
+    """
+    寫入 post store。文章先放在記憶體，每個 shard 累積到 block_size 才壓縮寫出一個 block；
+    close() (或離開 with) 時寫出剩下的文章。多個進程可以同時寫入同一個 store。
+
+    with PostStoreWriter(store_dir) as writer:
+        writer.add(board, year, name, structured_post)
+    """
+
+    def __init__(self, store_dir, block_size=DEFAULT_BLOCK_SIZE, codec=None):
+        codec = codec or default_codec()
+        if codec not in CODECS:
+            raise ValueError(f"不支援的壓縮方式: {codec} (可用: {', '.join(CODECS)})")
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("要使用 zstd 請先安裝 zstandard")
+
+        self.store_dir = Path(store_dir)
+        self.block_size = block_size
+        self.codec_id = CODECS[codec]
+
+        # (board, year) -> [list of (post_id, 檔名, 一行的 bytes), 累積的 bytes]
+        self._buffers = {}
+
+    def add(self, board, year, name, structured_post):
+        line = name.encode("utf-8") + b"\t" + post_model.encode(structured_post) + b"\n"
+
+        key = (board, int(year))
+        buf = self._buffers.setdefault(key, [[], 0])
+        buf[0].append((structured_post.post_id, name, line))
+        buf[1] += len(line)
+
+        if buf[1] >= self.block_size:
+            self._flush_shard(key)
+
+    def add_file(self, path, structured_post):
+        """
+        path 的結構為 <data_dir>/<board>/<year>/<檔名>.html|json
+        """
+        path = Path(path)
+        self.add(path.parent.parent.name, path.parent.name, path.stem, structured_post)
+
+    def _flush_shard(self, key):
+        entries, _ = self._buffers.pop(key)
+        if len(entries) == 0:
+            return
+
+        payload = _compress(self.codec_id, b"".join(line for _, _, line in entries))
+        header = BLOCK_HEADER.pack(BLOCK_MAGIC, FORMAT_VERSION, self.codec_id, len(payload), len(entries))
+
+        shard = shard_path(self.store_dir, *key)
+        shard.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(shard, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(header + payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+                # block 寫完才寫索引
+                with open(index_path(shard), "a") as idx:
+                    idx.write("".join(
+                        f"{post_id}\t{name}\t{offset}\t{i}\n"
+                        for i, (post_id, name, _) in enumerate(entries)
+                    ))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def flush(self):
+        for key in list(self._buffers):
+            self._flush_shard(key)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def pack_tree(data_dir, store_dir, board_name=None, block_size=DEFAULT_BLOCK_SIZE, codec=None):
+    """
+    把 <data_dir>/<board>/<year>/*.json 打包進 post store (已經在 store 中的文章會略過)
+    回傳: 新打包的文章數
+    """
+    data_dir = Path(data_dir)
+    store = PostStore(store_dir)
+    board_dirs = [data_dir / board_name] if board_name else sorted(p for p in data_dir.iterdir() if p.is_dir())
+
+    n = 0
+    with PostStoreWriter(store_dir, block_size=block_size, codec=codec) as writer:
+        for board_dir in board_dirs:
+            for year_dir in sorted(board_dir.iterdir()):
+                if not year_dir.is_dir() or not year_dir.name.isdigit():
+                    continue
+
+                for path in sorted(year_dir.iterdir()):
+                    parsed = parse_post_filename(path.name)
+                    if parsed is None or parsed[2] != "json":
+                        continue
+                    if store.contains(parsed[0], board_dir.name, year_dir.name):
+                        continue
+
+                    with open(path, "rb") as f:
+                        writer.add_file(path, post_model.load(f))
+                    n += 1
+
+    return n
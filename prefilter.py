@@ -0,0 +1,45 @@
+import re
+
+
+# 斷詞前的篩選: 只留下含有中文字的句子
+#
+# 原本 ptt_helper.py / json2tei.py / html2vrt_new.py 各有一份 is_not_chinese_char()，
+# 用 map() 對每個字元呼叫一次 Python 函數，而且只認得 U+4E00 ~ U+9FA5。
+# 這裡改用編譯好的正規表示式一次處理整篇文章，並涵蓋 CJK 擴充區和相容表意文字。
+
+# (起, 迄) 包含兩端
+CJK_RANGES = [
+    (0x3400, 0x4DBF),    # 擴充 A
+    (0x4E00, 0x9FFF),    # 基本區
+    (0xF900, 0xFAFF),    # 相容表意文字
+    (0x20000, 0x2A6DF),  # 擴充 B
+    (0x2A700, 0x2EBEF),  # 擴充 C ~ F
+    (0x2EBF0, 0x2EE5F),  # 擴充 I
+    (0x2F800, 0x2FA1F),  # 相容表意文字補充
+    (0x30000, 0x323AF),  # 擴充 G ~ H
+]
+
+CJK_CLASS = "".join(f"{chr(start)}-{chr(end)}" for start, end in CJK_RANGES)
+
+# 含有中文字
+CJK_RE = re.compile(f"[{CJK_CLASS}]")
+
+# 以空白分隔、且含有中文字的一段 (和 str.split() 的切法相同)
+CJK_CHUNK_RE = re.compile(rf"(?<!\S)\S*[{CJK_CLASS}]\S*")
+
+
+def preprocess_content(string, sep=None):
+    """
+    將ptt內文作為字串，篩掉那些沒有中文字的句子，並回傳真正要丟入斷詞的list of strings
+    sep: 句子的分隔，None 表示以空白分隔 (同 str.split())
+    Input: content string
+    Output: list of valid string
+    """
+    if sep is None:
+        return CJK_CHUNK_RE.findall(string)
+
+    return [
+        sentence.strip()
+        for sentence in string.split(sep)
+        if CJK_RE.search(sentence)
+    ]
@@ -0,0 +1,219 @@
+import io
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+
+
+# 把斷詞結果輸出成 .vrt / TEI (.xml)
+#
+# 原本的 _render_tagged_tuple_to_string() 在迴圈裡不斷 result += ...，
+# 外面又再用 f-string 把各段接起來，長文章會一直複製整份字串。
+# 這裡的 write_* 函數把每個句子直接寫進 out (檔案或 io.StringIO)，只走一次。
+# 輸出和原本的函數完全相同。
+
+# 寫檔時的緩衝區大小
+WRITE_BUFFER_SIZE = 256 * 1024
+
+_TEI_ESCAPES = {
+    "<": "&lt;",
+    ">": "&gt;",
+    "&": "&amp;",
+}
+
+
+@contextmanager
+def atomic_open(path, mode="w"):
+    """
+    寫到暫存檔，成功結束才改名成 path；中途出錯就刪掉暫存檔，不會留下寫一半的檔案
+    mode: "w" 或 "wb"
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+            yield f
+            with metrics.stage("write"):
+                f.flush()
+        with metrics.stage("write"):
+            os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _post_date(structured_post):
+    return datetime.fromtimestamp(structured_post.post_time)
+
+
+#######
+# VRT #
+#######
+
+def write_tagged_vrt(out, list_of_list_of_tup, post_body=False):
+    """
+    和 _render_tagged_tuple_to_string() 相同的輸出，直接寫進 out
+
+    我\tNd
+    跑\tVA
+    """
+    write = out.write
+
+    if len(list_of_list_of_tup) == 0:
+        return
+    elif len(list_of_list_of_tup) == 1:
+        sentence = list_of_list_of_tup[0]
+        # 如果是網址就不要出現
+        if sentence[0][0].startswith("http"):
+            return
+        write("\n".join([f"{word}\t{pos}" for word, pos in sentence]))
+    else:
+        write("\n")
+        for sentence in list_of_list_of_tup:
+            write("<s>\n")
+            # 一個句子組成一個字串再寫出，減少 write() 的呼叫次數
+            write("".join([
+                f"{word}\t{pos}\n"
+                for word, pos in sentence
+                if not word.startswith("http")
+            ]))
+            write("</s>\n")
+
+
+@metrics.timed("render")
+def write_vrt_post(out, structured_post, tagged_fields):
+    """
+    structured_post: Post (見 post_model.py)
+    tagged_fields: SegBatcher.segment_fields() 的輸出
+    [標題的斷詞結果, 本文的斷詞結果, 推文1的斷詞結果, ...]
+    """
+    title_tagged, body_tagged, *comments_tagged = tagged_fields
+    write = out.write
+
+    post_id = structured_post.post_id
+    text_id = post_id.replace('.', '_')
+    post_author = structured_post.post_author
+
+    dt = _post_date(structured_post)
+    post_vote = structured_post.post_vote
+
+    write(
+        f'\n<post id="{post_id}" year="{dt.year}" month="{dt.month}" day="{dt.day}" '
+        f'neg="{post_vote["neg"]}" pos="{post_vote["pos"]}" neu="{post_vote["neg"]}">\n'
+    )
+
+    write(f'<text id="{text_id}_title" type="title" author="{post_author}" c_type="NA">\n<s>\n')
+    write_tagged_vrt(out, title_tagged)
+    write('\n</s>\n</text>\n')
+
+    write(f'<text id="{text_id}_body" type="body" author="{post_author}" c_type="NA">\n')
+    write_tagged_vrt(out, body_tagged, post_body=True)
+    write('\n</text>\n')
+
+    write('\n')
+    for i, (c, c_tagged) in enumerate(zip(structured_post.comments, comments_tagged)):
+        # html2json 輸出的推文沒有 order，就用推文的順序
+        comment_order = c.order if c.order is not None else i + 1
+        write(
+            f'\n<text id="{text_id}_comment_{comment_order}" type="comment" '
+            f'author="{c.author}" c_type="{c.type}">\n<s>\n'
+        )
+        write_tagged_vrt(out, c_tagged)
+        write('\n</s>\n</text>\n')
+
+    write('\n</post>\n')
+
+
+#######
+# TEI #
+#######
+
+def write_tagged_tei(out, list_of_list_of_tup, post_body=False):
+    """
+    和 json2tei._render_tagged_tuple_to_string() 相同的輸出，直接寫進 out
+
+    <w type="Nd">我</w>
+    """
+    write = out.write
+
+    if len(list_of_list_of_tup) == 0:
+        return
+    elif len(list_of_list_of_tup) == 1:
+        sentence = list_of_list_of_tup[0]
+        # 如果是網址就不要出現
+        if sentence[0][0].startswith("http"):
+            return
+        write("".join([
+            f'<w type="{pos}">{_TEI_ESCAPES.get(word, word)}</w>\n'
+            for word, pos in sentence
+        ]))
+    else:
+        write("\n")
+        for sentence in list_of_list_of_tup:
+            write("<s>\n")
+            write("".join([
+                f'                <w type="{pos}">{_TEI_ESCAPES.get(word, word)}</w>\n'
+                for word, pos in sentence
+                if not word.startswith("http")
+            ]))
+            write("</s>\n")
+
+
+@metrics.timed("render")
+def write_tei_post(out, structured_post, tagged_fields):
+    """
+    tagged_fields: 同 write_vrt_post()
+    """
+    title_tagged, body_tagged, *comments_tagged = tagged_fields
+    write = out.write
+
+    post_author = structured_post.post_author
+    dt = _post_date(structured_post)
+
+    write(
+        f'<TEI.2>\n'
+        f'    <teiHeader>\n'
+        f'        <metadata name="author">{post_author}</metadata>\n'
+        f'        <metadata name="post_id">{structured_post.post_id}</metadata>\n'
+        f'        <metadata name="year">{dt.year}</metadata>\n'
+        f'        <metadata name="board">{structured_post.post_board}</metadata>\n'
+        f'    </teiHeader>\n'
+        f'    <text>\n'
+        f'        <title author="{post_author}">\n'
+        f'            <s>\n'
+        f'                '
+    )
+    write_tagged_tei(out, title_tagged)
+    write(
+        f'\n'
+        f'            </s>\n'
+        f'        </title>\n'
+        f'        <body author="{post_author}">\n'
+        f'                '
+    )
+    write_tagged_tei(out, body_tagged, post_body=True)
+    write(
+        '\n'
+        '        </body>\n'
+        '        \n'
+    )
+
+    for c, c_tagged in zip(structured_post.comments, comments_tagged):
+        write(f'\n<comment author="{c.author}" c_type="{c.type}">\n<s>\n')
+        write_tagged_tei(out, c_tagged)
+        write('\n</s>\n</comment>\n')
+
+    write(
+        '\n'
+        '    </text>\n'
+        '</TEI.2>'
+    )
+
+
+def render_to_string(write_func, structured_post, tagged_fields):
+    """
+    把 write_vrt_post / write_tei_post 的輸出收集成一個字串
+    """
+    buf = io.StringIO()
+    write_func(buf, structured_post, tagged_fields)
+    return buf.getvalue()
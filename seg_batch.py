@@ -0,0 +1,159 @@
+import timeit
+from itertools import islice
+
+import metrics
+from seg_cache import normalize
+
+
+# 批次斷詞
+#
+# 原本 json2vrt / json2tei 對標題、本文、每一則推文各呼叫一次 _seg_and_pos，
+# 一篇有 2000 則推文的文章就要進出 CKIP 2002 次。
+# SegBatcher 把一篇 (或很多篇) 文章所有欄位的句子收集起來，
+# 每 batch_size 句才呼叫一次斷詞，再把結果依序分回各個欄位。
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+class SegBatcher(object):
+    """
+    seg_func: 和 _seg_and_pos 相同介面的函數
+        輸入 list of str，輸出 list of list of (word, pos)，失敗時回傳 None
+    batch_size: 每次呼叫 seg_func 最多幾句
+    cache: SegCache 物件 (見 seg_cache.py)，None 表示不使用快取
+    """
+
+    def __init__(self, seg_func, batch_size=DEFAULT_BATCH_SIZE, cache=None):
+        self.seg_func = seg_func
+        self.batch_size = batch_size
+        self.cache = cache
+
+        # 統計
+        self.n_sentences = 0
+        self.n_calls = 0
+        self.seconds = 0.0
+
+    def segment_fields(self, fields):
+        """
+        輸入: 一篇文章的欄位，list of list of str
+        [
+            ["標題"],
+            ["本文第一句", "本文第二句"],
+            ["推文"],
+            ...
+        ]
+
+        輸出: 每個欄位的斷詞結果，list of (list of list of (word, pos))
+        """
+        return self.segment_many([fields])[0]
+
+    def segment_many(self, posts_fields):
+        """
+        輸入: 很多篇文章的欄位 (list of segment_fields 的輸入)
+        輸出: 每篇文章的 segment_fields 結果
+        """
+        sentences = [
+            sentence
+            for fields in posts_fields
+            for field in fields
+            for sentence in field
+        ]
+
+        if self.cache is None:
+            tagged = self._segment(sentences)
+        else:
+            tagged = self._segment_cached(sentences)
+
+        # 依序分回各篇文章的各個欄位
+        it = iter(tagged)
+        return [
+            [[next(it) for _ in field] for field in fields]
+            for fields in posts_fields
+        ]
+
+    def _segment_cached(self, sentences):
+        """
+        先查快取，只把快取中沒有的句子 (重複的只送一次) 丟去斷詞
+        """
+        keys = [normalize(sentence) for sentence in sentences]
+        unique_keys = list(dict.fromkeys(key for key in keys if key))
+
+        found = self.cache.get_many(unique_keys)
+
+        misses = {}
+        for sentence, key in zip(sentences, keys):
+            if key not in found and key not in misses:
+                misses[key] = sentence
+
+        if misses:
+            results = self._segment(list(misses.values()))
+            found.update(zip(misses.keys(), results))
+            # 空字串的結果 (_seg_and_pos 補上的 NULL) 不放進快取
+            self.cache.put_many([
+                (key, tagged)
+                for key, tagged in zip(misses.keys(), results)
+                if key
+            ])
+
+        return [found[key] for key in keys]
+
+    def _segment(self, sentences):
+        """
+        每 batch_size 句呼叫一次 seg_func
+        """
+        tagged = []
+        for i in range(0, len(sentences), self.batch_size):
+            batch = sentences[i:i + self.batch_size]
+
+            t1 = timeit.default_timer()
+            with metrics.stage("segment"):
+                result = self.seg_func(batch)
+            t2 = timeit.default_timer()
+
+            self.n_calls += 1
+            self.n_sentences += len(batch)
+            self.seconds += t2 - t1
+
+            if result is None or len(result) != len(batch):
+                raise RuntimeError(f"斷詞失敗: 輸入 {len(batch)} 句，得到 {None if result is None else len(result)} 句")
+            tagged.extend(result)
+
+            metrics.inc("sentences", len(batch))
+            metrics.inc("tokens", sum(len(sentence) for sentence in result))
+
+        return tagged
+
+    def report(self):
+        rate = self.n_sentences / self.seconds if self.seconds > 0 else 0.0
+        result = f"{self.n_sentences} 句, 呼叫斷詞 {self.n_calls} 次, {self.seconds:.2f} 秒, {rate:.1f} 句/秒"
+        if self.cache is not None:
+            result += f", {self.cache.report()}"
+        return result
+
+
+def post_sentence_fields(structured_post, preprocess):
+    """
+    把一篇文章 (Post) 拆成要斷詞的欄位: [標題], 本文的句子 (經過 preprocess), [推文1], [推文2], ...
+    """
+    metrics.count_post(structured_post, "segmented")
+    with metrics.stage("clean"):
+        body_sentences = preprocess(structured_post.post_body)
+
+    return [
+        [structured_post.post_title],
+        body_sentences,
+    ] + [
+        [c.content] for c in structured_post.comments
+    ]
+
+
+def chunked(iterable, size):
+    """
+    把 iterable 每 size 個包成一個 list
+    """
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,123 @@
+import os
+import json
+import sqlite3
+from collections import OrderedDict
+
+
+# 斷詞結果快取
+#
+# PTT 推文重複性很高 ("推"、"XD"、"樓上正解"、複製貼上的梗)，
+# 同樣的句子不需要每次都丟給 CKIP。SegCache 以去掉前後空白的句子為 key，
+# 先查行程內的 LRU，再查 (可選的) 磁碟上的 sqlite 檔；sqlite 檔可以讓多個 worker 共用，
+# 重跑同一批語料時大部分句子都不必再斷詞。
+
+DEFAULT_CACHE_SIZE = 100000
+
+# 一次 SELECT ... IN (...) 最多帶幾個參數 (舊版 sqlite 上限為 999)
+_SQL_CHUNK = 500
+
+
+def normalize(sentence):
+    return sentence.strip()
+
+
+class SegCache(object):
+    """
+    max_size: 行程內 LRU 最多保存幾句
+    db_path: 磁碟上的快取檔 (sqlite)，None 表示只用 LRU
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, db_path=None):
+        self.max_size = max_size
+        self.db_path = db_path
+        self._lru = OrderedDict()
+
+        # 每個進程各自開連線 (sqlite 連線不能跨 fork 共用)
+        self._conn = None
+        self._conn_pid = None
+
+        # 統計
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get_connection(self):
+        if self.db_path is None:
+            return None
+
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            conn = sqlite3.connect(str(self.db_path), timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS seg_cache (sentence TEXT PRIMARY KEY, tagged TEXT NOT NULL)")
+            self._conn = conn
+            self._conn_pid = pid
+        return self._conn
+
+    def _remember(self, key, tagged):
+        if self.max_size <= 0:
+            return
+        self._lru[key] = tagged
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        輸入: list of 已經 normalize() 過的句子 (不重複)
+        輸出: dict {句子: 斷詞結果}，只包含快取中有的句子
+        """
+        found = {}
+        not_in_lru = []
+
+        for key in keys:
+            tagged = self._lru.get(key)
+            if tagged is None:
+                not_in_lru.append(key)
+            else:
+                self._lru.move_to_end(key)
+                found[key] = tagged
+        self.hits += len(found)
+
+        conn = self._get_connection()
+        if conn is not None and not_in_lru:
+            for i in range(0, len(not_in_lru), _SQL_CHUNK):
+                chunk = not_in_lru[i:i + _SQL_CHUNK]
+                rows = conn.execute(
+                    f"SELECT sentence, tagged FROM seg_cache WHERE sentence IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for key, tagged in rows:
+                    tagged = [tuple(wp) for wp in json.loads(tagged)]
+                    found[key] = tagged
+                    self._remember(key, tagged)
+                    self.disk_hits += 1
+
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        items: list of (已經 normalize() 過的句子, 斷詞結果)
+        """
+        for key, tagged in items:
+            self._remember(key, tagged)
+
+        conn = self._get_connection()
+        if conn is not None and items:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO seg_cache (sentence, tagged) VALUES (?, ?)",
+                    ((key, json.dumps(tagged, ensure_ascii=False)) for key, tagged in items)
+                )
+
+    def hit_rate(self):
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total > 0 else 0.0
+
+    def report(self):
+        return (
+            f"快取命中率 {self.hit_rate():.1%} "
+            f"(記憶體 {self.hits}, 磁碟 {self.disk_hits}, 未命中 {self.misses})"
+        )
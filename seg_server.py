@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import timeit
+import logging
+import argparse
+import threading
+import socketserver
+
+
+# 常駐的斷詞伺服器 (Unix socket)
+#
+# 載入 CKIPWS (WordSeg_InitData) 或 ckiptagger 的 WS / POS 模型要好幾秒到好幾分鐘、好幾 GB 記憶體，
+# 原本每次執行指令、每個 worker 都要重新載入一次。
+# 這裡讓一個進程常駐、只載入一次模型，各個 client 透過 Unix socket 送句子過來:
+# - 同時到達的請求會合併成一批才呼叫模型 (第一個請求最多等 max_delay 秒，或湊滿 max_batch 句就送出)
+# - 模型只在一個執行緒中使用 (CKIPWS 不是 thread-safe)
+# - 合併的一批失敗時，改成一個請求一個請求處理，只有出問題的請求會收到錯誤
+#
+# SegClient 的 ApplyList() 和 ckipws.PyWordSeg.ApplyList() 相同 (回傳 CKIP 格式的字串，空字串不會出現在輸出中)，
+# 所以 _seg_and_pos 不必修改；CLI 加上 --seg-server <socket> 即可 (見 seg_worker.py)。
+#
+# $ python3 seg_server.py -c <CKIPWS 資料夾> (--socket /tmp/ptt_seg.sock)
+# $ python3 seg_server.py --backend ckiptagger -c <ckiptagger 模型資料夾> (--use-gpu)
+# $ python3 ptt_helper.py json2vrt -d <資料夾> --use-mp --seg-server /tmp/ptt_seg.sock
+#
+# 協定: 每個訊息為 4 bytes 長度 (big-endian) + utf-8 的 json
+# - 請求 {"sentences": [...]}，回應 {"results": [...]} 或 {"error": "..."}
+# - 請求 {"cmd": "stats"}，回應伺服器的統計
+
+DEFAULT_SOCKET = os.environ.get("PTT_SEG_SOCKET", "/tmp/ptt_seg.sock")
+
+# 合併請求時，第一個請求最多等幾秒
+DEFAULT_MAX_DELAY = 0.005
+
+# 一批最多幾句 (單一請求超過的話不切開)
+DEFAULT_MAX_BATCH = 2000
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+class SegServerError(Exception):
+    pass
+
+
+def send_message(sock, obj):
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_message(sock):
+    """
+    輸出: 解開的 json；對方關閉連線時回傳 None
+    """
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    data = _recv_exactly(sock, length)
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+###########
+# 模型    #
+###########
+
+class CkiptaggerBackend(object):
+    """
+    把 ckiptagger 的 WS + POS 包成和 PyWordSeg.ApplyList() 相同的輸出:
+    "我(Nh)　喜歡(VK)" (空字串不會出現在輸出中)
+    """
+
+    def __init__(self, model_dir, use_gpu=False):
+        from ckiptagger import WS, POS
+
+        self.ws = WS(model_dir, disable_cuda=not use_gpu)
+        self.pos = POS(model_dir, disable_cuda=not use_gpu)
+
+    def ApplyList(self, list_of_sentences):
+        sentences = [s for s in list_of_sentences if s.strip()]
+        if not sentences:
+            return []
+
+        word_sentence_list = self.ws(sentences, sentence_segmentation=True)
+        pos_sentence_list = self.pos(word_sentence_list)
+        return [
+            "　".join(f"{w}({p})" for w, p in zip(words, tags))
+            for words, tags in zip(word_sentence_list, pos_sentence_list)
+        ]
+
+
+def load_backend(backend, model_path, use_gpu=False):
+    if backend == "ckipws":
+        from ckipws import CKIP
+        return CKIP(model_path)
+    if backend == "ckiptagger":
+        return CkiptaggerBackend(model_path, use_gpu=use_gpu)
+    raise ValueError(f"不支援的斷詞模型: {backend} (可用: ckipws / ckiptagger)")
+
+
+###########
+# 伺服器  #
+###########
+
+class _Request(object):
+
+    def __init__(self, sentences):
+        # 和 CKIP 相同，空字串不送進模型、也不會出現在結果中
+        self.sentences = [s for s in sentences if s.strip()]
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class DynamicBatcher(object):
+    """
+    在一個執行緒中使用 segmenter，把同時到達的請求合併成一批
+    segmenter: 有 ApplyList() 的物件 (PyWordSeg、CkiptaggerBackend ...)
+    """
+
+    def __init__(self, segmenter, max_delay=DEFAULT_MAX_DELAY, max_batch=DEFAULT_MAX_BATCH):
+        self.segmenter = segmenter
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+
+        # 統計
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_sentences = 0
+        self.seconds = 0.0
+        self.started = time.time()
+
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def segment(self, sentences):
+        """
+        給處理連線的執行緒呼叫: 等到這個請求處理完
+        """
+        request = _Request(sentences)
+        if request.sentences:
+            self.queue.put(request)
+            request.done.wait()
+        else:
+            request.results = []
+        if request.error is not None:
+            raise SegServerError(request.error)
+        return request.results
+
+    def _collect(self):
+        """
+        等第一個請求，然後在 max_delay 秒內盡量多收一些請求 (最多 max_batch 句)
+        """
+        batch = [self.queue.get()]
+        n_sentences = len(batch[0].sentences)
+        deadline = timeit.default_timer() + self.max_delay
+
+        while n_sentences < self.max_batch:
+            timeout = deadline - timeit.default_timer()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_sentences += len(request.sentences)
+
+        return batch
+
+    def _apply(self, sentences):
+        t1 = timeit.default_timer()
+        results = self.segmenter.ApplyList(sentences)
+        t2 = timeit.default_timer()
+
+        self.n_batches += 1
+        self.n_sentences += len(sentences)
+        self.seconds += t2 - t1
+
+        if results is None or len(results) != len(sentences):
+            raise SegServerError(f"斷詞失敗: 輸入 {len(sentences)} 句，得到 {None if results is None else len(results)} 句")
+        return list(results)
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            self.n_requests += len(batch)
+
+            try:
+                results = self._apply([s for request in batch for s in request.sentences])
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0].error = str(e)
+                    batch[0].done.set()
+                    continue
+
+                logging.warning("-- 合併的 %d 個請求斷詞失敗，改為逐一處理: %s", len(batch), e)
+                for request in batch:
+                    try:
+                        request.results = self._apply(request.sentences)
+                    except Exception as e:
+                        request.error = str(e)
+                    request.done.set()
+                continue
+
+            offset = 0
+            for request in batch:
+                request.results = results[offset:offset + len(request.sentences)]
+                offset += len(request.sentences)
+                request.done.set()
+
+    def report(self):
+        return {
+            "uptime": time.time() - self.started,
+            "requests": self.n_requests,
+            "batches": self.n_batches,
+            "sentences": self.n_sentences,
+            "seconds": self.seconds,
+            "sentences_per_batch": self.n_sentences / self.n_batches if self.n_batches else 0.0,
+        }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError) as e:
+                logging.warning("-- 讀取請求出問題: %s", e)
+                return
+            if message is None:
+                return
+
+            try:
+                if message.get("cmd") == "stats":
+                    response = batcher.report()
+                else:
+                    response = {"results": batcher.segment(message["sentences"])}
+            except Exception as e:
+                logging.error("-- 斷詞出問題: %s", e)
+                response = {"error": str(e)}
+
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class SegServer(socketserver.ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, segmenter, max_delay=DEFAULT_MAX_DELAY, max_batch=DEFAULT_MAX_BATCH):
+        # 上次沒有正常結束留下的 socket 檔
+        if os.path.exists(socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)
+            else:
+                raise SegServerError(f"{socket_path} 已經有斷詞伺服器在執行")
+
+        self.socket_path = socket_path
+        self.batcher = DynamicBatcher(segmenter, max_delay=max_delay, max_batch=max_batch)
+        super().__init__(socket_path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+###########
+# client  #
+###########
+
+class SegClient(object):
+    """
+    和 ckipws.PyWordSeg 相同介面的 client: ApplyList(list of str) -> list of CKIP 格式的字串
+    連線在第一次使用時才建立；fork 之後的子進程會自己重新連線。
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._pid = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise SegServerError(f"無法連線到斷詞伺服器 {self.socket_path}: {e}")
+        self._sock = sock
+        self._pid = os.getpid()
+
+    def _request(self, message):
+        if self._sock is None or self._pid != os.getpid():
+            self._connect()
+
+        try:
+            send_message(self._sock, message)
+            response = recv_message(self._sock)
+        except OSError as e:
+            self.close()
+            raise SegServerError(f"斷詞伺服器連線中斷: {e}")
+
+        if response is None:
+            self.close()
+            raise SegServerError("斷詞伺服器關閉了連線")
+        if "error" in response:
+            raise SegServerError(response["error"])
+        return response
+
+    def ApplyList(self, inputList):
+        if len(inputList) == 0:
+            return []
+        return self._request({"sentences": list(inputList)})["results"]
+
+    def stats(self):
+        return self._request({"cmd": "stats"})
+
+    def close(self):
+        if self._sock is not None and self._pid == os.getpid():
+            self._sock.close()
+        self._sock = None
+
+    def Destroy(self):
+        self.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--model-path", help="CKIPWS 資料夾 (或 ckiptagger 的模型資料夾)")
+    parser.add_argument("--backend", help="斷詞模型: ckipws (預設) / ckiptagger", default="ckipws")
+    parser.add_argument("--use-gpu", help="ckiptagger 使用 GPU", action="store_true")
+    parser.add_argument("-s", "--socket", help="Unix socket 路徑 (預設為環境變數 PTT_SEG_SOCKET 或 /tmp/ptt_seg.sock)", default=DEFAULT_SOCKET)
+    parser.add_argument("--max-delay-ms", help="合併請求時最多等幾毫秒", type=float, default=DEFAULT_MAX_DELAY * 1000)
+    parser.add_argument("--max-batch", help="一批最多幾句", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--stats", help="印出執行中伺服器的統計後結束", action="store_true")
+    parser.add_argument("-l", "--log-to", help=".log檔路徑檔名")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s:%(levelname)s:%(message)s',
+        level=logging.INFO,
+        filename=args.log_to,
+    )
+
+    if args.stats:
+        print(json.dumps(SegClient(args.socket).stats(), indent=2))
+        sys.exit(0)
+
+    if args.backend == "ckipws" and args.model_path is None:
+        import seg_worker
+        args.model_path = seg_worker.DEFAULT_CKIP_PATH
+
+    t1 = timeit.default_timer()
+    segmenter = load_backend(args.backend, args.model_path, use_gpu=args.use_gpu)
+    t2 = timeit.default_timer()
+    print(f"載入 {args.backend} ({args.model_path}): {t2 - t1:.2f} 秒", file=sys.stderr)
+
+    with SegServer(args.socket, segmenter, max_delay=args.max_delay_ms / 1000, max_batch=args.max_batch) as server:
+        print(f"斷詞伺服器: {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print(json.dumps(server.batcher.report()), file=sys.stderr)
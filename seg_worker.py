@@ -0,0 +1,100 @@
+import os
+import logging
+import timeit
+
+from ckipws import CKIP
+from seg_cache import SegCache
+from seg_server import SegClient
+
+
+# 斷詞 worker
+#
+# 每個進程 (主進程或 multiprocessing 的 worker) 各自持有一個 PyWordSeg，
+# 由 pool 的 initializer (init_worker) 載入一次，之後該進程所有的斷詞都共用它。
+# json2vrt / json2tei 的 SegBatcher 在 import 時用 register_batcher() 登記，
+# init_worker() 會依照 CLI 參數設定它們的 batch 大小和快取。
+#
+# 有指定斷詞伺服器 (seg_server.py) 的 socket 時，不載入 CKIP，改用 SegClient 送到伺服器斷詞。
+
+# CKIPWS 的資料夾，可用環境變數 CKIPWS_PATH 或 CLI 的 --ckip-path 指定
+DEFAULT_CKIP_PATH = os.environ.get("CKIPWS_PATH", "/home/don/CKIPWS_Linux")
+
+ckip_path = DEFAULT_CKIP_PATH
+
+# 斷詞伺服器的 socket 路徑，None 表示在本進程載入 CKIP
+seg_server = None
+
+# 本進程的 PyWordSeg (第一次用到時才載入)
+ckipws = None
+
+# 本進程載入 CKIP 花了幾秒
+warmup_seconds = None
+
+_batchers = []
+
+
+def register_batcher(batcher):
+    _batchers.append(batcher)
+    return batcher
+
+
+def configure_batchers(batch_size=None, cache_size=0, cache_db=None):
+    """
+    設定所有登記過的 SegBatcher。
+    cache_size > 0 或有指定 cache_db 時才使用快取。
+    """
+    for batcher in _batchers:
+        if batch_size is not None:
+            batcher.batch_size = batch_size
+        if cache_size > 0 or cache_db is not None:
+            batcher.cache = SegCache(max_size=cache_size, db_path=cache_db)
+        else:
+            batcher.cache = None
+
+
+def get_ckipws():
+    """
+    回傳本進程的 PyWordSeg (或斷詞伺服器的 SegClient)；還沒載入的話現在載入
+    """
+    global ckipws, warmup_seconds
+
+    if ckipws is None and seg_server is not None:
+        ckipws = SegClient(seg_server)
+        warmup_seconds = 0.0
+        logging.info("[pid %d] 使用斷詞伺服器: %s", os.getpid(), seg_server)
+
+    elif ckipws is None:
+        t1 = timeit.default_timer()
+        ckipws = CKIP(ckip_path)
+        t2 = timeit.default_timer()
+
+        warmup_seconds = t2 - t1
+        logging.info("[pid %d] 載入 CKIP (%s): %.2f 秒", os.getpid(), ckip_path, warmup_seconds)
+
+    return ckipws
+
+
+def init_worker(path=None, batch_size=None, cache_size=0, cache_db=None, server=None, preload=True):
+    """
+    multiprocessing.Pool 的 initializer，也可以在單進程模式下直接呼叫。
+
+    path: CKIPWS 資料夾，None 表示用 DEFAULT_CKIP_PATH
+    batch_size / cache_size / cache_db: 見 configure_batchers()
+    server: 斷詞伺服器的 socket 路徑 (見 seg_server.py)，None 表示在本進程載入 CKIP
+    preload: 是否立刻載入 CKIP (否則第一次斷詞時才載入)
+    """
+    global ckip_path, seg_server
+
+    if path is not None:
+        ckip_path = path
+    if server is not None:
+        seg_server = server
+
+    configure_batchers(batch_size=batch_size, cache_size=cache_size, cache_db=cache_db)
+
+    if preload:
+        get_ckipws()
+
+
+def batcher_reports():
+    return [batcher.report() for batcher in _batchers if batcher.n_sentences > 0]
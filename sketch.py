@@ -0,0 +1,341 @@
+import os
+import math
+import queue
+import json
+import hashlib
+import logging
+import multiprocessing as mp
+from pathlib import Path
+
+import numpy as np
+
+from catalog import parse_post_filename
+from lexicon import count_vrt_lines, year_dirs
+
+
+# 記憶體用量固定的近似詞頻統計
+#
+# 精確統計每個 (詞, 詞性, 板, 年份) 放不進記憶體時，改用:
+# - CountMinSketch: depth x width 的計數表，任何 key 的估計值 >= 真實值，
+#   且以機率 1 - delta 不超過 真實值 + eps * N (eps = e / width, delta = e ** -depth, N 為總次數)
+# - SpaceSaving: 最多保留 capacity 個 key 的 heavy hitters，
+#   每個 key 的計數最多高估 error (error <= N / capacity)
+# 兩者都可以合併 (各個 worker 分別統計再相加)，也可以存成 .npz 之後再讀回來。
+
+DEFAULT_DEPTH = 4
+DEFAULT_CAPACITY = 10000
+
+# blake2b 的 digest 最長 64 bytes，每一列用 8 bytes
+MAX_DEPTH = 8
+
+
+def _key_bytes(key):
+    if isinstance(key, tuple):
+        key = "\t".join(str(k) for k in key)
+    return key.encode("utf-8")
+
+
+class CountMinSketch(object):
+
+    def __init__(self, width, depth=DEFAULT_DEPTH, seed=0):
+        if not 1 <= depth <= MAX_DEPTH:
+            raise ValueError(f"depth 必須在 1 到 {MAX_DEPTH} 之間")
+
+        self.width = int(width)
+        self.depth = int(depth)
+        self.seed = int(seed)
+        self.total = 0
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+
+        self._rows = np.arange(self.depth)
+        self._hash_key = self.seed.to_bytes(8, "little")
+
+    @classmethod
+    def from_memory(cls, nbytes, depth=DEFAULT_DEPTH, seed=0):
+        """
+        依記憶體預算 (bytes) 決定 width
+        """
+        return cls(max(nbytes // (8 * depth), 1), depth=depth, seed=seed)
+
+    @property
+    def eps(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    @property
+    def error_bound(self):
+        """
+        估計值最多高估多少 (以機率 1 - delta 成立)
+        """
+        return self.eps * self.total
+
+    def _columns(self, key):
+        digest = hashlib.blake2b(_key_bytes(key), digest_size=8 * self.depth, key=self._hash_key).digest()
+        return np.frombuffer(digest, dtype=np.uint64) % np.uint64(self.width)
+
+    def add(self, key, count=1):
+        self.table[self._rows, self._columns(key)] += count
+        self.total += count
+
+    def add_many(self, counts):
+        """
+        counts: dict {key: 次數}，一次加進去
+        """
+        if len(counts) == 0:
+            return
+
+        columns = np.stack([self._columns(key) for key in counts])
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[:, row], values)
+        self.total += int(values.sum())
+
+    def estimate(self, key):
+        return int(self.table[self._rows, self._columns(key)].min())
+
+    def merge(self, other):
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("只能合併 width / depth / seed 相同的 CountMinSketch")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+class SpaceSaving(object):
+    """
+    heavy hitters: 保留至多 capacity 個 key。
+    為了不要每次都找最小值，累積到 2 * capacity 個才一次刪到剩 capacity 個，
+    新進來的 key 以被刪掉的最大計數 (floor) 為起點，並記為 error。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = int(capacity)
+        # key -> [count, error]
+        self.counters = {}
+        self.floor = 0
+
+    def add(self, key, count=1):
+        entry = self.counters.get(key)
+        if entry is None:
+            self.counters[key] = [self.floor + count, self.floor]
+            if len(self.counters) > 2 * self.capacity:
+                self._prune()
+        else:
+            entry[0] += count
+
+    def add_many(self, counts):
+        for key, count in counts.items():
+            self.add(key, count)
+
+    def _prune(self):
+        if len(self.counters) <= self.capacity:
+            return
+        items = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        self.floor = max(self.floor, items[self.capacity][1][0])
+        self.counters = dict(items[:self.capacity])
+
+    def merge(self, other):
+        """
+        只出現在一邊的 key，在另一邊最多被刪掉了 floor 次
+        """
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            count, error = 0, 0
+            for side in (self, other):
+                entry = side.counters.get(key)
+                if entry is None:
+                    count += side.floor
+                    error += side.floor
+                else:
+                    count += entry[0]
+                    error += entry[1]
+            merged[key] = [count, error]
+
+        self.floor = self.floor + other.floor
+        self.counters = merged
+        self._prune()
+        return self
+
+    def top(self, n=None):
+        """
+        輸出: list of (key, 計數, 最多高估多少)，依計數排序
+        """
+        items = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in items[:n]]
+
+
+class LexiconSketch(object):
+    """
+    CountMinSketch + SpaceSaving，key 為 (word, pos, board, year)
+    """
+
+    def __init__(self, memory_bytes=64 * 1024 * 1024, depth=DEFAULT_DEPTH, capacity=DEFAULT_CAPACITY, seed=0):
+        self.cms = CountMinSketch.from_memory(memory_bytes, depth=depth, seed=seed)
+        self.heavy_hitters = SpaceSaving(capacity)
+
+    def add_many(self, counts):
+        self.cms.add_many(counts)
+        self.heavy_hitters.add_many(counts)
+
+    def merge(self, other):
+        self.cms.merge(other.cms)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        return self
+
+    def estimate(self, key):
+        return self.cms.estimate(key)
+
+    def top(self, n=None):
+        """
+        輸出: list of (key, 估計值, 下界)，依估計值排序
+        估計值取 CountMinSketch 和 SpaceSaving 中較小的 (兩者都只會高估)，
+        下界為 SpaceSaving 的計數減去它的 error。
+        """
+        results = [
+            (key, min(count, self.cms.estimate(key)), count - error)
+            for key, count, error in self.heavy_hitters.top()
+        ]
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:n]
+
+    def report(self):
+        return {
+            "total": self.cms.total,
+            "width": self.cms.width,
+            "depth": self.cms.depth,
+            "eps": self.cms.eps,
+            "delta": self.cms.delta,
+            "cms_error_bound": self.cms.error_bound,
+            "heavy_hitters": len(self.heavy_hitters.counters),
+            "heavy_hitters_error_bound": self.heavy_hitters.floor,
+            "memory_mb": self.cms.table.nbytes / 1024 / 1024,
+        }
+
+    def save(self, path):
+        keys = list(self.heavy_hitters.counters)
+        entries = np.array([self.heavy_hitters.counters[k] for k in keys], dtype=np.int64).reshape(-1, 2)
+        params = {
+            "seed": self.cms.seed,
+            "total": self.cms.total,
+            "capacity": self.heavy_hitters.capacity,
+            "floor": self.heavy_hitters.floor,
+        }
+        np.savez(
+            path,
+            table=self.cms.table,
+            params=np.array(json.dumps(params)),
+            hh_keys=np.array([json.dumps(list(k), ensure_ascii=False) for k in keys], dtype=str),
+            hh_entries=entries,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            depth, width = data["table"].shape
+
+            sketch = cls(memory_bytes=8 * depth * width, depth=depth, capacity=params["capacity"], seed=params["seed"])
+            sketch.cms.table[:] = data["table"]
+            sketch.cms.total = params["total"]
+
+            sketch.heavy_hitters.floor = params["floor"]
+            sketch.heavy_hitters.counters = {
+                tuple(json.loads(k)): [int(count), int(error)]
+                for k, (count, error) in zip(data["hh_keys"], data["hh_entries"])
+            }
+        return sketch
+
+
+def sketch_year_dir(year_dir, sketch):
+    """
+    一篇一篇統計 <board>/<year> 中的 .vrt 加進 sketch，
+    記憶體中最多只有一篇文章的 Counter
+    回傳: 這個資料夾的詞數
+    """
+    year_dir = Path(year_dir)
+    board = year_dir.parent.name
+    total = sketch.cms.total
+
+    with os.scandir(year_dir) as entries:
+        for entry in entries:
+            parsed = parse_post_filename(entry.name)
+            if parsed is None or parsed[2] != "vrt":
+                continue
+            with open(entry.path, "r") as f:
+                sketch.add_many(count_vrt_lines(f, board))
+
+    logging.info("-- %s/%s: %d 個詞", board, year_dir.name, sketch.cms.total - total)
+    return sketch.cms.total - total
+
+
+def _sketch_worker(tasks, results, memory_bytes, depth, capacity):
+    """
+    一個 worker 進程: 只配置一個 sketch，把分到的 <board>/<year> 都加進去，
+    全部做完才把 sketch 交回主進程 (每個 worker 只傳一次)
+    """
+    sketch = LexiconSketch(memory_bytes, depth=depth, capacity=capacity)
+    # 出錯時進程直接結束 (exitcode != 0)，由 build_sketch() 發現並中止，不會少算一個資料夾
+    for year_dir in iter(tasks.get, None):
+        sketch_year_dir(year_dir, sketch)
+    results.put(sketch)
+
+
+def build_sketch(data_dir, board_name=None, memory_bytes=64 * 1024 * 1024, depth=DEFAULT_DEPTH,
+                 capacity=DEFAULT_CAPACITY, use_mp=False, processes=None):
+    """
+    同 lexicon.build_counts()，但輸出 LexiconSketch。
+    多進程時每個 worker 進程各自一個 sketch，所有資料夾做完後才交回、合併
+    (記憶體用量約為 memory_bytes * 進程數)
+    """
+    dirs = list(year_dirs(data_dir, board_name=board_name))
+
+    if not use_mp or len(dirs) <= 1:
+        result = LexiconSketch(memory_bytes, depth=depth, capacity=capacity)
+        for year_dir in dirs:
+            sketch_year_dir(year_dir, result)
+        return result
+
+    processes = min(processes or os.cpu_count(), len(dirs))
+    tasks = mp.Queue()
+    results = mp.Queue()
+    for year_dir in dirs:
+        tasks.put(year_dir)
+    for _ in range(processes):
+        tasks.put(None)
+
+    workers = [
+        mp.Process(target=_sketch_worker, args=(tasks, results, memory_bytes, depth, capacity))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # 第一個交回的 sketch 直接當作結果，其餘的合併進去
+    result = None
+    for _ in workers:
+        while True:
+            try:
+                sketch = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if any(worker.exitcode not in (None, 0) for worker in workers):
+                    for worker in workers:
+                        worker.terminate()
+                    raise RuntimeError("統計 sketch 的 worker 意外結束")
+        result = sketch if result is None else result.merge(sketch)
+
+    for worker in workers:
+        worker.join()
+    return result
+
+
+def export_top(sketch, path, n=None):
+    """
+    輸出 heavy hitters 成 tsv: 詞 \t 詞性 \t 板名 \t 年份 \t 估計值 \t 下界
+    """
+    with open(path, "w") as f:
+        for (word, pos, board, year), estimate, lower in sketch.top(n):
+            f.write(f"{word}\t{pos}\t{board}\t{year}\t{estimate}\t{lower}\n")
@@ -0,0 +1,361 @@
+import os
+import re
+import json
+import logging
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+import vrt_merge
+
+
+# 以 numpy 陣列儲存、可 memory-map 的斷詞語料
+#
+# 計算詞頻或建詞彙表時，不必每次都把 .vrt 一行一行讀進來 split("\t")。
+# build_corpus() 讀一次所有的 .vrt，輸出到 <corpus_dir>:
+#
+#   words.txt / pos.txt / boards.txt   詞、詞性、板名的列表 (第 i 行的 id 為 i)
+#   post_ids.txt                       每篇文章的 post_id
+#   *.bin                              各欄位的陣列 (原始的 binary，dtype 和長度記在 meta.json)
+#
+# token 欄位:    tokens (詞 id)、token_pos (詞性 id)
+# 邊界 (offset): sentence_offsets / text_offsets / post_offsets，第 i 個單位是 [offsets[i], offsets[i+1]) 的 token
+# text 欄位:     text_type (0 標題 / 1 本文 / 2 推文)、text_post (屬於第幾篇文章)
+# post 欄位:     post_board、post_year、post_month、post_day、post_pos、post_neg、post_neu
+#
+# TokenCorpus 用 np.memmap 讀取，依板、年份篩選和計數都是陣列運算，不需要把語料讀進記憶體。
+
+META_FILENAME = "meta.json"
+FORMAT_VERSION = 1
+
+TEXT_TYPES = ["title", "body", "comment"]
+
+# 欄位名稱 -> dtype
+COLUMNS = {
+    "tokens": "uint32",
+    "token_pos": "uint16",
+    "sentence_offsets": "int64",
+    "text_offsets": "int64",
+    "text_type": "uint8",
+    "text_post": "uint32",
+    "post_offsets": "int64",
+    "post_board": "uint16",
+    "post_year": "uint16",
+    "post_month": "uint8",
+    "post_day": "uint8",
+    "post_pos": "int32",
+    "post_neg": "int32",
+    "post_neu": "int32",
+}
+
+# array.array 的 typecode (寫入時使用)
+_TYPECODES = {
+    "uint8": "B",
+    "uint16": "H",
+    "uint32": "I",
+    "int32": "i",
+    "int64": "q",
+}
+
+# 累積多少個元素才寫出一次
+FLUSH_SIZE = 1 << 20
+
+ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+class _ColumnWriter(object):
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.length = 0
+        self._buf = array(_TYPECODES[dtype])
+        self._f = open(path, "wb")
+
+    def append(self, value):
+        self._buf.append(value)
+        if len(self._buf) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self._buf.tofile(self._f)
+        self.length += len(self._buf)
+        del self._buf[:]
+
+    def close(self):
+        self.flush()
+        self._f.close()
+
+
+class CorpusBuilder(object):
+    """
+    把 .vrt 一篇一篇加進來，最後 close() 寫出詞彙表和 meta.json
+
+    with CorpusBuilder(corpus_dir) as builder:
+        builder.add_vrt_file(vrt_path, board)
+    """
+
+    def __init__(self, corpus_dir):
+        self.corpus_dir = Path(corpus_dir)
+        self.corpus_dir.mkdir(parents=True, exist_ok=True)
+
+        self.words = {}
+        self.pos = {}
+        self.boards = {}
+        self._post_ids = open(self.corpus_dir / "post_ids.txt", "w")
+
+        self.columns = {
+            name: _ColumnWriter(self.corpus_dir / f"{name}.bin", dtype)
+            for name, dtype in COLUMNS.items()
+        }
+
+        self.n_tokens = 0
+        self.n_sentences = 0
+        self.n_texts = 0
+        self.n_posts = 0
+
+        self._in_sentence = False
+
+    @staticmethod
+    def _intern(vocab, item):
+        i = vocab.get(item)
+        if i is None:
+            i = vocab[item] = len(vocab)
+        return i
+
+    def _open_sentence(self):
+        if not self._in_sentence:
+            self.columns["sentence_offsets"].append(self.n_tokens)
+            self.n_sentences += 1
+            self._in_sentence = True
+
+    def _close_sentence(self):
+        self._in_sentence = False
+
+    def add_vrt_lines(self, lines, board):
+        """
+        lines: 一篇或多篇文章的 .vrt (renderers.write_vrt_post 的格式)
+        """
+        columns = self.columns
+        tokens = columns["tokens"]
+        token_pos = columns["token_pos"]
+        board_id = self._intern(self.boards, board)
+
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+
+            # 詞本身也可能以 "<" 開頭 (例如 <script>)，有 tab 的才是 "詞\t詞性"
+            if line.startswith("<") and "\t" not in line:
+                if line.startswith("<s>"):
+                    self._close_sentence()
+                    self._open_sentence()
+                elif line.startswith("</s>") or line.startswith("</text>"):
+                    self._close_sentence()
+                elif line.startswith("<text "):
+                    attrs = dict(ATTR_RE.findall(line))
+                    columns["text_offsets"].append(self.n_tokens)
+                    columns["text_type"].append(TEXT_TYPES.index(attrs["type"]))
+                    columns["text_post"].append(self.n_posts - 1)
+                    self.n_texts += 1
+                elif line.startswith("<post "):
+                    attrs = dict(ATTR_RE.findall(line))
+                    columns["post_offsets"].append(self.n_tokens)
+                    columns["post_board"].append(board_id)
+                    for name in ("year", "month", "day", "pos", "neg", "neu"):
+                        columns[f"post_{name}"].append(int(attrs[name]))
+                    self._post_ids.write(attrs["id"] + "\n")
+                    self.n_posts += 1
+                continue
+
+            word, _, pos = line.partition("\t")
+            # 本文只有一句時，詞不會包在 <s> 中
+            self._open_sentence()
+            tokens.append(self._intern(self.words, word))
+            token_pos.append(self._intern(self.pos, pos))
+            self.n_tokens += 1
+
+    def add_vrt_file(self, vrt_path, board):
+        with open(vrt_path, "r") as f:
+            self.add_vrt_lines(f, board)
+
+    def close(self):
+        # offsets 的最後再加上結尾，第 i 個單位為 [offsets[i], offsets[i+1])
+        for name in ("sentence_offsets", "text_offsets", "post_offsets"):
+            self.columns[name].append(self.n_tokens)
+
+        for column in self.columns.values():
+            column.close()
+        self._post_ids.close()
+
+        for filename, vocab in (("words.txt", self.words), ("pos.txt", self.pos), ("boards.txt", self.boards)):
+            with open(self.corpus_dir / filename, "w", newline="") as f:
+                f.writelines(f"{item}\n" for item in vocab)
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "n_tokens": self.n_tokens,
+            "n_sentences": self.n_sentences,
+            "n_texts": self.n_texts,
+            "n_posts": self.n_posts,
+            "columns": {
+                name: {"dtype": column.dtype, "length": column.length}
+                for name, column in self.columns.items()
+            },
+        }
+        with open(self.corpus_dir / META_FILENAME, "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def build_corpus(data_dir, corpus_dir, board_name=None):
+    """
+    把 <data_dir>/<board>/<year>/*.vrt (依時間排序) 轉成 TokenCorpus
+    回傳: meta (dict)
+    """
+    data_dir = Path(data_dir)
+    if board_name is None:
+        board_dirs = sorted(Path(entry.path) for entry in os.scandir(data_dir) if entry.is_dir())
+    else:
+        board_dirs = [data_dir / board_name]
+
+    with CorpusBuilder(corpus_dir) as builder:
+        for board_dir in board_dirs:
+            files = vrt_merge.list_board_vrt_files(board_dir)
+            logging.info("%s 版: %d 個 .vrt", board_dir.name, len(files))
+            for vrt_path, _ in files:
+                builder.add_vrt_file(vrt_path, board_dir.name)
+
+    return TokenCorpus(corpus_dir).meta
+
+
+def _read_lines(path):
+    # 只以 "\n" 分行: splitlines() 也會在 U+2028、\x85、\r 等字元分開，詞表的 id 就會錯開
+    with open(path, "r", newline="") as f:
+        return f.read().split("\n")[:-1]
+
+
+class TokenCorpus(object):
+    """
+    讀取 build_corpus() 的輸出，各欄位都是唯讀的 np.memmap
+
+    corpus = TokenCorpus(corpus_dir)
+    corpus.top_words(20, board="Gossiping", year=2020)
+    """
+
+    def __init__(self, corpus_dir):
+        self.corpus_dir = Path(corpus_dir)
+
+        with open(self.corpus_dir / META_FILENAME, "r") as f:
+            self.meta = json.load(f)
+
+        self.words = _read_lines(self.corpus_dir / "words.txt")
+        self.pos = _read_lines(self.corpus_dir / "pos.txt")
+        self.boards = _read_lines(self.corpus_dir / "boards.txt")
+        self._word_ids = None
+        self._post_ids = None
+
+        for name, info in self.meta["columns"].items():
+            if info["length"] == 0:
+                column = np.zeros(0, dtype=info["dtype"])
+            else:
+                column = np.memmap(self.corpus_dir / f"{name}.bin", dtype=info["dtype"], mode="r", shape=(info["length"],))
+            setattr(self, name, column)
+
+    @property
+    def n_posts(self):
+        return self.meta["n_posts"]
+
+    @property
+    def post_ids(self):
+        if self._post_ids is None:
+            self._post_ids = _read_lines(self.corpus_dir / "post_ids.txt")
+        return self._post_ids
+
+    def word_id(self, word):
+        if self._word_ids is None:
+            self._word_ids = {w: i for i, w in enumerate(self.words)}
+        return self._word_ids[word]
+
+    def post_mask(self, board=None, year=None):
+        """
+        輸出: 長度為文章數的 bool 陣列；board / year 可以是單一值或 list
+        """
+        mask = np.ones(self.n_posts, dtype=bool)
+
+        if board is not None:
+            boards = [board] if isinstance(board, str) else board
+            board_ids = [self.boards.index(b) for b in boards if b in self.boards]
+            mask &= np.isin(self.post_board, board_ids)
+
+        if year is not None:
+            years = [year] if isinstance(year, int) else year
+            mask &= np.isin(self.post_year, years)
+
+        return mask
+
+    def token_mask(self, board=None, year=None):
+        """
+        輸出: 長度為 token 數的 bool 陣列 (由 post_mask 依每篇的長度展開)
+        """
+        post_lengths = np.diff(self.post_offsets)
+        return np.repeat(self.post_mask(board=board, year=year), post_lengths)
+
+    def post_tokens(self, i):
+        """
+        第 i 篇文章: (詞 id 陣列, 詞性 id 陣列)
+        """
+        start, end = self.post_offsets[i], self.post_offsets[i + 1]
+        return self.tokens[start:end], self.token_pos[start:end]
+
+    def word_counts(self, board=None, year=None):
+        """
+        輸出: 長度為詞彙數的陣列，第 i 個為詞 i 出現的次數
+        """
+        tokens = self.tokens
+        if board is not None or year is not None:
+            tokens = tokens[self.token_mask(board=board, year=year)]
+        return np.bincount(tokens, minlength=len(self.words))
+
+    def word_pos_counts(self, board=None, year=None):
+        """
+        輸出: (詞 id 陣列, 詞性 id 陣列, 次數陣列)
+        """
+        tokens = self.tokens
+        token_pos = self.token_pos
+        if board is not None or year is not None:
+            mask = self.token_mask(board=board, year=year)
+            tokens = tokens[mask]
+            token_pos = token_pos[mask]
+
+        keys = tokens.astype(np.int64) * len(self.pos) + token_pos
+        keys, counts = np.unique(keys, return_counts=True)
+        return keys // len(self.pos), keys % len(self.pos), counts
+
+    def top_words(self, n=20, board=None, year=None):
+        """
+        輸出: list of (詞, 次數)，依次數排序
+        """
+        counts = self.word_counts(board=board, year=year)
+        top = np.argsort(counts)[::-1][:n]
+        return [(self.words[i], int(counts[i])) for i in top if counts[i] > 0]
+
+    def count_by_board_by_year(self):
+        """
+        輸出: dict {board: list of (year, 文章數)}，格式同 catalog.count_by_board_by_year()
+        """
+        keys = self.post_board.astype(np.int64) * 10000 + self.post_year
+        keys, counts = np.unique(keys, return_counts=True)
+
+        results = {}
+        for key, n in zip(keys, counts):
+            board, year = divmod(int(key), 10000)
+            results.setdefault(self.boards[board], []).append((year, int(n)))
+        return results
@@ -0,0 +1,173 @@
+import os
+import errno
+import shutil
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import parse_post_filename
+
+
+# 把一個板所有文章的 .vrt 合併成一個 (或數個) .vrt
+#
+# 原本 reduce_to_one_vrt 把每個 .vrt 讀成 Python 字串再寫出去，一次一個板。
+# 這裡用 os.copy_file_range / os.sendfile 讓 kernel 直接複製檔案內容，
+# 各個板同時處理，輸出依文章時間排序 (每次結果都一樣)，也可以限制每個輸出檔的大小。
+
+# 沒有 copy_file_range / sendfile 時，用一般複製的緩衝區大小
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+# 這些錯誤表示該系統呼叫不支援這組檔案，改用下一個方法
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def list_board_vrt_files(board_dir):
+    """
+    列出一個板所有文章的 .vrt，依 (timestamp, 檔名) 排序
+    輸出: list of (檔案路徑, 檔案大小)
+    """
+    files = []
+
+    with os.scandir(board_dir) as year_entries:
+        for year_entry in year_entries:
+            if not year_entry.is_dir():
+                continue
+
+            with os.scandir(year_entry.path) as file_entries:
+                for file_entry in file_entries:
+                    parsed = parse_post_filename(file_entry.name)
+                    if parsed is None or parsed[2] != "vrt":
+                        continue
+                    files.append((parsed[1], file_entry.name, file_entry.path, file_entry.stat().st_size))
+
+    files.sort()
+    return [(path, size) for _, _, path, size in files]
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def copy_into(dst_fd, src_path, size):
+    """
+    把 src_path 的內容接在 dst_fd 後面。
+    依序嘗試 copy_file_range、sendfile，都不支援的話才用一般的讀寫。
+    """
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        for method in (getattr(os, "copy_file_range", None) and _copy_file_range,
+                       getattr(os, "sendfile", None) and _sendfile):
+            if not method:
+                continue
+            try:
+                copied = method(src_fd, dst_fd, size)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                continue
+
+            if copied != size:
+                raise IOError(f"複製 {src_path} 不完整: {copied}/{size} bytes")
+            return
+
+        # 一般的讀寫
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        with os.fdopen(os.dup(src_fd), "rb") as src, os.fdopen(os.dup(dst_fd), "wb", closefd=True) as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    finally:
+        os.close(src_fd)
+
+
+def _shard_path(output_dir, board, shard_index, sharded):
+    if not sharded:
+        return Path(output_dir) / f"{board}.vrt"
+    return Path(output_dir) / f"{board}_{shard_index:04d}.vrt"
+
+
+def merge_board(board_dir, output_dir, shard_size=None):
+    """
+    把 board_dir 底下所有 .vrt 依時間順序接起來 (每個檔案後面加一個換行)，
+    輸出到 <output_dir>/<板名>.vrt。
+    有指定 shard_size (bytes) 的話，輸出會切成 <板名>_0000.vrt, <板名>_0001.vrt, ...，
+    每個不超過 shard_size (單一文章就超過的話自己一個檔)。
+
+    輸出: list of 輸出的檔案路徑
+    """
+    board = Path(board_dir).name
+    files = list_board_vrt_files(board_dir)
+    sharded = shard_size is not None
+
+    outputs = []
+    dst_fd = None
+    tmp_path = None
+    current_size = 0
+
+    def finish_shard():
+        os.close(dst_fd)
+        os.replace(tmp_path, outputs[-1])
+
+    try:
+        for path, size in files:
+            if dst_fd is None or (sharded and current_size > 0 and current_size + size + 1 > shard_size):
+                if dst_fd is not None:
+                    finish_shard()
+                outputs.append(_shard_path(output_dir, board, len(outputs), sharded))
+                tmp_path = outputs[-1].with_name(f"{outputs[-1].name}.tmp")
+                dst_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                current_size = 0
+
+            copy_into(dst_fd, path, size)
+            os.write(dst_fd, b"\n")
+            current_size += size + 1
+
+        if dst_fd is None:
+            # 沒有任何 .vrt，照原本的行為產生一個空檔
+            outputs.append(_shard_path(output_dir, board, 0, sharded))
+            tmp_path = outputs[-1].with_name(f"{outputs[-1].name}.tmp")
+            dst_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        finish_shard()
+        dst_fd = None
+
+    finally:
+        if dst_fd is not None:
+            os.close(dst_fd)
+            os.unlink(tmp_path)
+
+    logging.info("%s 版: 合併 %d 個 .vrt -> %d 個檔案", board, len(files), len(outputs))
+    return outputs
+
+
+def merge_corpus(data_dir, output_dir, board_name=None, shard_size=None, max_workers=None):
+    """
+    各個板同時合併 (複製是在 kernel 中進行的，用 thread 就夠了)
+
+    輸出: dict {板名: list of 輸出的檔案路徑}
+    """
+    data_dir = Path(data_dir)
+    if board_name is None:
+        board_dirs = [Path(entry.path) for entry in os.scandir(data_dir) if entry.is_dir()]
+    else:
+        board_dirs = [data_dir / board_name]
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda d: merge_board(d, output_dir, shard_size=shard_size), board_dirs)
+        return {board_dir.name: outputs for board_dir, outputs in zip(board_dirs, results)}
@@ -0,0 +1,371 @@
+import os
+import sys
+import math
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+from pathlib import Path
+
+import parallel
+from seg_batch import chunked
+
+
+# 監看資料夾，爬蟲寫進新的 .html 就馬上轉檔 (watch 指令)
+#
+# 原本爬完之後要重跑 html2json -d ... --use-mp，整棵樹重新 rglob，每個輸出都 is_file() 一次。
+# 這裡在 Linux 上用 inotify (透過 ctypes，不需要額外套件) 監看 data_dir 底下所有的資料夾：
+# - 檔案寫完關閉 (IN_CLOSE_WRITE) 或改名進來 (IN_MOVED_TO，例如 async_crawler 的暫存檔改名) 時排進佇列
+# - 新建的板 / 年份資料夾會自動加入監看
+# - 事件太多、kernel 的佇列滿了 (IN_Q_OVERFLOW) 時，改為掃描最近修改過的檔案補上
+# 沒有 inotify 時改用輪詢 (PollingWatcher)：只重新列出 mtime 有變的資料夾，
+# 檔案要連續兩次輪詢大小和 mtime 都不變才算寫完。
+#
+# 佇列中的檔案在 settle 秒內沒有任何新事件 (watcher.last_event，包括還在寫入中的檔案) 時，
+# 一起交給 parallel.TaskPool (和 html2corpus 相同的 worker) 處理；
+# 爬蟲持續寫入、一直沒有空檔時，佇列中最早的檔案等了 max_wait 秒也會送出。
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct("iIII")
+
+READ_SIZE = 64 * 1024
+
+# 佇列溢位時，掃描最近幾秒內修改過的檔案
+OVERFLOW_MARGIN = 60.0
+
+DEFAULT_POLL_INTERVAL = 2.0
+MTIME_SLACK_NS = 1_000_000_000
+DEFAULT_SETTLE = 0.5
+DEFAULT_MAX_WAIT = 10.0
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    return _libc is not None
+
+
+def _walk_files(root, suffix, since=None):
+    """
+    root 底下所有 suffix 結尾的檔案 (since: 只要 mtime 在這之後的)
+    """
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(suffix):
+                continue
+            path = Path(dirpath) / name
+            if since is not None:
+                try:
+                    if path.stat().st_mtime < since:
+                        continue
+                except OSError:
+                    continue
+            yield path
+
+
+class InotifyWatcher(object):
+    """
+    root: 要監看的資料夾 (包含底下所有的資料夾)
+    suffix: 只回報這個副檔名的檔案
+    """
+
+    def __init__(self, root, suffix=".html"):
+        if _libc is None:
+            raise OSError("這個系統不支援 inotify")
+
+        self.root = Path(root)
+        self.suffix = suffix
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_init1: {os.strerror(e)}")
+
+        # watch descriptor -> 資料夾
+        self.dirs = {}
+        self._last_poll = time.time()
+        # 最後一次收到任何事件的時間 (time.monotonic())
+        self.last_event = time.monotonic()
+        self._add_tree(self.root)
+
+    def _add_watch(self, path):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC:
+                logging.error("-- inotify 監看數已達上限 (fs.inotify.max_user_watches): %s", path)
+            else:
+                logging.warning("-- 無法監看 %s: %s", path, os.strerror(e))
+            return
+        self.dirs[wd] = Path(path)
+
+    def _add_tree(self, root):
+        """
+        監看 root 和底下所有的資料夾
+        輸出: 已經在裡面的檔案 (建立資料夾到開始監看之間寫入的)
+        """
+        found = []
+        for dirpath, _, filenames in os.walk(root):
+            self._add_watch(dirpath)
+            found.extend(Path(dirpath) / name for name in filenames if name.endswith(self.suffix))
+        return found
+
+    def _read_events(self):
+        data = b""
+        while True:
+            try:
+                chunk = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+    def poll(self, timeout):
+        """
+        最多等 timeout 秒
+        輸出: 新寫入 / 更新的檔案 list
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        poll_start = time.time()
+        self.last_event = time.monotonic()
+        paths = []
+        for wd, mask, name in self._read_events():
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("-- inotify 佇列溢位，掃描最近修改過的檔案")
+                paths.extend(_walk_files(self.root, self.suffix, since=self._last_poll - OVERFLOW_MARGIN))
+                continue
+
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+
+            directory = self.dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    paths.extend(self._add_tree(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and name.endswith(self.suffix):
+                paths.append(path)
+
+        self._last_poll = poll_start
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """
+    沒有 inotify 時的後備方案: 每 interval 秒檢查一次。
+    只重新列出 mtime 有變的資料夾 (有檔案新增或改名進來)，其中 mtime 比上次列出時新的檔案才算有變動，
+    所以原地改寫的舊檔案、或保留原本 mtime 複製進來的檔案不會被發現。
+    """
+
+    def __init__(self, root, suffix=".html", interval=DEFAULT_POLL_INTERVAL):
+        self.root = Path(root)
+        self.suffix = suffix
+        self.interval = interval
+
+        # 資料夾 -> (mtime_ns, 上次列出的時間 ns)
+        self.dirs = {}
+        # 已回報過的檔案 -> (mtime_ns, size)
+        self.files = {}
+        # 有變動、還在等它穩定下來的檔案 -> (mtime_ns, size)
+        self.changing = {}
+        # 最後一次發現有檔案變動的時間 (time.monotonic())
+        self.last_event = time.monotonic()
+
+        self._next_scan = 0.0
+        self._scan(initial=True)
+
+    def _scan(self, initial=False):
+        for dirpath, _, _ in os.walk(self.root):
+            scan_time = time.time_ns()
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+
+            previous = self.dirs.get(dirpath)
+            if previous is not None and previous[0] == mtime:
+                continue
+            self.dirs[dirpath] = (mtime, scan_time)
+            if initial:
+                continue
+
+            # 新的資料夾: 裡面的檔案都算；檔案系統的 mtime 精確度較低，多往前算一點
+            since = previous[1] - MTIME_SLACK_NS if previous is not None else 0
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(self.suffix) or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    if st.st_mtime_ns < since:
+                        continue
+                    path = Path(entry.path)
+                    key = (st.st_mtime_ns, st.st_size)
+                    if self.files.get(path) != key:
+                        self.changing[path] = key
+                        self.last_event = time.monotonic()
+
+    def _settled(self):
+        """
+        輸出: 和上次輪詢相比大小、mtime 都沒變的檔案
+        """
+        paths = []
+        for path, key in list(self.changing.items()):
+            try:
+                st = path.stat()
+            except OSError:
+                del self.changing[path]
+                continue
+
+            current = (st.st_mtime_ns, st.st_size)
+            if current == key:
+                del self.changing[path]
+                self.files[path] = current
+                paths.append(path)
+            else:
+                self.changing[path] = current
+                self.last_event = time.monotonic()
+        return paths
+
+    def poll(self, timeout):
+        wait = self._next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next_scan = time.monotonic() + self.interval
+
+        paths = self._settled()
+        self._scan()
+        return paths
+
+    def close(self):
+        pass
+
+
+def make_watcher(root, suffix=".html", polling=False, interval=DEFAULT_POLL_INTERVAL):
+    if not polling and inotify_available():
+        try:
+            return InotifyWatcher(root, suffix=suffix)
+        except OSError as e:
+            logging.warning("-- 無法使用 inotify (%s)，改用輪詢", e)
+    return PollingWatcher(root, suffix=suffix, interval=interval)
+
+
+def watch(data_dir, func, posts_per_batch=1, chunksize=16, settle=DEFAULT_SETTLE, use_mp=False,
+          processes=None, initializer=None, initargs=(), polling=False, poll_interval=DEFAULT_POLL_INTERVAL,
+          idle_exit=None, max_wait=DEFAULT_MAX_WAIT):
+    """
+    監看 data_dir，新的 .html 交給 func 處理，直到 Ctrl-C (或 idle_exit 秒沒有新檔案)
+
+    func: 處理一個 .html 的函數；posts_per_batch > 1 時則是處理一個 list of .html 的函數
+        (和 html2corpus 相同，例如 pipeline.html2corpus_wrapper / html2corpus_chunk_wrapper)
+    chunksize: 多進程時每次最多派給 worker 幾個工作 (新檔案少時會平均分給各個 worker)
+    settle: 等到幾秒沒有任何新事件才送出佇列中的檔案
+    max_wait: 佇列中最早的檔案最多等幾秒 (持續有新事件時也會送出)，None 表示不限制
+    其餘參數見 parallel.TaskPool
+
+    回傳: RunStats
+    """
+    watcher = make_watcher(data_dir, polling=polling, interval=poll_interval)
+    logging.info("監看 %s (%s)", data_dir, type(watcher).__name__)
+    print(f"監看 {data_dir} ({type(watcher).__name__})，Ctrl-C 結束")
+
+    stats = parallel.RunStats(desc="watch")
+    # 檔案 -> 排進佇列的時間，依第一次看到的順序排隊，同一個檔案只處理一次
+    queue = {}
+
+    try:
+        with parallel.TaskPool(func, stats, use_mp=use_mp, processes=processes,
+                               initializer=initializer, initargs=initargs) as pool:
+            try:
+                while True:
+                    timeout = settle
+                    if queue:
+                        # 等到 settle 或 max_wait 到期為止
+                        deadline = watcher.last_event + settle
+                        if max_wait is not None:
+                            deadline = min(deadline, next(iter(queue.values())) + max_wait)
+                        timeout = max(0.0, deadline - time.monotonic())
+
+                    paths = watcher.poll(timeout=timeout)
+                    now = time.monotonic()
+                    for path in paths:
+                        queue.setdefault(path, now)
+
+                    if queue:
+                        quiet = now - watcher.last_event >= settle
+                        overdue = max_wait is not None and now - next(iter(queue.values())) >= max_wait
+                        if quiet or overdue:
+                            batch = list(queue)
+                            queue.clear()
+                            _submit(pool, batch, posts_per_batch, chunksize)
+                    elif idle_exit is not None and now - watcher.last_event > idle_exit:
+                        break
+
+            except KeyboardInterrupt:
+                print(file=sys.stderr)
+                logging.info("收到 Ctrl-C，等待處理中的檔案完成")
+                if queue:
+                    _submit(pool, list(queue), posts_per_batch, chunksize)
+    finally:
+        watcher.close()
+
+    stats.finish()
+    return stats
+
+
+def _submit(pool, paths, posts_per_batch, chunksize):
+    logging.info("-- 新檔案 %d 個", len(paths))
+    stats = pool.stats
+    stats.total = (stats.total or 0) + len(paths)
+
+    items = list(chunked(paths, posts_per_batch)) if posts_per_batch > 1 else paths
+
+    # 新檔案不多時平均分給各個 worker，不要全部塞給同一個
+    size = max(1, min(chunksize, math.ceil(len(items) / pool.processes)))
+    for chunk in chunked(items, size):
+        pool.submit(chunk)
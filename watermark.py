@@ -0,0 +1,159 @@
+import os
+import json
+import fcntl
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import parse_post_filename
+
+
+# 每個板的爬蟲水位 (watermark)
+#
+# 存在 <data_dir>/<board>/.latest_post，內容為 {"timestamp": <int>, "post_id": <str>}，
+# 記錄本地端最新一篇文章。有新文章進來時就更新 (寫暫存檔再 os.replace，確保不會寫一半)，
+# 讓 dynamic_crawl 不必每次都列出最新年份資料夾裡的所有檔案。
+
+WATERMARK_FILENAME = ".latest_post"
+LOCK_FILENAME = ".latest_post.lock"
+
+
+def read_watermark(board_dir):
+    """
+    輸出: (timestamp, post_id)；沒有 watermark 檔或內容壞掉的話回傳 None
+    """
+    try:
+        with open(Path(board_dir) / WATERMARK_FILENAME, "r") as f:
+            d = json.load(f)
+        return int(d["timestamp"]), d["post_id"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_watermark(board_dir, timestamp, post_id):
+    path = Path(board_dir) / WATERMARK_FILENAME
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+    with open(tmp_path, "w") as f:
+        json.dump({"timestamp": timestamp, "post_id": post_id}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def update_watermark(board_dir, timestamp, post_id, force=False):
+    """
+    如果 (timestamp, post_id) 比目前的 watermark 新，就更新。
+    多個進程同時更新時，用 lock 檔確保不會把較新的值蓋掉。
+    force: 不管目前的 watermark，直接寫入 (重新掃描資料夾的結果)
+    回傳: 是否有更新
+    """
+    current = read_watermark(board_dir)
+    if not force and current is not None and current[0] >= timestamp:
+        return False
+
+    with open(Path(board_dir) / LOCK_FILENAME, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # 拿到 lock 後再確認一次
+            current = read_watermark(board_dir)
+            if not force and current is not None and current[0] >= timestamp:
+                return False
+            _write_watermark(board_dir, timestamp, post_id)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return True
+
+
+def observe(path):
+    """
+    新文章落地後呼叫 (path 的結構須為 <data_dir>/<board>/<year>/<檔名>)，
+    必要時推進該板的 watermark。
+    """
+    path = Path(path)
+    parsed = parse_post_filename(path.name)
+    if parsed is None:
+        return False
+
+    post_id, timestamp, _ = parsed
+    return update_watermark(path.parent.parent, timestamp, post_id)
+
+
+def scan_latest_post(board_dir):
+    """
+    沒有 watermark 時的後備方案：從最新的年份資料夾開始用 os.scandir 找最新的文章。
+    不是文章檔名格式的檔案會被略過；最新的年份資料夾是空的話就往前一年找。
+
+    輸出: (timestamp, post_id)；整個板都沒有文章的話回傳 None
+    """
+    with os.scandir(board_dir) as entries:
+        years = sorted(
+            (int(entry.name), entry.path)
+            for entry in entries
+            if entry.is_dir() and entry.name.isdigit()
+        )
+
+    for _, year_path in reversed(years):
+        latest = None
+        with os.scandir(year_path) as entries:
+            for entry in entries:
+                parsed = parse_post_filename(entry.name)
+                if parsed is None:
+                    continue
+                post_id, timestamp, _ = parsed
+                if latest is None or timestamp > latest[0]:
+                    latest = (timestamp, post_id)
+
+        if latest is not None:
+            return latest
+
+    return None
+
+
+def get_latest_post(data_dir, board_name, rescan=False):
+    """
+    找出 <data_dir>/<board_name> 中最新文章的 (timestamp, post_id)。
+    優先讀 watermark；沒有 (或 rescan=True) 才掃描資料夾，並把結果寫成 watermark
+    (rescan=True 時直接取代原本的 watermark，即使原本的比較新)。
+    """
+    data_dir = Path(data_dir)
+    board_dir = data_dir / board_name
+
+    if not data_dir.is_dir() or not board_dir.is_dir():
+        raise FileNotFoundError(f"找不到資料夾: {board_dir}")
+
+    if not rescan:
+        latest = read_watermark(board_dir)
+        if latest is not None:
+            return latest
+
+    logging.info("%s 版沒有 watermark，掃描資料夾", board_name)
+    latest = scan_latest_post(board_dir)
+    if latest is None:
+        raise FileNotFoundError(f"{board_dir} 中沒有任何文章")
+
+    update_watermark(board_dir, *latest, force=rescan)
+    return latest
+
+
+def get_all_latest_posts(data_dir, rescan=False, max_workers=None):
+    """
+    平行地找出 data_dir 底下每個板的最新文章。
+
+    輸出: dict {board: (timestamp, post_id)}；沒有任何文章的板不會出現在結果中
+    """
+    data_dir = Path(data_dir)
+    boards = [entry.name for entry in os.scandir(data_dir) if entry.is_dir()]
+
+    def _get(board):
+        try:
+            return board, get_latest_post(data_dir, board, rescan=rescan)
+        except FileNotFoundError as e:
+            logging.warning("-- %s", e)
+            return board, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_get, boards)
+
+    return {board: latest for board, latest in results if latest is not None}